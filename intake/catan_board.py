@@ -5,6 +5,8 @@
 This is intended to support the extraction of rich game states.
 The first use case is to give the location of the robber at each dice
 roll.
+For now, `game_state.py` only uses it for the initial position of the
+robber.
 
 The hexagonal board consists of 37 hexes, oriented such that hexes on the
 same horizontal line are separated by vertical edges.
@@ -0,0 +1,262 @@
+"""Run an intake step on many games of a corpus at once.
+
+Scripts like `reacquire_game.py` and `split_annotated.py` work on one
+game at a time. `run_batch` runs them on a list of games using a pool
+of worker processes, with:
+
+* error isolation: a game that fails is reported (with its traceback)
+  and the others carry on
+* a completion log (one JSON object per line, written as each game is
+  done), so that an interrupted batch can be run again and only do the
+  games that are not done yet
+* timings for each of the steps the script goes through
+
+The output of each game (including that of any subprocess it calls)
+goes to its own file in the log directory instead of the terminal.
+"""
+
+from __future__ import print_function
+
+from collections import namedtuple
+from contextlib import contextmanager
+import json
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+
+COMPLETION_LOG = 'completed.jsonl'
+
+
+class DocResult(namedtuple('DocResult',
+                           'doc status seconds timings error')):
+    """
+    What happened to a game in a batch
+
+    Parameters
+    ----------
+    doc : string
+    status : string
+        'ok' or 'error'
+    seconds : float
+        Total time spent on the game
+    timings : dict(string, float)
+        Time spent on each step (as reported by the script)
+    error : string or None
+        Traceback, if the game failed
+    """
+    pass
+
+
+class CompletionLog(object):
+    """
+    Record of the games a batch has processed so far.
+
+    Parameters
+    ----------
+    path : string
+        Log file (appended to)
+    params : dict
+        Parameters of the batch (eg. generation, steps); a game only
+        counts as done if it was done with the same parameters
+    """
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+
+    def done(self):
+        "games that have already been processed successfully"
+        res = set()
+        if not os.path.exists(self.path):
+            return res
+        with open(self.path) as stream:
+            for line in stream:
+                try:
+                    rec = json.loads(line)
+                except ValueError:  # eg. interrupted while writing
+                    continue
+                if rec.get('params') != self.params:
+                    continue
+                if rec['status'] == 'ok':
+                    res.add(rec['doc'])
+                else:
+                    res.discard(rec['doc'])
+        return res
+
+    def record(self, result):
+        "add a game to the log"
+        rec = dict(result._asdict())
+        rec['params'] = self.params
+        with open(self.path, 'a') as stream:
+            stream.write(json.dumps(rec, sort_keys=True) + '\n')
+
+
+@contextmanager
+def timed(timings, step):
+    """Add the time spent in the block to `timings[step]` (if
+    `timings` is not None)
+    """
+    start = time.time()
+    try:
+        yield
+    finally:
+        if timings is not None:
+            timings[step] = timings.get(step, 0.) + time.time() - start
+
+
+@contextmanager
+def _redirected(out_path):
+    """Send everything written on stdout and stderr (by us or by any
+    subprocess) to a file
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    saved = [os.dup(1), os.dup(2)]
+    with open(out_path, 'w') as out:
+        os.dup2(out.fileno(), 1)
+        os.dup2(out.fileno(), 2)
+        try:
+            yield
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os.dup2(saved[0], 1)
+            os.dup2(saved[1], 2)
+            for fd in saved:
+                os.close(fd)
+
+
+def run_doc(job):
+    """Process a single game (worker function).
+
+    Parameters
+    ----------
+    job : (function, string, tuple, dict, string)
+        Function to call, game name, positional and keyword arguments
+        for the function, file to write the output of the game to (None
+        to leave it on the terminal). The function is also passed a
+        `timings` dictionary to fill in.
+
+    Returns
+    -------
+    result : DocResult
+    """
+    func, doc, args, kwargs, out_path = job
+    cwd = os.getcwd()
+    timings = {}
+    start = time.time()
+    error = None
+    try:
+        if out_path is None:
+            func(*args, timings=timings, **kwargs)
+        else:
+            with _redirected(out_path):
+                func(*args, timings=timings, **kwargs)
+    except Exception:  # pylint: disable=broad-except
+        error = traceback.format_exc()
+    finally:
+        # some scripts move around
+        os.chdir(cwd)
+    return DocResult(doc=doc,
+                     status='ok' if error is None else 'error',
+                     seconds=time.time() - start,
+                     timings=timings,
+                     error=error)
+
+
+def timing_report(results):
+    """Summary of the time spent on each step, over the games that
+    went through ::
+
+        [DocResult] -> String
+    """
+    totals = {}
+    counts = {}
+    for res in results:
+        for step, secs in res.timings.items():
+            totals[step] = totals.get(step, 0.) + secs
+            counts[step] = counts.get(step, 0) + 1
+    lines = ['{:<12} {:>6} {:>10} {:>10}'.format('step', 'games',
+                                                 'total (s)', 'mean (s)')]
+    for step in sorted(totals, key=lambda k: -totals[k]):
+        lines.append('{:<12} {:>6} {:>10.1f} {:>10.1f}'.format(
+            step, counts[step], totals[step], totals[step] / counts[step]))
+    wall = sum(r.seconds for r in results)
+    lines.append('{:<12} {:>6} {:>10.1f}'.format('(games)', len(results),
+                                                 wall))
+    return '\n'.join(lines)
+
+
+def run_batch(func, docs, args_for, log_dir, params,
+              jobs=1, kwargs=None):
+    """Run a per-game function on many games, skipping those already
+    done (according to the completion log in `log_dir`).
+
+    Parameters
+    ----------
+    func : function
+        Function to call on each game; it must accept a `timings`
+        keyword argument (dict to fill in with the time spent on each
+        step)
+    docs : [string]
+        Games to process
+    args_for : function from string to tuple
+        Positional arguments to `func` for a game
+    log_dir : string
+        Where to keep the completion log and the output of each game
+    params : dict
+        Parameters of the batch, for the completion log
+    jobs : int
+        Number of games to process in parallel
+    kwargs : dict, optional
+        Keyword arguments to `func` (same for all games)
+
+    Returns
+    -------
+    results : [DocResult]
+        For the games processed in this run
+    """
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    log = CompletionLog(os.path.join(log_dir, COMPLETION_LOG), params)
+    done = log.done()
+    todo = [d for d in docs if d not in done]
+    print('{} games, {} already done, {} to do (output in {})'.format(
+        len(docs), len(docs) - len(todo), len(todo), log_dir),
+          file=sys.stderr)
+
+    tasks = [(func, doc, args_for(doc), kwargs or {},
+              os.path.join(log_dir, doc + '.out'))
+             for doc in todo]
+    results = []
+
+    def report(res):
+        "record a finished game"
+        log.record(res)
+        results.append(res)
+        print('[{}/{}] {}: {} ({:.1f}s)'.format(
+            len(results), len(tasks), res.doc, res.status, res.seconds),
+              file=sys.stderr)
+
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=min(jobs, len(tasks)))
+        try:
+            for res in pool.imap_unordered(run_doc, tasks):
+                report(res)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            report(run_doc(task))
+
+    failed = [r for r in results if r.status != 'ok']
+    if len(failed) < len(results):
+        print(timing_report([r for r in results if r.status == 'ok']),
+              file=sys.stderr)
+    for res in sorted(failed):
+        print('FAILED {} (see {}):\n{}'.format(
+            res.doc, os.path.join(log_dir, res.doc + '.out'), res.error),
+              file=sys.stderr)
+    return results
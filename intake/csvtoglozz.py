@@ -376,25 +376,119 @@ def utf8_csv_reader(utf8_data, **kwargs):
         yield [unicode(cell, 'utf-8') for cell in row]
 
 
-def save_output(basename, dialoguetext, root):
-    """Save output to a pair of files with a given name prefix.
+class TextBuffer(object):
+    """
+    The .ac text, as we build it up: a list of chunks and their total
+    length, so that appending to it does not copy what is already there
+    (and we can still ask for its length at any point, to compute the
+    spans of what we are about to add)
+    """
+    def __init__(self, text=u''):
+        self.chunks = []
+        self._len = 0
+        self.append(text)
 
-    The pair of files has extensions .ac (for text) and .aa (for
-    annotations).
+    def append(self, chunk):
+        "add some text at the end"
+        if chunk:
+            self.chunks.append(chunk)
+            self._len += len(chunk)
 
-    Parameters
-    ----------
-    basename : string
-        Basename for files.
-    dialoguetext : string
-        Text that supports the annotation.
-    root : xml.etree.Element
-        XML representation of the annotation on `dialoguetext`.
+    def __len__(self):
+        return self._len
+
+    def startswith(self, prefix):
+        "True if the text starts with the given string"
+        pos = 0
+        for chunk in self.chunks:
+            if pos >= len(prefix):
+                break
+            piece = prefix[pos:pos + len(chunk)]
+            if not chunk.startswith(piece):
+                return False
+            pos += len(piece)
+        return pos >= len(prefix)
+
+    def getvalue(self):
+        "the whole text as a single string"
+        return u''.join(self.chunks)
+
+
+def mk_annotations_root():
+    """
+    Root of the .aa file (annotations go directly under it)
     """
-    with codecs.open(basename+".ac", "w", "utf-8") as out:
-        out.write(dialoguetext)
-    with codecs.open(basename+".aa", "w", "ascii") as out:
-        out.write(prettify(root))
+    root = Element('annotations',
+                   # to remove, but here for diff compatibility for now
+                   {'version':'1.0', 'encoding':'UTF-8', 'standalone':'no'}
+                   )
+    root.append(Comment('Generated by csvtoglozz.py'))
+    return root
+
+
+class AnnotationWriter(object):
+    """
+    Write the .aa annotations to a stream as we go, instead of
+    building up the whole tree in memory and saving it at the end.
+
+    The annotations are appended (`append_unit`, etc) to `self.root`
+    as usual; each `flush` writes out whatever has been added to it
+    since the last one and drops it from the tree.
+
+    The output is exactly what `prettify` would have produced for the
+    whole tree: we run it on a tree with just the units to write, and
+    cut them out from the (fixed) text around them.
+    """
+    _PLACEHOLDERS = ('placeholder1', 'placeholder2')
+
+    def __init__(self, stream, batch_size=50):
+        self.stream = stream
+        self.batch_size = batch_size
+        self.root = mk_annotations_root()
+        self._shell = mk_annotations_root()
+        self._started = False
+        # prettify(root with two children) = head + child1 + sep +
+        # child2 + tail (children as rendered in place, without any
+        # surrounding indentation or line breaks)
+        for name in self._PLACEHOLDERS:
+            SubElement(self._shell, name)
+        rendered = prettify(self._shell)
+        del self._shell[1:]
+        first, second = ['<{}/>'.format(x) for x in self._PLACEHOLDERS]
+        start1 = rendered.index(first)
+        start2 = rendered.index(second)
+        self._head = rendered[:start1]
+        self._sep = rendered[start1 + len(first):start2]
+        self._tail = rendered[start2 + len(second):]
+
+    def flush(self, force=True):
+        """write out (and forget) the annotations added so far
+
+        Unless `force` is set, we wait until we have at least
+        `batch_size` of them (writing them out a few at a time
+        costs more)
+        """
+        elms = list(self.root)[1:]
+        if not elms or (not force and len(elms) < self.batch_size):
+            return
+        del self.root[1:]
+        # prettify(root with children 1..n) = head + child1 + sep +
+        # ... + sep + childn + tail
+        self._shell.extend(elms)
+        rendered = prettify(self._shell)
+        del self._shell[1:]
+        self.stream.write(self._sep if self._started else self._head)
+        self.stream.write(rendered[len(self._head):
+                                   len(rendered) - len(self._tail)])
+        self._started = True
+
+    def close(self):
+        "write out the remaining annotations and the end of the file"
+        self.flush()
+        if self._started:
+            self.stream.write(self._tail)
+        else:
+            self.stream.write(prettify(self._shell))
 
 
 # ---------------------------------------------------------------------
@@ -404,13 +498,13 @@ def save_output(basename, dialoguetext, root):
 
 def process_turn(root, dialoguetext, turn, is_player):
     """
-    Process a single turn and append any resulting annotations to the
-    root element.
+    Process a single turn, adding its text to the dialogue text
+    (a TextBuffer) and any resulting annotations to the root element.
 
     Return the augmented text
     """
     prefix = " : ".join([turn.number, turn.emitter, ""])
-    dialoguetext += prefix
+    dialoguetext.append(prefix)
     if is_player:
         # split on '&'
         # NEW except if it is escaped (preceded by '\'); then delete the
@@ -433,10 +527,10 @@ def process_turn(root, dialoguetext, turn, is_player):
     seg_spans = edu_spans(dialoguetext, turn_segments)
 
     # .ac buffer
-    dialoguetext += turn_text + " "
+    dialoguetext.append(turn_text + " ")
     # .aa typographic annotations
 
-    if dialoguetext.index(turn_text) != 0:
+    if not dialoguetext.startswith(turn_text):
         typstart = (len(dialoguetext) -
                     len(turn_text) -
                     len(prefix) -
@@ -453,26 +547,26 @@ def process_turn(root, dialoguetext, turn, is_player):
     return dialoguetext
 
 
-def process_turns(turns, gen):
+def process_turns(turns, gen, annotations):
     """
-    Process a list of Turns and return a pair of:
-
-    * text
-    * standoff annotations (an XML element)
+    Process a list of Turns, writing out the standoff annotations as
+    we go, and return the text
 
     Parameters
     ----------
     turns :
     gen : int
         Generation for which to generate turns from the soclog.
-    """
-    root = Element('annotations',
-                   # to remove, but here for diff compatibility for now
-                   {'version':'1.0', 'encoding':'UTF-8', 'standalone':'no'}
-                   )
-    root.append(Comment('Generated by csvtoglozz.py'))
+    annotations : AnnotationWriter
+        Where to write the annotations (we do not close it)
 
-    dialoguetext = " "  # for the .ac file
+    Returns
+    -------
+    dialoguetext : TextBuffer
+        Text for the .ac file
+    """
+    root = annotations.root
+    dialoguetext = TextBuffer(" ")  # for the .ac file
     prev_dialogue = None
     i_old = 0
 
@@ -481,6 +575,8 @@ def process_turns(turns, gen):
                             turn.rawtext)]
 
     for i, turn in enumerate(turns):
+        # write out the annotations for the previous turns
+        annotations.flush(force=False)
         # right boundary of dialogue
         if gen < 3:
             # ling versions of the corpus
@@ -630,8 +726,9 @@ def process_turns(turns, gen):
         span = Span(left=prev_dialogue.right if prev_dialogue else 0,
                     right=len(dialoguetext))
         append_dialogue(root, None, span)
+    annotations.flush()
 
-    return dialoguetext, root
+    return dialoguetext
 
 
 def parse_args():
@@ -658,9 +755,14 @@ def main():
         csvreader = utf8_csv_reader(incsvfile, delimiter='\t')
         csvreader.next()  # skip header row
         turns = list(read_rows(list(csvreader)))
-        txt, xml = process_turns(turns, args.gen)
 
-    save_output(filename.split(".")[0], txt, xml)
+    basename = filename.split(".")[0]
+    with codecs.open(basename + ".aa", "w", "ascii") as out:
+        annotations = AnnotationWriter(out)
+        txt = process_turns(turns, args.gen, annotations)
+        annotations.close()
+    with codecs.open(basename + ".ac", "w", "utf-8") as out:
+        out.writelines(txt.chunks)
 
 
 if __name__ == '__main__':
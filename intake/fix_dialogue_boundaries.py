@@ -10,7 +10,6 @@ from __future__ import print_function
 
 import argparse
 import copy
-from functools import reduce
 import itertools
 import os
 
@@ -96,10 +95,14 @@ def _fix_dialogue_boundaries(tcache, doc_ling, doc_situ):
     # list of turns in _situ
     # NB: we don't need indices in the list of turns from _ling anymore
     # hence it is safe to overwrite dlgs_ling_ti_{beg,end}
+    # (index of the first turn with each identifier)
+    situ_tid2ti = {}
+    for i, tid in enumerate(turns_situ_tid):
+        situ_tid2ti.setdefault(tid, i)
     dlgs_ling_ti_beg = np.array(
-        [list(turns_situ_tid).index(x) for x in dlgs_ling_tid_beg])
+        [situ_tid2ti[x] for x in dlgs_ling_tid_beg])
     dlgs_ling_ti_end = np.array(
-        [list(turns_situ_tid).index(x) for x in dlgs_ling_tid_end])
+        [situ_tid2ti[x] for x in dlgs_ling_tid_end])
     # print('game turns (turn_idx)', zip(gturn_idc_beg, gturn_idc_end))
     # print('core dlgs (turn_idx)', zip(dlgs_ling_ti_beg, dlgs_ling_ti_end))
     # * align the beginning (resp. end) indices of game turns and _ling
@@ -134,8 +137,7 @@ def _fix_dialogue_boundaries(tcache, doc_ling, doc_situ):
     # they will be replaced with (hopefully) clean ones
     dlgs_situ = sorted((x for x in doc_situ.units if is_dialogue(x)),
                        key=lambda x: x.span)
-    for dlg_situ in dlgs_situ:
-        doc_situ.units.remove(dlg_situ)
+    doc_situ.units[:] = [x for x in doc_situ.units if not is_dialogue(x)]
 
     # create one dialogue for each class of dialogues
     for k, g in itertools.groupby(enumerate(dlg2grp),
@@ -164,11 +166,9 @@ def _fix_dialogue_boundaries(tcache, doc_ling, doc_situ):
 
     # create a new dialogue for each unmatched (non-overlapping) game
     # turn
-    gturns_matched = reduce(np.union1d,
-                            (np.arange(x_beg, x_end + 1)
-                             for x_beg, x_end
-                             in zip(dlg2gturn_beg, dlg2gturn_end)))
-    gturns_matched = set(gturns_matched)
+    gturns_matched = set(i for x_beg, x_end
+                         in zip(dlg2gturn_beg, dlg2gturn_end)
+                         for i in range(x_beg, x_end + 1))
     for i, (gturn_idx_beg, gturn_idx_end) in enumerate(zip(
             gturn_idc_beg, gturn_idc_end)):
         if i not in gturns_matched:
@@ -0,0 +1,503 @@
+"""Replay the game events of a soclog into compact game states.
+
+`soclogtocsv.py` only knows about the state of the game through the
+resources and buildups that the soclog prints along with each chat
+message, which it reparses from text every time. This module replays
+the game events themselves (`SOCPlayerElement`, `SOCPutPiece`,
+`SOCMoveRobber`...) so that one can ask for the state of the game at
+any game turn (or line) of the soclog:
+
+    replay = GameReplay.from_soclog(soclog_path)
+    state = replay.state_at(10)  # start of the 11th game turn
+    state.resources_of(2), state.robber, state.scores()
+
+A `GameState` is a handful of flat integer arrays (resources and
+knights per player, owner and piece on each node and edge of the
+board), so it is cheap to copy. The soclog is parsed once into a list
+of small event tuples, and `GameReplay` keeps a copy of the state every
+few game turns: the state at any point is then the nearest snapshot
+plus the events since.
+
+Game turns are numbered from 0, one per `SOCTurn` line, as in the
+`turns` of a soclog index (see `soclog_index.py`).
+
+The server logs each message once per recipient, so some events appear
+several times in a soclog. Placing a piece or moving the robber twice
+is harmless, but resources need a bit of care:
+
+* gains and losses of "unknown" resources are the copies sent to the
+  players who do not get to see the actual resources (which are also
+  logged): we ignore them
+* a robbery is logged twice (once for the thief, once for the victim)
+  with the actual resource: we skip the second copy
+"""
+
+from __future__ import print_function
+
+import argparse
+from array import array
+from bisect import bisect_right
+import codecs
+import re
+
+from catan_board import CatanBoard
+
+MAX_PLAYERS = 4
+# number of game turns between two snapshots
+SNAPSHOT_EVERY = 8
+
+# resources, in the order of SOCPlayerElement element types 1 to 5
+RESOURCES = ('clay', 'ore', 'sheep', 'wheat', 'wood')
+NUM_RESOURCES = len(RESOURCES)
+# SOCPlayerElement element types (besides resources)
+_UNKNOWN_ELT = 6
+_NUMKNIGHTS_ELT = 15
+# SOCPlayerElement action types
+SET = 100
+GAIN = 101
+LOSE = 102
+
+# SOCPutPiece piece types
+ROAD = 0
+SETTLEMENT = 1
+CITY = 2
+# victory points for each piece on a node
+_PIECE_VP = {SETTLEMENT: 1, CITY: 2}
+# nodes and edges have one-byte (hexadecimal) coordinates
+_NUM_COORDS = 0x100
+
+# events: tuples whose first element is one of these
+EV_TURN = 0  # (EV_TURN, plnb)
+EV_DICE = 1  # (EV_DICE, total)
+EV_RESOURCE = 2  # (EV_RESOURCE, plnb, action, resource, value)
+EV_KNIGHTS = 3  # (EV_KNIGHTS, plnb, action, value)
+EV_PIECE = 4  # (EV_PIECE, plnb, piece, coord)
+EV_ROBBER = 5  # (EV_ROBBER, coord)
+EV_LONGEST_ROAD = 6  # (EV_LONGEST_ROAD, plnb)
+EV_LARGEST_ARMY = 7  # (EV_LARGEST_ARMY, plnb)
+EV_GAME_STATS = 8  # (EV_GAME_STATS, scores)
+
+
+class GameState(object):
+    """
+    State of the game at some point of the soclog.
+
+    Attributes
+    ----------
+    resources : array of int
+        Resources of each player, `RESOURCES` order, player by player
+        (use `resources_of`)
+    knights : array of int
+        Number of knights played by each player
+    node_owner, node_piece : array of int
+        Player number (-1 if none) and piece (`SETTLEMENT` or `CITY`)
+        on each node, by coordinate
+    edge_owner : array of int
+        Player number (-1 if none) of the road on each edge
+    robber : int or None
+        Coordinate of the hex the robber is on
+    dice : int or None
+        Latest dice roll
+    player : int or None
+        Player whose turn it is
+    longest_road, largest_army : int
+        Player holding it (-1 if none)
+    final_scores : tuple of int or None
+        Scores announced at the end of the game (these include the
+        victory point cards, that `scores` cannot see)
+    """
+    __slots__ = ('resources', 'knights', 'node_owner', 'node_piece',
+                 'edge_owner', 'vp', 'robber', 'dice', 'player',
+                 'longest_road', 'largest_army', 'final_scores')
+
+    def __init__(self, robber=None):
+        self.resources = array('i', [0] * (MAX_PLAYERS * NUM_RESOURCES))
+        self.knights = array('i', [0] * MAX_PLAYERS)
+        self.node_owner = array('b', [-1] * _NUM_COORDS)
+        self.node_piece = array('b', [0] * _NUM_COORDS)
+        self.edge_owner = array('b', [-1] * _NUM_COORDS)
+        # victory points from settlements and cities, kept up to date
+        # as they are placed
+        self.vp = array('i', [0] * MAX_PLAYERS)
+        self.robber = robber
+        self.dice = None
+        self.player = None
+        self.longest_road = -1
+        self.largest_army = -1
+        self.final_scores = None
+
+    def copy(self):
+        "independent copy of this state"
+        res = GameState.__new__(GameState)
+        for slot in GameState.__slots__:
+            value = getattr(self, slot)
+            if isinstance(value, array):
+                value = value[:]
+            setattr(res, slot, value)
+        return res
+
+    def apply(self, event):
+        "update the state with an event (see `parse_soclog`)"
+        kind = event[0]
+        if kind == EV_RESOURCE:
+            _, plnb, action, rsrc, value = event
+            idx = plnb * NUM_RESOURCES + rsrc
+            if action == SET:
+                self.resources[idx] = value
+            elif action == GAIN:
+                self.resources[idx] += value
+            elif action == LOSE:
+                self.resources[idx] -= value
+        elif kind == EV_PIECE:
+            _, plnb, piece, coord = event
+            if piece == ROAD:
+                self.edge_owner[coord] = plnb
+                return
+            old_owner = self.node_owner[coord]
+            if old_owner != -1:
+                self.vp[old_owner] -= _PIECE_VP[self.node_piece[coord]]
+            self.node_owner[coord] = plnb
+            self.node_piece[coord] = piece
+            self.vp[plnb] += _PIECE_VP[piece]
+        elif kind == EV_TURN:
+            self.player = event[1]
+        elif kind == EV_DICE:
+            self.dice = event[1]
+        elif kind == EV_ROBBER:
+            self.robber = event[1]
+        elif kind == EV_KNIGHTS:
+            _, plnb, action, value = event
+            if action == SET:
+                self.knights[plnb] = value
+            elif action == GAIN:
+                self.knights[plnb] += value
+            elif action == LOSE:
+                self.knights[plnb] -= value
+        elif kind == EV_LONGEST_ROAD:
+            self.longest_road = event[1]
+        elif kind == EV_LARGEST_ARMY:
+            self.largest_army = event[1]
+        elif kind == EV_GAME_STATS:
+            self.final_scores = event[1]
+        else:
+            raise ValueError('Unknown event {}'.format(event))
+
+    def resources_of(self, plnb):
+        "resources of a player, as a dictionary"
+        start = plnb * NUM_RESOURCES
+        return dict(zip(RESOURCES,
+                        self.resources[start:start + NUM_RESOURCES]))
+
+    def settlements(self, plnb):
+        "coordinates of the settlements of a player"
+        return [c for c in range(_NUM_COORDS)
+                if self.node_owner[c] == plnb and
+                self.node_piece[c] == SETTLEMENT]
+
+    def cities(self, plnb):
+        "coordinates of the cities of a player"
+        return [c for c in range(_NUM_COORDS)
+                if self.node_owner[c] == plnb and
+                self.node_piece[c] == CITY]
+
+    def roads(self, plnb):
+        "coordinates of the roads of a player"
+        return [c for c in range(_NUM_COORDS)
+                if self.edge_owner[c] == plnb]
+
+    def score(self, plnb):
+        """Public victory points of a player: buildings, longest road
+        and largest army (not the victory point cards)
+        """
+        return (self.vp[plnb] +
+                (2 if self.longest_road == plnb else 0) +
+                (2 if self.largest_army == plnb else 0))
+
+    def scores(self):
+        "public victory points of each player"
+        return [self.score(plnb) for plnb in range(MAX_PLAYERS)]
+
+
+# ---------------------------------------------------------------------
+# parsing
+# ---------------------------------------------------------------------
+
+_PLAYER_ELEMENT = re.compile(r'\|playerNum=(?P<plnb>-?[0-9]+)\|'
+                             r'actionType=(?P<action>[0-9]+)\|'
+                             r'elementType=(?P<elt>[0-9]+)\|'
+                             r'value=(?P<value>-?[0-9]+)')
+_PUT_PIECE = re.compile(r'\|playerNumber=(?P<plnb>[0-9]+)\|'
+                        r'pieceType=(?P<piece>[0-9]+)\|'
+                        r'coord=(?P<coord>[0-9a-fA-F]+)')
+_MOVE_ROBBER = re.compile(r'\|playerNumber=-?[0-9]+\|'
+                          r'coord=(?P<coord>[0-9a-fA-F]+)')
+_PLAYER_NUMBER = re.compile(r'\|playerNumber=(?P<plnb>-?[0-9]+)')
+_DICE_RESULT = re.compile(r'\|param=(?P<dice>-?[0-9]+)')
+_GAME_STATS = re.compile(r'\|(?P<scores>-?[0-9]+(\|-?[0-9]+)+)\|'
+                         r'(true|false)')
+_SIT_DOWN = re.compile(r'\|nickname=(?P<name>[^|]+)\|'
+                       r'playerNumber=(?P<plnb>[0-9]+)')
+
+
+def _on_player_element(rest):
+    "resources and knights"
+    match = _PLAYER_ELEMENT.search(rest)
+    if match is None:
+        return None
+    plnb = int(match.group('plnb'))
+    action = int(match.group('action'))
+    elt = int(match.group('elt'))
+    value = int(match.group('value'))
+    if 1 <= elt <= NUM_RESOURCES:
+        return (EV_RESOURCE, plnb, action, elt - 1, value)
+    if elt == _NUMKNIGHTS_ELT:
+        return (EV_KNIGHTS, plnb, action, value)
+    if elt == _UNKNOWN_ELT:
+        # copies for the players who cannot see the actual resources
+        return None
+    # pieces left...
+    return None
+
+
+def _on_put_piece(rest):
+    "roads, settlements and cities"
+    match = _PUT_PIECE.search(rest)
+    if match is None:
+        return None
+    return (EV_PIECE, int(match.group('plnb')), int(match.group('piece')),
+            int(match.group('coord'), 16))
+
+
+def _on_move_robber(rest):
+    "robber"
+    match = _MOVE_ROBBER.search(rest)
+    if match is None:
+        return None
+    return (EV_ROBBER, int(match.group('coord'), 16))
+
+
+def _on_turn(rest):
+    "start of a game turn"
+    match = _PLAYER_NUMBER.search(rest)
+    if match is None:
+        return None
+    return (EV_TURN, int(match.group('plnb')))
+
+
+def _on_dice_result(rest):
+    "dice roll"
+    match = _DICE_RESULT.search(rest)
+    if match is None:
+        return None
+    return (EV_DICE, int(match.group('dice')))
+
+
+def _on_longest_road(rest):
+    "longest road changes hands"
+    match = _PLAYER_NUMBER.search(rest)
+    if match is None:
+        return None
+    return (EV_LONGEST_ROAD, int(match.group('plnb')))
+
+
+def _on_largest_army(rest):
+    "largest army changes hands"
+    match = _PLAYER_NUMBER.search(rest)
+    if match is None:
+        return None
+    return (EV_LARGEST_ARMY, int(match.group('plnb')))
+
+
+def _on_game_stats(rest):
+    "final scores"
+    match = _GAME_STATS.search(rest)
+    if match is None:
+        return None
+    return (EV_GAME_STATS,
+            tuple(int(x) for x in match.group('scores').split('|')))
+
+
+# SOC message type -> function from the rest of the line to an event
+# (or None)
+_EVENT_PARSERS = {
+    'SOCPlayerElement': _on_player_element,
+    'SOCPutPiece': _on_put_piece,
+    'SOCMoveRobber': _on_move_robber,
+    'SOCTurn': _on_turn,
+    'SOCDiceResult': _on_dice_result,
+    'SOCLongestRoad': _on_longest_road,
+    'SOCLargestArmy': _on_largest_army,
+    'SOCGameStats': _on_game_stats,
+}
+
+
+def _is_robbery(gain, lose):
+    "True if two resource events are the two halves of a robbery"
+    return (gain[0] == EV_RESOURCE and lose[0] == EV_RESOURCE and
+            gain[2] == GAIN and lose[2] == LOSE and
+            gain[1] != lose[1] and gain[3:] == lose[3:])
+
+
+def parse_soclog(lines):
+    """Game events in the lines of a soclog (see module docstring) ::
+
+        [String] -> (Either None CatanBoard, Dict Int String,
+                     [(Int, Event)])
+
+    Returns the board, the name of each player (by number), and the
+    events with the (0-based) number of the line they come from
+    """
+    board = None
+    players = {}
+    events = []
+    for lineno, line in enumerate(lines):
+        # <timestamp>:+<utc offset>:<SOC message type>:<rest>
+        _, _, rest = line.partition(':+')
+        fields = rest.split(':', 2)
+        if len(fields) < 3:
+            continue
+        msg_type = fields[1]
+        parse_event = _EVENT_PARSERS.get(msg_type)
+        if parse_event is not None:
+            event = parse_event(fields[2])
+            if event is None:
+                continue
+            if (len(events) >= 3 and _is_robbery(events[-1][1], event) and
+                    events[-3][1] == events[-1][1] and
+                    events[-2][1] == event):
+                # second copy of a robbery: drop it altogether
+                events.pop()
+                continue
+            events.append((lineno, event))
+        elif msg_type == 'SOCBoardLayout':
+            board = CatanBoard.from_soclog_line(line)
+        elif msg_type == 'SOCSitDown':
+            match = _SIT_DOWN.search(fields[2])
+            if match and match.group('name') != 'dummy':
+                players[int(match.group('plnb'))] = match.group('name')
+    return board, players, events
+
+
+class GameReplay(object):
+    """
+    Events of a game, with snapshots of the game state every few
+    game turns, for quick access to the state at any point.
+
+    Parameters
+    ----------
+    board : CatanBoard or None
+        Board layout (for the initial position of the robber)
+    players : dict(int, string)
+        Name of each player, by player number
+    events : [(int, event)]
+        Game events, with the number of the line they come from
+        (see `parse_soclog`)
+    snapshot_every : int
+        Number of game turns between two snapshots
+
+    Attributes
+    ----------
+    turns : [(int, int)]
+        Line of the soclog and player number of each game turn
+    final : GameState
+        State at the end of the soclog
+    """
+    def __init__(self, board, players, events,
+                 snapshot_every=SNAPSHOT_EVERY):
+        self.board = board
+        self.players = players
+        self._events = [ev for _, ev in events]
+        self._event_lines = array('i', [lineno for lineno, _ in events])
+        robber = None
+        if board is not None:
+            robber = int(board.robber_hex, 16)
+        state = GameState(robber=robber)
+        # snapshots[i]: state after the first snapshot_pos[i] events
+        self._snapshot_pos = [0]
+        self._snapshots = [state.copy()]
+        self.turns = []
+        self._turn_lines = array('i')
+        for pos, (lineno, event) in enumerate(events):
+            state.apply(event)
+            if event[0] != EV_TURN:
+                continue
+            self.turns.append((lineno, event[1]))
+            self._turn_lines.append(lineno)
+            if (len(self.turns) - 1) % snapshot_every == 0:
+                self._snapshot_pos.append(pos + 1)
+                self._snapshots.append(state.copy())
+        self.final = state
+
+    @classmethod
+    def from_soclog(cls, soclog_path, snapshot_every=SNAPSHOT_EVERY):
+        "replay the game in a soclog file"
+        with codecs.open(soclog_path, 'r', 'utf-8') as soclog:
+            board, players, events = parse_soclog(soclog)
+        return cls(board, players, events, snapshot_every=snapshot_every)
+
+    def __len__(self):
+        "number of game turns"
+        return len(self.turns)
+
+    def _state_after(self, pos):
+        "state after the first `pos` events"
+        i = bisect_right(self._snapshot_pos, pos) - 1
+        state = self._snapshots[i].copy()
+        for event in self._events[self._snapshot_pos[i]:pos]:
+            state.apply(event)
+        return state
+
+    def state_at_line(self, lineno):
+        """State of the game once the soclog has been read up to
+        (and including) a line (0-based) ::
+
+            Int -> GameState
+        """
+        return self._state_after(bisect_right(self._event_lines, lineno))
+
+    def state_at(self, turn):
+        """State of the game at the start of a game turn (once its
+        `SOCTurn` line has been read) ::
+
+            Int -> GameState
+        """
+        return self.state_at_line(self.turns[turn][0])
+
+    def turn_at_line(self, lineno):
+        """Game turn a line (0-based) of the soclog belongs to (-1 for
+        the lines before the first game turn) ::
+
+            Int -> Int
+        """
+        return bisect_right(self._turn_lines, lineno) - 1
+
+
+def main():
+    """
+    Print the state of the game at each game turn of a soclog
+    """
+    psr = argparse.ArgumentParser(description='replay the game events '
+                                  'of a soclog')
+    psr.add_argument('soclog', metavar='FILE')
+    psr.add_argument('--turn', metavar='N', type=int, action='append',
+                     help='only show these game turns')
+    args = psr.parse_args()
+
+    replay = GameReplay.from_soclog(args.soclog)
+    turns = args.turn or range(len(replay))
+    for turn in turns:
+        state = replay.state_at(turn)
+        print('turn {} ({}): robber {}, scores {}'.format(
+            turn, replay.players.get(state.player, state.player),
+            hex(state.robber) if state.robber is not None else None,
+            state.scores()))
+        for plnb, name in sorted(replay.players.items()):
+            rsrc = state.resources_of(plnb)
+            print('  {}: {}'.format(name, ' '.join(
+                '{}={}'.format(r, rsrc[r]) for r in RESOURCES)))
+    if replay.final.final_scores is not None:
+        print('final scores: {}'.format(replay.final.final_scores))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,586 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Run the intake chain on a whole corpus, redoing only what is out of
+date (a bit like `make`).
+
+Each step of the intake (see `INTAKE_STEPS`) declares the files and
+folders of a game it reads and writes, relative to the game folder.
+The order of the steps follows from these: a step that reads what
+another one writes comes after it. For each game, we record in
+`.intake-state.json` (in the game folder) a digest (SHA-1) of the
+inputs of each step, as they were after it last ran. A step is run
+again if it never ran, if any of its inputs changed since, if one of
+its outputs is missing, or if its parameters (eg. `--gen`) changed.
+A step whose inputs are missing (eg. a game that has not been
+annotated yet has no `annotated` folder) is skipped. The first time we
+see a game, the outputs already there are taken to be up to date (use
+`--force` to redo them).
+
+Games are independent, so we process them in parallel (`--jobs`),
+with the output of each game going to its own file in the log
+directory.
+
+Some files are edited by hand, so a few steps are more careful than
+`make` would be:
+
+* `presegment` only runs if there is no segmented file yet: once
+  there is one, it is left alone even if the unsegmented file changes
+  (the sanity check of `intake-2.sh` will tell if they disagree)
+* `glozz` (ie. `intake-2.sh`) waits for the segmented file to be
+  corrected by hand: it does not run on a segmented file as
+  `presegment` left it (which would give unannotated files from the
+  automatic segmentation), unless we are told that the segmentation
+  needs no correction (`--segmented-ready`)
+* `glozz` also refuses to run if it would delete annotations from the
+  `units` or `discourse` folders
+* `nonling` (`nonling_annotations.py`, only with `--nonling`) modifies
+  its inputs in place; it runs again whenever they change, eg. when
+  `split` rewrites them, so do not use it on a version that is still
+  being edited by hand
+
+`fix_dialogue_boundaries.py` and `reacquire_game.py` are not part of
+the chain: they work across two corpora (linguistic and situated, old
+and re-acquired) rather than on the games of one corpus.
+"""
+
+from __future__ import print_function
+
+import argparse
+from collections import namedtuple
+import codecs
+from glob import glob
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+
+from corpus_batch import (run_doc, timed, timing_report)
+from nonling_annotations import annotate_game
+from soclogtocsv import (soclog_to_turns, write_turns)
+from soclogtocsv_batch import read_mapping
+from split_annotated import split_annotated
+
+PATH_TO_INTAKE = os.path.dirname(os.path.abspath(__file__))
+PATH_TO_CODE = os.path.dirname(PATH_TO_INTAKE)
+
+STATE_FILE = '.intake-state.json'
+STATE_VERSION = 1
+
+
+# ---------------------------------------------------------------------
+# steps
+# ---------------------------------------------------------------------
+
+class Step(namedtuple('Step',
+                      'name inputs outputs params once manual action')):
+    """
+    A step of the intake
+
+    Parameters
+    ----------
+    name : string
+    inputs : [string]
+        Files or folders read by the step, relative to the game folder
+        (with `{game}` for the name of the game, and `{metal}` for the
+        version given to `--nonling`)
+    outputs : [string]
+        Files or folders written by the step (likewise)
+    params : [string]
+        Parameters the output depends on
+    once : bool
+        If True, the step only runs if one of its outputs is missing
+    manual : [string]
+        Inputs that another step generates for the annotators to
+        correct by hand: we wait for them to be changed before running
+        this step (unless the `segmented_ready` parameter is set)
+    action : function
+        What to do, given the game folder, the name of the game and the
+        parameters (dict)
+    """
+    pass
+
+
+def _soclogtocsv(game_dir, game, params):
+    "soclog to unsegmented CSV"
+    soclogs = glob(os.path.join(game_dir, 'soclog', '*.soclog'))
+    if len(soclogs) != 1:
+        raise ValueError('Expected one soclog in {}, found {}'.format(
+            os.path.join(game_dir, 'soclog'), len(soclogs)))
+    out_dir = os.path.join(game_dir, 'unsegmented')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    with codecs.open(soclogs[0], 'r', 'utf-8') as soclog:
+        turns = soclog_to_turns(soclog, sel_gen=params['gen'])
+        with open(os.path.join(out_dir, game + '.soclog.csv'),
+                  'wb') as output:
+            write_turns(turns, output)
+
+
+def _create_aam(game_dir, game, params):
+    "Glozz annotation model for the game (players)"
+    subprocess.check_call([
+        sys.executable, os.path.join(PATH_TO_INTAKE, 'create-glozz-aam.py'),
+        os.path.join(game_dir, 'unsegmented', game + '.soclog.csv'),
+        os.path.join(game_dir, game + '.aam'),
+        '--gen', str(params['gen'])])
+
+
+def _presegment(game_dir, game, _):
+    "automatic segmentation, for the annotators to correct"
+    out_dir = os.path.join(game_dir, 'segmented')
+    if not os.path.isdir(out_dir):
+        os.makedirs(out_dir)
+    subprocess.check_call([
+        sys.executable,
+        os.path.join(PATH_TO_CODE, 'segmentation', 'simple-segments'),
+        '--csv',
+        os.path.join(game_dir, 'unsegmented', game + '.soclog.csv'),
+        os.path.join(out_dir, game + '.soclog.seg.csv')])
+
+
+def _has_annotations(game_dir):
+    "True if there are files in the units or discourse folders"
+    for subdir in ['units', 'discourse']:
+        for _, _, fnames in os.walk(os.path.join(game_dir, subdir)):
+            if fnames:
+                return True
+    return False
+
+
+def _intake2(game_dir, game, params):
+    "segmented CSV to unannotated Glozz files (intake-2.sh)"
+    if _has_annotations(game_dir):
+        raise ValueError('intake-2.sh would delete the units and discourse '
+                         'folders of {}; run it by hand if you really '
+                         'mean to'.format(game_dir))
+    # intake-2 writes its files into the current working directory
+    subprocess.check_call([os.path.join(PATH_TO_INTAKE, 'intake-2.sh'),
+                           os.path.join('segmented',
+                                        game + '.soclog.seg.csv'),
+                           str(params['gen'])],
+                          cwd=game_dir)
+
+
+def _split(game_dir, game, _):
+    "annotated Glozz files to units and discourse (BRONZE)"
+    split_annotated(os.path.dirname(game_dir), game)
+
+
+def _nonling(game_dir, _, params):
+    "annotations on non-linguistic events"
+    annotate_game(game_dir, params['metal'])
+
+
+INTAKE_STEPS = [
+    Step('soclogtocsv',
+         inputs=['soclog'],
+         outputs=['unsegmented/{game}.soclog.csv'],
+         params=['gen'], once=False, manual=[], action=_soclogtocsv),
+    Step('aam',
+         inputs=['unsegmented/{game}.soclog.csv'],
+         outputs=['{game}.aam'],
+         params=['gen'], once=False, manual=[], action=_create_aam),
+    Step('presegment',
+         inputs=['unsegmented/{game}.soclog.csv'],
+         outputs=['segmented/{game}.soclog.seg.csv'],
+         params=[], once=True, manual=[], action=_presegment),
+    Step('glozz',
+         inputs=['unsegmented/{game}.soclog.csv',
+                 'segmented/{game}.soclog.seg.csv'],
+         outputs=['unannotated'],
+         params=['gen'], once=False,
+         manual=['segmented/{game}.soclog.seg.csv'], action=_intake2),
+    Step('split',
+         inputs=['annotated', 'unannotated'],
+         outputs=['units/BRONZE', 'discourse/BRONZE'],
+         params=[], once=False, manual=[], action=_split),
+    Step('nonling',
+         inputs=['unannotated', 'units/{metal}', 'discourse/{metal}'],
+         outputs=['units/{metal}', 'discourse/{metal}'],
+         params=['metal'], once=False, manual=[], action=_nonling),
+]
+
+
+def _paths(templates, game, params):
+    "fill in the path templates of a step"
+    return [x.format(game=game, **params) for x in templates]
+
+
+def schedule(steps, params):
+    """Steps in dependency order ::
+
+        ([Step], Dict) -> [Step]
+
+    A step depends on the (other) steps that write one of its inputs.
+    The order is that of `steps` whenever the dependencies allow it.
+    """
+    outputs = dict((s.name, set(_paths(s.outputs, 'GAME', params)))
+                   for s in steps)
+    deps = dict((s.name,
+                 set(o.name for o in steps
+                     if o.name != s.name and
+                     outputs[o.name] & set(_paths(s.inputs, 'GAME',
+                                                  params))))
+                for s in steps)
+    res = []
+    done = set()
+    while len(res) < len(steps):
+        ready = [s for s in steps
+                 if s.name not in done and deps[s.name] <= done]
+        if not ready:
+            raise ValueError('Cycle in the intake steps: {}'.format(
+                ', '.join(s.name for s in steps if s.name not in done)))
+        res.append(ready[0])
+        done.add(ready[0].name)
+    return res
+
+
+# ---------------------------------------------------------------------
+# digests and state
+# ---------------------------------------------------------------------
+
+def _file_digest(path, stamps):
+    """SHA-1 of a file, reusing the one in `stamps` if the size and
+    modification time of the file are the same
+    """
+    stat = os.stat(path)
+    stamp = [stat.st_size, stat.st_mtime]
+    cached = stamps.get(path)
+    if cached is not None and cached[:2] == stamp:
+        return cached[2]
+    sha = hashlib.sha1()
+    with open(path, 'rb') as stream:
+        for chunk in iter(lambda: stream.read(1 << 16), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    stamps[path] = stamp + [digest]
+    return digest
+
+
+def digest(path, stamps):
+    """Digest of a file, or of all the files in a folder (None if there
+    is no such file or folder)
+
+    Parameters
+    ----------
+    path : string
+    stamps : dict
+        Cache of file digests, by path (updated)
+    """
+    if os.path.isfile(path):
+        return _file_digest(path, stamps)
+    if not os.path.isdir(path):
+        return None
+    sha = hashlib.sha1()
+    for dirpath, dirnames, fnames in os.walk(path):
+        dirnames.sort()
+        for fname in sorted(fnames):
+            fpath = os.path.join(dirpath, fname)
+            if not os.path.isfile(fpath):  # eg. broken symlink
+                continue
+            sha.update(os.path.relpath(fpath, path).encode('utf-8'))
+            sha.update(_file_digest(fpath, stamps).encode('ascii'))
+    return sha.hexdigest()
+
+
+def load_state(game_dir):
+    """What we know of the game from previous runs (empty if nothing or
+    from another version of this script)
+    """
+    path = os.path.join(game_dir, STATE_FILE)
+    state = None
+    if os.path.exists(path):
+        with open(path) as istream:
+            state = json.load(istream)
+    if state is None or state.get('version') != STATE_VERSION:
+        state = {'version': STATE_VERSION, 'steps': {}, 'stamps': {}}
+    # digests of the files to be corrected by hand, as generated
+    state.setdefault('generated', {})
+    return state
+
+
+def save_state(game_dir, state):
+    """Write what we know of the game (atomically)"""
+    path = os.path.join(game_dir, STATE_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as ostream:
+        json.dump(state, ostream, indent=1, sort_keys=True)
+    os.rename(tmp_path, path)
+
+
+# ---------------------------------------------------------------------
+# running
+# ---------------------------------------------------------------------
+
+def _step_status(step, game_dir, game, params, state, force, written,
+                 dry_run):
+    """What to do about a step ::
+
+        ... -> (String, Dict String String)
+
+    Returns 'run', 'skip' (missing inputs), 'wait' (inputs still to
+    be corrected by hand), 'adopt' (outputs already there, but the step
+    never ran) or 'ok' (up to date), along with the digests of the
+    inputs. `written` are the outputs of the steps that ran (or would
+    have, in a dry run) before this one.
+    """
+    stamps = state['stamps']
+    inputs = dict((p, digest(os.path.join(game_dir, p), stamps))
+                  for p in _paths(step.inputs, game, params))
+    if any(d is None and p not in written for p, d in inputs.items()):
+        return 'skip', inputs
+    if _unedited(step, game, params, state, inputs, written):
+        return 'wait', inputs
+    outputs = _paths(step.outputs, game, params)
+    missing = [p for p in outputs
+               if not os.path.exists(os.path.join(game_dir, p))]
+    if step.name in force or missing:
+        return 'run', inputs
+    if step.once:
+        return 'ok', inputs
+    record = state['steps'].get(step.name)
+    if written & set(inputs) and (dry_run or record is None):
+        # in a dry run, we cannot tell if the inputs will change
+        return 'run', inputs
+    if record is None:
+        return 'adopt', inputs
+    step_params = dict((k, params[k]) for k in step.params)
+    if record['params'] != step_params or record['inputs'] != inputs:
+        return 'run', inputs
+    return 'ok', inputs
+
+
+def _unedited(step, game, params, state, inputs, written):
+    """The inputs of a step that should have been corrected by hand but
+    are still as generated (or are about to be generated)
+    """
+    if params.get('segmented_ready'):
+        return []
+    generated = state['generated']
+    return [p for p in _paths(step.manual, game, params)
+            if p in written or generated.get(p) == inputs[p]]
+
+
+def _record(step, game_dir, inputs, params, state):
+    "remember the inputs of a step as they are now"
+    stamps = state['stamps']
+    state['steps'][step.name] = {
+        'params': dict((k, params[k]) for k in step.params),
+        'inputs': dict((p, digest(os.path.join(game_dir, p), stamps))
+                       for p in inputs),
+    }
+
+
+def run_game(game_dir, steps, params, force=(), dry_run=False,
+             timings=None):
+    """Run the out of date steps for a game.
+
+    Parameters
+    ----------
+    game_dir : string
+        Folder of the game
+    steps : [Step]
+        Steps of the intake, in dependency order (see `schedule`)
+    params : dict
+        Parameters of the steps
+    force : collection of string
+        Steps to run even if they are up to date
+    dry_run : boolean
+        Only print what would be done
+    timings : dict(string, float), optional
+        If given, the time spent on each step that was run is added to
+        it
+
+    Returns
+    -------
+    ran : [string]
+        Steps that were run (or would have been)
+    """
+    game_dir = os.path.abspath(game_dir)
+    game = os.path.basename(game_dir)
+    state = load_state(game_dir)
+    manual = set(p for s in steps for p in _paths(s.manual, game, params))
+    ran = []
+    written = set()
+    for step in steps:
+        status, inputs = _step_status(step, game_dir, game, params,
+                                      state, force, written, dry_run)
+        if status == 'skip':
+            missing = [p for p, d in sorted(inputs.items())
+                       if d is None and p not in written]
+            print('{}: skip {} (no {})'.format(game, step.name,
+                                               ', '.join(missing)))
+            continue
+        if status == 'wait':
+            print('{}: wait {} (correct {} by hand first, or use '
+                  '--segmented-ready)'.format(
+                      game, step.name,
+                      ', '.join(_unedited(step, game, params, state,
+                                          inputs, written))))
+            continue
+        if status == 'ok':
+            continue
+        if status == 'adopt':
+            if not dry_run:
+                _record(step, game_dir, inputs, params, state)
+            continue
+        print('{}: {}'.format(game, step.name))
+        ran.append(step.name)
+        written.update(_paths(step.outputs, game, params))
+        if dry_run:
+            continue
+        # if the step fails, its outputs must not be adopted next time
+        state['steps'][step.name] = {'params': None, 'inputs': None}
+        save_state(game_dir, state)
+        with timed(timings, step.name):
+            step.action(game_dir, game, params)
+        for path in manual.intersection(_paths(step.outputs, game, params)):
+            state['generated'][path] = digest(os.path.join(game_dir, path),
+                                              state['stamps'])
+        # the inputs as we leave them: some steps modify them
+        _record(step, game_dir, inputs, params, state)
+        save_state(game_dir, state)
+    if not dry_run:
+        # forget about files that are gone
+        state['stamps'] = dict((p, s) for p, s in state['stamps'].items()
+                               if os.path.exists(p))
+        save_state(game_dir, state)
+    return ran
+
+
+def import_soclogs(corpus_dir, pairs):
+    """Copy new (or changed) soclogs into the soclog folder of their
+    game, creating it if need be
+
+    Parameters
+    ----------
+    corpus_dir : string
+    pairs : [(string, string)]
+        Name of the game and path to its soclog (see `read_mapping`)
+    """
+    stamps = {}
+    for game, soclog_path in pairs:
+        soclog_dir = os.path.join(corpus_dir, game, 'soclog')
+        if not os.path.isdir(soclog_dir):
+            os.makedirs(soclog_dir)
+        dest = os.path.join(soclog_dir, os.path.basename(soclog_path))
+        if digest(dest, stamps) != digest(soclog_path, stamps):
+            shutil.copy2(soclog_path, dest)
+
+
+def corpus_games(corpus_dir):
+    """Games of a corpus: folders with a soclog, segmented or unannotated
+    folder
+    """
+    return sorted(d for d in os.listdir(corpus_dir)
+                  if any(os.path.isdir(os.path.join(corpus_dir, d, x))
+                         for x in ['soclog', 'segmented', 'unannotated']))
+
+
+def main():
+    """
+    Run the intake on a corpus
+    """
+    psr = argparse.ArgumentParser(description='run the out of date intake '
+                                  'steps on the games of a corpus')
+    psr.add_argument('corpus', metavar='DIR',
+                     help='folder of the corpus (one folder per game)')
+    psr.add_argument('game', metavar='GAME', nargs='*',
+                     help='games to process (default: all)')
+    psr.add_argument('--mapping', metavar='FILE',
+                     help=('copy new soclogs into the corpus first '
+                           '(clean-name,soclog per line, as for '
+                           'intake-1-batch.sh: relative soclog paths '
+                           'are relative to the current directory)'))
+    psr.add_argument('--gen', metavar='N', type=int, default=3,
+                     help='generation of turns to include (1, 2, 3)')
+    psr.add_argument('--nonling', metavar='METAL',
+                     help=('also add the annotations on non-linguistic '
+                           'events to this version (eg. BRONZE)'))
+    psr.add_argument('--segmented-ready', action='store_true',
+                     help=('run intake-2 even on segmented files that '
+                           'have not been corrected by hand since '
+                           'presegmentation'))
+    psr.add_argument('--force', metavar='STEP', action='append',
+                     default=[],
+                     choices=[s.name for s in INTAKE_STEPS],
+                     help='run this step even if it is up to date')
+    psr.add_argument('--dry-run', '-n', action='store_true',
+                     help='only show what would be done')
+    psr.add_argument('--jobs', '-j', metavar='N', type=int,
+                     default=multiprocessing.cpu_count(),
+                     help='number of games to process in parallel')
+    psr.add_argument('--log-dir', metavar='DIR',
+                     default='intake_pipeline.logs',
+                     help='where to write the output of each game')
+    args = psr.parse_args()
+
+    corpus_dir = os.path.abspath(args.corpus)
+    if args.mapping:
+        pairs = read_mapping(args.mapping)
+        if not args.dry_run:
+            import_soclogs(corpus_dir, pairs)
+    games = args.game or corpus_games(corpus_dir)
+    if not games:
+        sys.exit('No games in ' + corpus_dir)
+
+    params = {'gen': args.gen, 'metal': args.nonling,
+              'segmented_ready': args.segmented_ready}
+    steps = [s for s in INTAKE_STEPS
+             if args.nonling or s.name != 'nonling']
+    steps = schedule(steps, params)
+
+    if args.dry_run:
+        for game in games:
+            run_game(os.path.join(corpus_dir, game), steps, params,
+                     force=args.force, dry_run=True)
+        return
+
+    log_dir = os.path.abspath(args.log_dir)
+    if not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    tasks = [(run_game, game,
+              (os.path.join(corpus_dir, game), steps, params),
+              {'force': args.force},
+              os.path.join(log_dir, game + '.out'))
+             for game in games]
+    results = []
+
+    def report(res):
+        "print a finished game"
+        results.append(res)
+        print('[{}/{}] {}: {} ({})'.format(
+            len(results), len(tasks), res.doc, res.status,
+            ', '.join(sorted(res.timings)) or 'up to date'),
+              file=sys.stderr)
+
+    if args.jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=min(args.jobs, len(tasks)))
+        try:
+            for res in pool.imap_unordered(run_doc, tasks):
+                report(res)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            report(run_doc(task))
+
+    failed = [r for r in results if r.status != 'ok']
+    done = [r for r in results if r.status == 'ok' and r.timings]
+    if done:
+        print(timing_report(done), file=sys.stderr)
+    for res in sorted(failed):
+        print('FAILED {} (see {}):\n{}'.format(
+            res.doc, os.path.join(log_dir, res.doc + '.out'), res.error),
+              file=sys.stderr)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
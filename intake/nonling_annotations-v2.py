@@ -39,6 +39,45 @@ from educe.stac.util.prettifyxml import prettify
 
 
 
+# ---------------------------------------------------------------------
+# Server messages
+# ---------------------------------------------------------------------
+
+# for units annotations
+UNITS_OFFER_PROG = re.compile(r'(.+) made an offer to trade (\d+) (clay|ore|sheep|wheat|wood) for (\d+) (clay|ore|sheep|wheat|wood)\.')
+#OfferRegEx = re.compile(r'(.+) made an offer to trade (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))*\.')
+#TODO this new regex for offer works for discourse annotations
+#but for units, how do we fetch the data ???
+UNITS_TRADE_PROG = re.compile(r'(.+) traded (\d+) (clay|ore|sheep|wheat|wood) for (\d+) (clay|ore|sheep|wheat|wood) from (.+)\.')
+#TradeRegEx = re.compile(r'(.+) traded (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* from (.+)\.')
+#TODO same as offers : it is complicated to fetch the data properly...
+
+# for discourse annotations
+JOIN_PROG = re.compile(r'(.+) joined the game\.')
+SIT_DOWN_PROG = re.compile(r'(.+) sat down at seat (\d)\.')
+
+DICE_PROG = re.compile(r'(.+) rolled a (\d) and a (\d)\.')
+GET_PROG = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood)\.')
+GET2_PROG = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood), (\d+) (clay|ore|sheep|wheat|wood)\.')
+NO_GET_PROG = re.compile(r'No player gets anything\.')
+
+SOLDIER_PROG = re.compile(r'(.+) played a Soldier card\.')
+DISCARD1_PROG = re.compile(r'(.+) needs to discard\.')
+DISCARD2_PROG = re.compile(r'(.+) discarded (\d+) resources\.')
+ROBBER1_PROG = re.compile(r'(.+) will move the robber\.')
+ROBBER2_PROG = re.compile(r'(.+) moved the robber\.')
+ROBBER3_PROG = re.compile(r'(.+) moved the robber, must choose a victim\.')
+STOLE_PROG = re.compile(r'(.+) stole a resource from (.+)')
+
+OFFER_PROG = re.compile(r'(.+) made an offer to trade (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))*( from the bank or a port)?\.')
+
+CANT_PROG = re.compile(r"You can't make that trade\.")
+TRADE_PROG = re.compile(r'(.+) traded (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* from (.+)\.')
+REJECT_PROG = re.compile(r'(.+) rejected trade offer\.')
+CARD_PROG = re.compile(r'(.+) played a Monopoly card\.')
+MONOPOLY_PROG = re.compile(r'(.+) monopolized (clay|ore|sheep|wheat|wood)\.')
+
+
 # ---------------------------------------------------------------------
 # "Units" annotations
 # ---------------------------------------------------------------------
@@ -61,20 +100,6 @@ def add_units_annotations(doc):
         modified XML tree with units annotations for non-linguistical event
     """
 
-    OfferRegEx = re.compile(r'(.+) made an offer to trade (\d+) (clay|ore|sheep|wheat|wood) for (\d+) (clay|ore|sheep|wheat|wood)\.')
-    #OfferRegEx = re.compile(r'(.+) made an offer to trade (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))*\.')
-    #TODO this new regex for offer works for discourse annotations
-    #but for units, how do we fetch the data ???
-    TradeRegEx = re.compile(r'(.+) traded (\d+) (clay|ore|sheep|wheat|wood) for (\d+) (clay|ore|sheep|wheat|wood) from (.+)\.')
-    #TradeRegEx = re.compile(r'(.+) traded (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* from (.+)\.')
-    #TODO same as offers : it is complicated to fetch the data properly...
-    RejectRegEx = re.compile(r'(.+) rejected trade offer\.')
-
-    GetRegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood)\.')
-    Get2RegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood), (\d+) (clay|ore|sheep|wheat|wood)\.')
-
-    MonopolyRegEx = re.compile(r'(.+) monopolized (clay|ore|sheep|wheat|wood)\.')
-
     NewPartialUnits = []
 
     for anno in doc.units:
@@ -83,8 +108,8 @@ def add_units_annotations(doc):
             end = anno.span.char_end
             event = doc.text(anno.text_span())
 
-            if OfferRegEx.search(event) != None: #<X> made an offer to trade <M> <R1> for <N> <R2>.
-                mo = OfferRegEx.search(event)
+            if UNITS_OFFER_PROG.search(event) != None: #<X> made an offer to trade <M> <R1> for <N> <R2>.
+                mo = UNITS_OFFER_PROG.search(event)
                 X = mo.group(1)
                 M = mo.group(2)
                 R1 = mo.group(3)
@@ -113,8 +138,8 @@ def add_units_annotations(doc):
                 continue
 
 
-            elif TradeRegEx.search(event) != None: #<X> traded <M> <R1> for <N> <R2> from <Y>.
-                mo = TradeRegEx.search(event)
+            elif UNITS_TRADE_PROG.search(event) != None: #<X> traded <M> <R1> for <N> <R2> from <Y>.
+                mo = UNITS_TRADE_PROG.search(event)
                 X = mo.group(1)
                 M = mo.group(2)
                 R1 = mo.group(3)
@@ -153,8 +178,8 @@ def add_units_annotations(doc):
                 continue
 
 
-            elif RejectRegEx.search(event) != None: #<Y> rejected trade offer.
-                mo = RejectRegEx.search(event)
+            elif REJECT_PROG.search(event) != None: #<Y> rejected trade offer.
+                mo = REJECT_PROG.search(event)
                 Y = mo.group(1)
 
                 anno.type = 'Reject'
@@ -163,8 +188,8 @@ def add_units_annotations(doc):
                 continue
 
 
-            elif GetRegEx.search(event) != None: #<Y> gets <N> <R>.
-                mo = GetRegEx.search(event)
+            elif GET_PROG.search(event) != None: #<Y> gets <N> <R>.
+                mo = GET_PROG.search(event)
                 Y = mo.group(1)
                 N = mo.group(2)
                 R = mo.group(3)
@@ -182,8 +207,8 @@ def add_units_annotations(doc):
                 NewPartialUnits.append(Res)
                 continue
 
-            elif Get2RegEx.search(event) != None: #<Y> gets <N1> <R1>, <N2> <R2>.
-                mo = Get2RegEx.search(event)
+            elif GET2_PROG.search(event) != None: #<Y> gets <N1> <R1>, <N2> <R2>.
+                mo = GET2_PROG.search(event)
                 Y = mo.group(1)
                 N1 = mo.group(2)
                 R1 = mo.group(3)
@@ -212,8 +237,8 @@ def add_units_annotations(doc):
                 continue
 
 
-            elif MonopolyRegEx.search(event) != None: #<X> monopolized <R>.
-                mo = MonopolyRegEx.search(event)
+            elif MONOPOLY_PROG.search(event) != None: #<X> monopolized <R>.
+                mo = MONOPOLY_PROG.search(event)
                 X = mo.group(1)
                 R = mo.group(2)
 
@@ -363,31 +388,6 @@ def add_discourse_annotations(doc):
     MonopolyEvent = ""
 
 
-    JoinRegEx = re.compile(r'(.+) joined the game\.')
-    SitDownRegEx = re.compile(r'(.+) sat down at seat (\d)\.')
-
-    DiceRegEx = re.compile(r'(.+) rolled a (\d) and a (\d)\.')
-    GetRegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood)\.')
-    Get2RegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood), (\d+) (clay|ore|sheep|wheat|wood)\.')
-    NoGetRegEx = re.compile(r'No player gets anything\.')
-
-    SoldierRegEx = re.compile(r'(.+) played a Soldier card\.')
-    Discard1RegEx = re.compile(r'(.+) needs to discard\.')
-    Discard2RegEx = re.compile(r'(.+) discarded (\d+) resources\.')
-    Robber1RegEx = re.compile(r'(.+) will move the robber\.')
-    Robber2RegEx = re.compile(r'(.+) moved the robber\.')
-    Robber3RegEx = re.compile(r'(.+) moved the robber, must choose a victim\.')
-    StoleRegEx = re.compile(r'(.+) stole a resource from (.+)')
-
-    OfferRegEx = re.compile(r'(.+) made an offer to trade (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))*( from the bank or a port)?\.')
-
-    CantRegEx = re.compile(r"You can't make that trade\.")
-    TradeRegEx = re.compile(r'(.+) traded (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* for (\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))* from (.+)\.')
-    RejectRegEx = re.compile(r'(.+) rejected trade offer\.')
-    CardRegEx = re.compile(r'(.+) played a Monopoly card\.')
-    MonopolyRegEx = re.compile(r'(.+) monopolized (clay|ore|sheep|wheat|wood)\.')
-
-
     NewPartialRelations = []
 
     for anno in doc.units:
@@ -398,14 +398,14 @@ def add_discourse_annotations(doc):
 
             # Join / sit down events
 
-            if JoinRegEx.search(event) != None: #<X> joined the game.
-                mo = JoinRegEx.search(event)
+            if JOIN_PROG.search(event) != None: #<X> joined the game.
+                mo = JOIN_PROG.search(event)
                 X = mo.group(1)
                 JoinEvents[X] = anno._anno_id
                 continue
 
-            elif SitDownRegEx.search(event) != None: #<X> sat down at seat <N>.
-                mo = SitDownRegEx.search(event)
+            elif SIT_DOWN_PROG.search(event) != None: #<X> sat down at seat <N>.
+                mo = SIT_DOWN_PROG.search(event)
                 X = mo.group(1)
                 rspan = ANNO.RelSpan(JoinEvents[X], anno._anno_id)
                 #rel = ANNO.Relation(rel_id, rspan, 'Sequence', features, metadata)
@@ -430,8 +430,8 @@ def add_discourse_annotations(doc):
 
             # Resource distribution events
 
-            elif DiceRegEx.search(event) != None: #<X> rolled a <M1> and a <M2>.
-                mo = DiceRegEx.search(event)
+            elif DICE_PROG.search(event) != None: #<X> rolled a <M1> and a <M2>.
+                mo = DICE_PROG.search(event)
                 M1 = int(mo.group(2))
                 M2 = int(mo.group(3))
                 if M1 + M2 != 7: # Resource distribution event
@@ -460,15 +460,15 @@ def add_discourse_annotations(doc):
                     RobberEvent.append(anno._anno_id)
                 continue
 
-            elif GetRegEx.search(event) != None: #<Y> gets <N> <R>.
+            elif GET_PROG.search(event) != None: #<Y> gets <N> <R>.
                 DiceEvent.append(anno._anno_id)
                 continue
 
-            elif Get2RegEx.search(event) != None: #<Y> gets <N1> <R1>, <N2> <R2>.
+            elif GET2_PROG.search(event) != None: #<Y> gets <N1> <R1>, <N2> <R2>.
                 DiceEvent.append(anno._anno_id)
                 continue
 
-            elif NoGetRegEx.search(event) != None: #No player gets anything.
+            elif NO_GET_PROG.search(event) != None: #No player gets anything.
                 rspan = ANNO.RelSpan(DiceEvent[0], anno._anno_id)
                 #rel = ANNO.Relation(rel_id, rspan, 'Result', features, metadata)
                 rel = PartialRelation(rspan, 'Result')
@@ -478,25 +478,25 @@ def add_discourse_annotations(doc):
 
             # Robber events
 
-            elif SoldierRegEx.search(event) != None: #<X> played a Soldier card.
+            elif SOLDIER_PROG.search(event) != None: #<X> played a Soldier card.
                 if RobberEvent != []:
                     raise Exception("add_discourse_annotations : la liste RobberEvent n'a pas été vidée!")
                 RobberEvent.append(anno._anno_id)
                 continue
 
-            elif Discard1RegEx.search(event) != None: #<Y> needs to discard.
+            elif DISCARD1_PROG.search(event) != None: #<Y> needs to discard.
                 RobberEvent.append(anno._anno_id)
                 continue
 
-            elif Discard2RegEx.search(event) != None: #<Y> discarded <N> resources.
+            elif DISCARD2_PROG.search(event) != None: #<Y> discarded <N> resources.
                 RobberEvent.append(anno._anno_id)
                 continue
 
-            elif Robber1RegEx.search(event) != None: #<X> will move the robber.
+            elif ROBBER1_PROG.search(event) != None: #<X> will move the robber.
                 RobberEvent.append(anno._anno_id)
                 continue
 
-            elif Robber2RegEx.search(event) != None: #<X> moved the robber.
+            elif ROBBER2_PROG.search(event) != None: #<X> moved the robber.
                 RobberEvent.append(anno._anno_id)
                 #cdu = ANNO.Schema(rel_id, RobberEvent[1:], relations, schemas, 'Complex_discourse_unit', features, metadata)
                 #rspan = ANNO.RelSpan(RobberEvent[0], cdu._anno_id)
@@ -511,11 +511,11 @@ def add_discourse_annotations(doc):
                 RobberEvent[:] = []
                 continue
 
-            elif Robber3RegEx.search(event) != None: #<X> moved the robber, must choose a victim.
+            elif ROBBER3_PROG.search(event) != None: #<X> moved the robber, must choose a victim.
                 RobberEvent.append(anno._anno_id)
                 continue
 
-            elif StoleRegEx.search(event) != None: #<X> stole a resource from <Z>.
+            elif STOLE_PROG.search(event) != None: #<X> stole a resource from <Z>.
                 RobberEvent.append(anno._anno_id)
                 #cdu = ANNO.Schema(rel_id, RobberEvent[1:], relations, schemas, 'Complex_discourse_unit', features, metadata)
                 #rspan = ANNO.RelSpan(RobberEvent[0], cdu._anno_id)
@@ -530,25 +530,25 @@ def add_discourse_annotations(doc):
             # Trade events
             # HYPOTHESIS : only one offer can be made at a time (not sure if true, needs in/confirmation)
 
-            elif OfferRegEx.search(event) != None: #<X> made an offer to trade <M> <R1> for <N> <R2>.
+            elif OFFER_PROG.search(event) != None: #<X> made an offer to trade <M> <R1> for <N> <R2>.
                 TradeEvent = anno._anno_id
                 continue
 
-            elif CantRegEx.search(event) != None: #You can't make that trade.
+            elif CANT_PROG.search(event) != None: #You can't make that trade.
                 rspan = ANNO.RelSpan(TradeEvent, anno._anno_id)
                 #rel = ANNO.Relation(rel_id, rspan, 'Question-answer_pair', features, metadata)
                 rel = PartialRelation(rspan, 'Question-answer_pair')
                 NewPartialRelations.append(rel)
                 continue
 
-            elif TradeRegEx.search(event) != None: #<X> traded <M> <R1> for <N> <R2> from <Y>.
+            elif TRADE_PROG.search(event) != None: #<X> traded <M> <R1> for <N> <R2> from <Y>.
                 rspan = ANNO.RelSpan(TradeEvent, anno._anno_id)
                 #rel = ANNO.Relation(rel_id, rspan, 'Question-answer_pair', features, metadata)
                 rel = PartialRelation(rspan, 'Question-answer_pair')
                 NewPartialRelations.append(rel)
                 continue
 
-            elif RejectRegEx.search(event) != None: #<Y> rejected trade offer.
+            elif REJECT_PROG.search(event) != None: #<Y> rejected trade offer.
                 rspan = ANNO.RelSpan(TradeEvent, anno._anno_id)
                 #rel = ANNO.Relation(rel_id, rspan, 'Question-answer_pair', features, metadata)
                 rel = PartialRelation(rspan, 'Question-answer_pair')
@@ -557,13 +557,13 @@ def add_discourse_annotations(doc):
 
             # Monopoly events
 
-            elif CardRegEx.search(event) != None: #<X> played a Monopoly card.
+            elif CARD_PROG.search(event) != None: #<X> played a Monopoly card.
                 if MonopolyEvent != "":
                     raise Exception("add_discourse_annotations : la chaîne MonopolyEvent n'a pas été vidée!")
                 MonopolyEvent = anno._anno_id
                 continue
 
-            elif MonopolyRegEx.search(event) != None: #<X> monopolized <R>.
+            elif MONOPOLY_PROG.search(event) != None: #<X> monopolized <R>.
                 rspan = ANNO.RelSpan(MonopolyEvent, anno._anno_id)
                 #rel = ANNO.Relation(rel_id, rspan, 'Sequence', features, metadata)
                 rel = PartialRelation(rspan, 'Sequence')
@@ -13,21 +13,32 @@ reimplements the generation of local and global ids as it is implemented
 in educe.
 
 Usage :
-python nonling_annotations.py <path to the game> <version of the game>
+python nonling_annotations.py <path to the game> [...] <version of the game>
 
 Example :
 python nonling_annotations.py ../../data/pilot_nonling/test/pilot14/ SILVER
 
+Instead of a game, you can also give a directory of games (eg. a
+season), in which case all of its games that have the given version
+are annotated, in parallel (see `--jobs`).
+
+The identifiers of the new annotations only depend on the files being
+annotated (see `--start`), so annotating the same files again gives the
+same annotations.
+
 NB : it would be wise to not use this script twice on the same files,
 since it would add the same annotations twice.
 """
 
 from __future__ import print_function
 
+from collections import namedtuple
 import argparse
 import codecs
+import multiprocessing
 import os
 import re
+import sys
 import xml.etree.ElementTree as ET
 
 
@@ -38,7 +49,7 @@ from educe.stac.util.prettifyxml import prettify
 _AUTHOR = 'stacnl'
 
 # ---------------------------------------------------------------------
-# "Units" annotations
+# Server messages
 # ---------------------------------------------------------------------
 
 # trade offer with another player
@@ -55,322 +66,231 @@ BANK_OFFER_PROG = re.compile(BANK_OFFER_RE)
 TRADE_RE = r'(?P<X>.+) traded (?P<V>(\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))*)? for (?P<W>(\d+) (clay|ore|sheep|wheat|wood)(, (\d+) (clay|ore|sheep|wheat|wood))*)? from (?P<Y>.+)\.'
 TRADE_PROG = re.compile(TRADE_RE)
 
+REJECT_PROG = re.compile(r'(.+) rejected trade offer\.')
 
-def add_units_annotations(tree, text):
-    """Add units annotations on non-linguistic events.
+GET_PROG = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood)\.')
+GET2_PROG = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood), (\d+) (clay|ore|sheep|wheat|wood)\.')
+#It is impossible in "Settlers of Catan" to get more than 2 different types of resources with one roll dice.
+#That's why we actually don't need to bother with complex regular expression since there are in fact just two cases to consider. :)
 
-    Parameters
-    ----------
-    tree :
-        XML tree extracted from the .aa file to modify
-    text : string
-        raw text extracted from the .ac file
+MONOPOLY_PROG = re.compile(r'(.+) monopolized (clay|ore|sheep|wheat|wood)\.')
 
-    Returns
-    -------
-    root :
-        modified XML tree with additional units annotations on
-        non-linguistic events
-    """
-    root = tree
+JOIN_PROG = re.compile(r'(.+) joined the game\.')
+SIT_DOWN_PROG = re.compile(r'(.+) sat down at seat (\d)\.')
 
-    #That's the moment I hope I didn't make any typo...
+TURN_TO_BUILD_PROG = re.compile(r"It's (.+)'s turn to build a (road|settlement)\.")
+BUILT_PROG = re.compile(r'(.+) built a (road|settlement)\.')
 
-    RejectRegEx = re.compile(r'(.+) rejected trade offer\.')
+TURN_TO_ROLL_PROG = re.compile(r"It's (.+)'s turn to roll the dice\.")
+DICE_PROG = re.compile(r'(.+) rolled a (\d) and a (\d)\.')
 
-    GetRegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood)\.')
-    Get2RegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood), (\d+) (clay|ore|sheep|wheat|wood)\.')
-    #It is impossible in "Settlers of Catan" to get more than 2 different types of resources with one roll dice.
-    #That's why we actually don't need to bother with complex regular expression since there are in fact just two cases to consider. :)
+SOLDIER_PROG = re.compile(r'(.+) played a Soldier card\.')
+DISCARD1_PROG = re.compile(r'(.+) needs to discard\.')
+DISCARD2_PROG = re.compile(r'(.+) discarded (\d+) resources\.')
+ROBBER1_PROG = re.compile(r'(.+) will move the robber\.')
+ROBBER2_PROG = re.compile(r'(.+) moved the robber\.')
+ROBBER3_PROG = re.compile(r'(.+) moved the robber, must choose a victim\.')
+STOLE_PROG = re.compile(r'(.+) stole a resource from (.+)')
 
-    MonopolyRegEx = re.compile(r'(.+) monopolized (clay|ore|sheep|wheat|wood)\.')
+CARD_PROG = re.compile(r'(.+) played a Monopoly card\.')
 
+CANT_TRADE = "You can't make that trade."
 
-    Trader = ''
 
-    def parse_offer(m, start, end, unit, root):
-        """Reimplementation of parseOffer.
+class Rule(namedtuple('Rule', 'kind keyword prog exact unless')):
+    """
+    How to recognise a kind of server message.
 
-        Parameters
-        ----------
-        m: TODO
-            Match object for the offer.
-        start: int
-            Start of the offer.
-        end: int
-            End of the offer.
-        unit: TODO
-            XML element for this unit annotation.
-        root: TODO
-            Root of the XML tree.
-        """
-        X = m.group('X')
-        # 1. update the unit annotation:
-        # * type = 'Offer'
-        unit.find('characterisation/type').text = 'Offer'
-
-        feats = unit.find('characterisation/featureSet')
-        # * surface act = 'Assertion'
-        f_elm1 = ET.SubElement(feats, 'feature', {'name': 'Surface_act'})
-        f_elm1.text = 'Assertion'
-        # * addressee = '?'
-        f_elm2 = ET.SubElement(feats, 'feature', {'name': 'Addressee'})
-        f_elm2.text = '?'
-        # 2. add 'Resource' annotations for both offered and asked resources
-        # * resources offered
-        # expected position of the leftmost character of the first one
-        left = start + len(X) + 24
-        right = left  # useful when m.group('V') is None
-        if m.group('V') is not None:
-            resources_offered = m.group('V').split(', ')
-            for resource in resources_offered:
-                right = left + len(resource)  # end of span
-                qty, kind = resource.split(' ')
-                append_unit(root, 'Resource', [('Status', 'Givable'),
-                                               ('Quantity', qty),
-                                               ('Correctness', 'True'),
-                                               ('Kind', kind)],
-                            left, right, author=_AUTHOR)
-                # expected position of the leftmost character of the next
-                # offered resource (if any)
-                left = right + 2
-        # * resources asked
-        left = right + 5
-        right = left
-        if m.group('W') is not None:
-            resources_asked = m.group('W').split(', ')
-            for resource in resources_asked:
-                right = left + len(resource)  # end of span
-                qty, kind = resource.split(' ')
-                append_unit(root, 'Resource', [('Status', 'Receivable'),
-                                               ('Quantity', qty),
-                                               ('Correctness', 'True'),
-                                               ('Kind', kind)],
-                            left, right, author=_AUTHOR)
-                # expected position of the leftmost character of the next
-                # asked resource (if any)
-                left = right + 2
-        # the eventual Y (if m comes from BANK_OFFER_PROG) is currently unused
-
-    def parse_trade(m, start, end, unit, root):
-        """Reimplementation of parseTrade.
-
-        Parameters
-        ----------
-        m: TODO
-            Match object for the offer.
-        start: int
-            Start of the offer.
-        end: int
-            End of the offer.
-        unit: TODO
-            XML element for this unit annotation.
-        root: TODO
-            Root of the XML tree.
-        """
-        X = m.group('X')
-        Y = m.group('Y')
-        # 1. update the unit annotation:
-        # * type = 'Offer'
-        unit.find('characterisation/type').text = 'Accept'
-        feats = unit.find('characterisation/featureSet')
-        # * surface act = 'Assertion'
-        f_elm1 = ET.SubElement(feats, 'feature', {'name': 'Surface_act'})
-        f_elm1.text = 'Assertion'
-        # * addressee = Y or 'All' if Y = 'the bank' or 'a port'
-        f_elm2 = ET.SubElement(feats, 'feature', {'name': 'Addressee'})
-        if Y == 'the bank' or Y == 'a port':
-            f_elm2.text = 'All'
-        else:
-            f_elm2.text = Y
-        # 2. add 'Resource' annotations for both offered and asked resources
-        # * resources offered
-        # expected position of the leftmost character of the first one
-        left = start + len(X) + 8
-        right = left  # not sure it's useful here, but harmless anyway
-        if m.group('V') is not None:
-            resources_offered = m.group('V').split(', ')
-            for resource in resources_offered:
-                right = left + len(resource)  # end of span
-                qty, kind = resource.split(' ')
-                append_unit(root, 'Resource', [('Status', '?'),
-                                               ('Quantity', qty),
-                                               ('Correctness', 'True'),
-                                               ('Kind', kind)],
-                            left, right, author=_AUTHOR)
-                left = right + 2
-        # * resources asked
-        left = right + 5  # ' for '
-        right = left
-        if m.group('W') is not None:
-            resources_asked = m.group('W').split(', ')
-            for resource in resources_asked:
-                right = left + len(resource)
-                qty, kind = resource.split(' ')
-                append_unit(root, 'Resource', [('Status', 'Possessed'),
-                                               ('Quantity', qty),
-                                               ('Correctness', 'True'),
-                                               ('Kind', kind)],
-                            left, right, author=_AUTHOR)
-                left = right + 2
+    The keyword is a fixed bit of text that any such message contains
+    (or is exactly, if `exact`); we only try the pattern (if any) on
+    messages that contain the keyword, and only accept its match if
+    none of the `unless` patterns match as well.
+    """
+    pass
+
+
+def _rule(kind, keyword, prog=None, exact=False, unless=()):
+    "a `Rule` (with defaults)"
+    return Rule(kind, keyword, prog, exact, unless)
+
+
+# in order of priority (the first rule that matches wins)
+UNITS_RULES = [
+    _rule('offer', ' made an offer to trade ', OFFER_PROG),
+    _rule('offer', ' made an offer to trade ', BANK_OFFER_PROG),
+    _rule('trade', ' traded ', TRADE_PROG),
+    _rule('reject', ' rejected trade offer.', REJECT_PROG),
+    _rule('cant', CANT_TRADE, exact=True),
+    _rule('get', ' gets ', GET_PROG),
+    _rule('get2', ' gets ', GET2_PROG),
+    _rule('monopoly', ' monopolized ', MONOPOLY_PROG),
+]
+
+DISCOURSE_RULES = [
+    # Join / sit down events
+    _rule('join', ' joined the game.', JOIN_PROG),
+    _rule('sit_down', ' sat down at seat ', SIT_DOWN_PROG),
+    # Game started / Board layout set events
+    _rule('start', 'Game started.', exact=True),
+    _rule('board', 'Board layout set.', exact=True),
+    # Building events
+    _rule('turn_to_build', "'s turn to build a ", TURN_TO_BUILD_PROG),
+    _rule('built', ' built a ', BUILT_PROG),
+    # Resource distribution events
+    _rule('turn_to_roll', "'s turn to roll the dice.", TURN_TO_ROLL_PROG),
+    _rule('dice', ' rolled a ', DICE_PROG),
+    _rule('get', ' gets ', GET_PROG),
+    _rule('get', ' gets ', GET2_PROG),
+    _rule('no_get', 'No player gets anything.'),
+    # Robber events
+    _rule('soldier', ' played a Soldier card.', SOLDIER_PROG),
+    _rule('robber', ' needs to discard.', DISCARD1_PROG),
+    _rule('robber', ' discarded ', DISCARD2_PROG),
+    _rule('robber', ' will move the robber.', ROBBER1_PROG),
+    _rule('robber_moved', ' moved the robber.', ROBBER2_PROG),
+    _rule('robber', ' moved the robber, must choose a victim.',
+          ROBBER3_PROG),
+    _rule('robber_moved', ' stole a resource from ', STOLE_PROG),
+    # Trade events
+    _rule('offer', ' made an offer to trade ', OFFER_PROG),
+    _rule('offer_more', '...', exact=True),
+    _rule('offer_from', 'from ', FROM_PROG,
+          unless=(TRADE_PROG, BANK_OFFER_PROG)),
+    _rule('offer', ' made an offer to trade ', BANK_OFFER_PROG),
+    _rule('cant', CANT_TRADE),
+    _rule('answer', ' traded ', TRADE_PROG),
+    _rule('answer', ' rejected trade offer.', REJECT_PROG),
+    # Monopoly events
+    _rule('card', ' played a Monopoly card.', CARD_PROG),
+    _rule('monopoly', ' monopolized ', MONOPOLY_PROG),
+]
+
+
+def classify_event(event, rules):
+    """Recognise a server message ::
+
+        (String, [Rule]) -> (String or None, Match or None)
+
+    Return the kind of the first rule that matches the message, along
+    with the match object for its pattern (None if the rule has no
+    pattern). If no rule matches, the kind is None.
+    """
+    for rule in rules:
+        if rule.exact:
+            if event == rule.keyword:
+                return rule.kind, None
+            continue
+        if rule.keyword not in event:
+            continue
+        if rule.prog is None:
+            return rule.kind, None
+        match = rule.prog.search(event)
+        if match is None or any(p.search(event) for p in rule.unless):
+            continue
+        return rule.kind, match
+    return None, None
 
-    for unit in root:
-        if unit.findtext('characterisation/type') == 'NonplayerSegment':
-            start = int(unit.find('positioning/start/singlePosition').get(
-                'index'))
-            end = int(unit.find('positioning/end/singlePosition').get(
-                'index'))
-            event = text[start:end]
-
-            # WIP 2016-07-11
-            if OFFER_PROG.search(event) is not None:
-                # <X> made an offer to trade <N1> <R1> for <N2> <R2>.
-                m = OFFER_PROG.search(event)
-                parse_offer(m, start, end, unit, root)
-                Trader = m.group('X')
-                continue
-            elif BANK_OFFER_PROG.search(event) is not None:
-                # <X> made an offer to trade <N1> <R1> for <N2> <R2> with
-                # the bank or a port.
-                m = BANK_OFFER_PROG.search(event)
-                parse_offer(m, start, end, unit, root)
-                Trader = m.group('X')
-                continue
-            elif TRADE_PROG.search(event) is not None:
-                m = TRADE_PROG.search(event)
-                parse_trade(m, start, end, unit, root)
-                continue
-            # end WIP 2016-07-11
-
-            elif RejectRegEx.search(event) != None:
-                # <Y> rejected trade offer.
-                mo = RejectRegEx.search(event)
-                Y = mo.group(1)
-
-                unit.find('characterisation/type').text = 'Refusal'
-                feats = unit.find('characterisation/featureSet')
-                f_elm1 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Surface_act'})
-                f_elm1.text = 'Assertion'
-                f_elm2 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Addressee'})
-                if Trader != '':
-                    f_elm2.text = Trader
-                else:
-                    f_elm2.text = 'All'
-                continue
 
-            elif event == "You can't make that trade.":
-                unit.find('characterisation/type').text = 'Other'
-                feats = unit.find('characterisation/featureSet')
-                f_elm1 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Surface_act'})
-                f_elm1.text = 'Assertion'
-                f_elm2 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Addressee'})
-                if Trader != '':
-                    f_elm2.text = Trader
-                else:
-                    f_elm2.text = 'All'
-                continue
+# ---------------------------------------------------------------------
+# "Units" annotations
+# ---------------------------------------------------------------------
 
 
-            elif GetRegEx.search(event) != None:
-                # <Y> gets <N> <R>.
-                mo = GetRegEx.search(event)
-                Y = mo.group(1)
-                N = mo.group(2)
-                R = mo.group(3)
-
-                unit.find('characterisation/type').text = 'Other'
-                feats = unit.find('characterisation/featureSet')
-                f_elm1 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Surface_act'})
-                f_elm1.text = 'Assertion'
-                f_elm2 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Addressee'})
-                f_elm2.text = 'All'
-
-                left = start + len(Y) + 6
-                right = end - 1
-                append_unit(root, 'Resource', [('Status', 'Possessed'),
-                                               ('Quantity', N),
-                                               ('Correctness', 'True'),
-                                               ('Kind', R)],
-                            left, right, author=_AUTHOR)
-                continue
+def _set_act(unit, utype, addressee):
+    """Set the type of a unit annotation, and mark it as an assertion
+    to the given addressee"""
+    unit.find('characterisation/type').text = utype
+    feats = unit.find('characterisation/featureSet')
+    f_elm1 = ET.SubElement(feats, 'feature', {'name': 'Surface_act'})
+    f_elm1.text = 'Assertion'
+    f_elm2 = ET.SubElement(feats, 'feature', {'name': 'Addressee'})
+    f_elm2.text = addressee
 
-            elif Get2RegEx.search(event) != None:
-                # <Y> gets <N1> <R1>, <N2> <R2>.
-                mo = Get2RegEx.search(event)
-                Y = mo.group(1)
-                N1 = mo.group(2)
-                R1 = mo.group(3)
-                N2 = mo.group(2)
-                R2 = mo.group(3)
-
-                unit.find('characterisation/type').text = 'Other'
-                feats = unit.find('characterisation/featureSet')
-                f_elm1 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Surface_act'})
-                f_elm1.text = 'Assertion'
-                f_elm2 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Addressee'})
-                f_elm2.text = 'All'
-
-                left1 = start + len(Y) + 6
-                right1 = left1 + len(N1) + 1 + len(R1)
-                append_unit(root, 'Resource', [('Status', 'Possessed'),
-                                               ('Quantity', N1),
-                                               ('Correctness', 'True'),
-                                               ('Kind', R1)],
-                            left1, right1, author=_AUTHOR)
-                left2 = right1 + 2
-                right2 = left2 + len(N2) + 1 + len(R2)
-                append_unit(root, 'Resource', [('Status', 'Possessed'),
-                                               ('Quantity', N2),
-                                               ('Correctness', 'True'),
-                                               ('Kind', R2)],
-                            left2, right2, author=_AUTHOR)
-                continue
 
+def _append_resources(root, resources, left, status):
+    """Add 'Resource' annotations for a list of resources (as in
+    `2 clay, 1 ore`) starting at the given position.
 
-            elif MonopolyRegEx.search(event) != None:
-                # <X> monopolized <R>.
-                mo = MonopolyRegEx.search(event)
-                X = mo.group(1)
-                R = mo.group(2)
-
-                unit.find('characterisation/type').text = 'Other'
-                feats = unit.find('characterisation/featureSet')
-                f_elm1 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Surface_act'})
-                f_elm1.text = 'Assertion'
-                f_elm2 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Addressee'})
-                f_elm2.text = 'All'
-
-                right = end - 1
-                left = right - len(R)
-                append_unit(root, 'Resource', [('Status', 'Possessed'),
-                                               ('Quantity', '?'),
-                                               ('Correctness', 'True'),
-                                               ('Kind', R)],
-                            left, right, author=_AUTHOR)
-                continue
+    Returns
+    -------
+    right : int
+        end of the span of the last resource (`left` if there are no
+        resources)
+    """
+    right = left
+    if resources is not None:
+        for resource in resources.split(', '):
+            right = left + len(resource)  # end of span
+            qty, kind = resource.split(' ')
+            append_unit(root, 'Resource', [('Status', status),
+                                           ('Quantity', qty),
+                                           ('Correctness', 'True'),
+                                           ('Kind', kind)],
+                        left, right, author=_AUTHOR)
+            # expected position of the leftmost character of the next
+            # resource (if any)
+            left = right + 2
+    return right
+
+
+def parse_offer(m, start, end, unit, root):
+    """Reimplementation of parseOffer.
 
-            else:
-                unit.find('characterisation/type').text = 'Other'
-                feats = unit.find('characterisation/featureSet')
-                f_elm1 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Surface_act'})
-                f_elm1.text = 'Assertion'
-                f_elm2 = ET.SubElement(feats, 'feature',
-                                       {'name': 'Addressee'})
-                f_elm2.text = 'All'
-                continue
+    Parameters
+    ----------
+    m: TODO
+        Match object for the offer.
+    start: int
+        Start of the offer.
+    end: int
+        End of the offer.
+    unit: TODO
+        XML element for this unit annotation.
+    root: TODO
+        Root of the XML tree.
+    """
+    X = m.group('X')
+    # 1. update the unit annotation:
+    # * type = 'Offer', surface act = 'Assertion', addressee = '?'
+    _set_act(unit, 'Offer', '?')
+    # 2. add 'Resource' annotations for both offered and asked resources
+    # * resources offered (the first one is expected to start right
+    # after '<X> made an offer to trade ')
+    right = _append_resources(root, m.group('V'), start + len(X) + 24,
+                              'Givable')
+    # * resources asked
+    _append_resources(root, m.group('W'), right + 5, 'Receivable')
+    # the eventual Y (if m comes from BANK_OFFER_PROG) is currently unused
+
+
+def parse_trade(m, start, end, unit, root):
+    """Reimplementation of parseTrade.
 
-    return root
+    Parameters
+    ----------
+    m: TODO
+        Match object for the offer.
+    start: int
+        Start of the offer.
+    end: int
+        End of the offer.
+    unit: TODO
+        XML element for this unit annotation.
+    root: TODO
+        Root of the XML tree.
+    """
+    X = m.group('X')
+    Y = m.group('Y')
+    # 1. update the unit annotation:
+    # * type = 'Accept', surface act = 'Assertion'
+    # * addressee = Y or 'All' if Y = 'the bank' or 'a port'
+    if Y == 'the bank' or Y == 'a port':
+        _set_act(unit, 'Accept', 'All')
+    else:
+        _set_act(unit, 'Accept', Y)
+    # 2. add 'Resource' annotations for both offered and asked resources
+    right = _append_resources(root, m.group('V'), start + len(X) + 8, '?')
+    _append_resources(root, m.group('W'), right + 5, 'Possessed')  # ' for '
 
 
 # ---------------------------------------------------------------------
@@ -498,6 +418,365 @@ def append_schema(root, utype, edus):
     return cdu_id
 
 
+def _server_units(root, text):
+    """The server (non-linguistic) unit annotations in an XML tree ::
+
+        (Element, String) -> [(Element, Int, Int, String)]
+
+    along with their start, end and text
+    """
+    res = []
+    for unit in root:
+        if unit.findtext('characterisation/type') == 'NonplayerSegment':
+            start = int(unit.find('positioning/start/singlePosition').get(
+                'index'))
+            end = int(unit.find('positioning/end/singlePosition').get(
+                'index'))
+            res.append((unit, start, end, text[start:end]))
+    return res
+
+
+# ---------------------------------------------------------------------
+# Annotator
+# ---------------------------------------------------------------------
+
+
+class NonlingAnnotator(object):
+    """
+    Adds annotations on the non-linguistic events of a game, one
+    subdoc at a time (in order).
+
+    Server messages are recognised with `classify_event`, and each kind
+    of message is then handled by its own method (`_unit_<kind>` for
+    units annotations, `_rel_<kind>` for discourse annotations). The
+    same messages come up over and over in a game, so we remember what
+    kind each one is.
+
+    Parameters
+    ----------
+    events : Events, optional
+        Global ids for events currently happening (in case we are
+        picking up from a previous subdoc)
+    """
+    def __init__(self, events=None):
+        self.events = events if events is not None else Events()
+        self._seen = {}
+        self._trader = ''
+        # state of the current subdoc (see `add_discourse_annotations`)
+        self._root = None
+        self._subdoc = None
+        self._errors = None
+
+    def classify(self, event, rules):
+        """`classify_event`, remembering messages we have already seen
+        """
+        key = (id(rules), event)
+        res = self._seen.get(key)
+        if res is None:
+            res = classify_event(event, rules)
+            self._seen[key] = res
+        return res
+
+    # units
+
+    def add_units_annotations(self, root, text):
+        """Add units annotations on non-linguistic events (see the
+        module-level `add_units_annotations`)
+        """
+        self._trader = ''
+        for unit, start, end, event in _server_units(root, text):
+            kind, m = self.classify(event, UNITS_RULES)
+            handler = getattr(self, '_unit_' + (kind or 'other'))
+            handler(root, unit, m, start, end)
+        return root
+
+    def _unit_offer(self, root, unit, m, start, end):
+        # <X> made an offer to trade <N1> <R1> for <N2> <R2>.
+        # (maybe followed by 'from the bank or a port')
+        parse_offer(m, start, end, unit, root)
+        self._trader = m.group('X')
+
+    def _unit_trade(self, root, unit, m, start, end):
+        # <X> traded <N1> <R1> for <N2> <R2> from <Y>.
+        parse_trade(m, start, end, unit, root)
+
+    def _unit_reject(self, root, unit, m, start, end):
+        # <Y> rejected trade offer.
+        _set_act(unit, 'Refusal', self._trader or 'All')
+
+    def _unit_cant(self, root, unit, m, start, end):
+        # You can't make that trade.
+        _set_act(unit, 'Other', self._trader or 'All')
+
+    def _unit_get(self, root, unit, m, start, end):
+        # <Y> gets <N> <R>.
+        Y, N, R = m.group(1, 2, 3)
+        _set_act(unit, 'Other', 'All')
+        left = start + len(Y) + 6
+        right = end - 1
+        append_unit(root, 'Resource', [('Status', 'Possessed'),
+                                       ('Quantity', N),
+                                       ('Correctness', 'True'),
+                                       ('Kind', R)],
+                    left, right, author=_AUTHOR)
+
+    def _unit_get2(self, root, unit, m, start, end):
+        # <Y> gets <N1> <R1>, <N2> <R2>.
+        Y, N1, R1 = m.group(1, 2, 3)
+        N2, R2 = m.group(2, 3)
+        _set_act(unit, 'Other', 'All')
+        left1 = start + len(Y) + 6
+        right1 = left1 + len(N1) + 1 + len(R1)
+        append_unit(root, 'Resource', [('Status', 'Possessed'),
+                                       ('Quantity', N1),
+                                       ('Correctness', 'True'),
+                                       ('Kind', R1)],
+                    left1, right1, author=_AUTHOR)
+        left2 = right1 + 2
+        right2 = left2 + len(N2) + 1 + len(R2)
+        append_unit(root, 'Resource', [('Status', 'Possessed'),
+                                       ('Quantity', N2),
+                                       ('Correctness', 'True'),
+                                       ('Kind', R2)],
+                    left2, right2, author=_AUTHOR)
+
+    def _unit_monopoly(self, root, unit, m, start, end):
+        # <X> monopolized <R>.
+        R = m.group(2)
+        _set_act(unit, 'Other', 'All')
+        right = end - 1
+        left = right - len(R)
+        append_unit(root, 'Resource', [('Status', 'Possessed'),
+                                       ('Quantity', '?'),
+                                       ('Correctness', 'True'),
+                                       ('Kind', R)],
+                    left, right, author=_AUTHOR)
+
+    def _unit_other(self, root, unit, m, start, end):
+        _set_act(unit, 'Other', 'All')
+
+    # discourse
+
+    def add_discourse_annotations(self, root, text, subdoc):
+        """Add discourse annotations for non-linguistical events (see
+        the module-level `add_discourse_annotations`)
+
+        Returns
+        -------
+        errors : string list
+            list of error messages
+        """
+        self._root = root
+        self._subdoc = subdoc
+        self._errors = []
+        for unit, _, _, event in _server_units(root, text):
+            kind, m = self.classify(event, DISCOURSE_RULES)
+            if kind is None:
+                continue
+            global_id = '_'.join([subdoc, unit.get('id')])
+            getattr(self, '_rel_' + kind)(global_id, m)
+
+        # For resources distributions, we complete the XML tree and
+        # empty the list at the next dice roll.
+        # So for the last turn we may have forgotten to annotate some
+        # events.
+        self._close_dice()
+        return self._errors
+
+    def _relation(self, utype, global_id1, global_id2):
+        "append a relation to the current subdoc"
+        self._errors.extend(append_relation(
+            self._root, utype, global_id1, global_id2))
+
+    def _cdu(self, global_ids):
+        "append a CDU to the current subdoc, returning its global id"
+        cdu_id = append_schema(self._root, 'Complex_discourse_unit',
+                               global_ids)
+        return '_'.join([self._subdoc, cdu_id])
+
+    def _close_dice(self):
+        "annotate the resource distribution in progress, if any"
+        events = self.events
+        if len(events.Dice) > 0:
+            if len(events.Dice) == 2:
+                # Resource distribution: 1 player
+                self._relation('Result', events.Dice[0], events.Dice[1])
+            else:  # Resource Distribution : 2 or more players
+                global_cdu_dice = self._cdu(events.Dice[1:])
+                self._relation('Result', events.Dice[0], global_cdu_dice)
+                for i in range(1, len(events.Dice) - 1):
+                    self._relation('Continuation',
+                                   events.Dice[i], events.Dice[i+1])
+            events.Dice[:] = []
+
+    def _close_robber(self):
+        "annotate the robber event in progress"
+        events = self.events
+        global_cdu_robber = self._cdu(events.Robber[1:])
+        self._relation('Result', events.Robber[0], global_cdu_robber)
+        for i in range(1, len(events.Robber) - 1):
+            self._relation('Sequence', events.Robber[i], events.Robber[i+1])
+        events.Robber[:] = []
+
+    def _rel_join(self, global_id, m):
+        # <X> joined the game.
+        self.events.Join[m.group(1)] = global_id
+
+    def _rel_sit_down(self, global_id, m):
+        # <X> sat down at seat <N>.
+        X = m.group(1)
+        if X in self.events.Join:
+            self._relation('Sequence', self.events.Join[X], global_id)
+            del self.events.Join[X]
+
+    def _rel_start(self, global_id, m):
+        # Game started.
+        self.events.Start = global_id
+
+    def _rel_board(self, global_id, m):
+        # Board layout set.
+        if self.events.Start != '':
+            self._relation('Sequence', self.events.Start, global_id)
+            self.events.Start = ''
+
+    def _rel_turn_to_build(self, global_id, m):
+        # It's <X>'s turn to build a <C>.
+        building = self.events.Building
+        building[m.group(1, 2)] = global_id
+        if ('', '') in building:
+            self._relation('Result', building[('', '')], global_id)
+            del building[('', '')]
+
+    def _rel_built(self, global_id, m):
+        # <X> built a <C>.
+        building = self.events.Building
+        key = m.group(1, 2)
+        if key in building:
+            self._relation('Result', building[key], global_id)
+            del building[key]
+            building[('', '')] = global_id
+        elif ('', '') in building:
+            del building[('', '')]
+
+    def _rel_turn_to_roll(self, global_id, m):
+        # It's <X>'s turn to roll the dice.
+        self.events.Roll = global_id
+
+    def _rel_dice(self, global_id, m):
+        # <X> rolled a <M1> and a <M2>.
+        events = self.events
+        if int(m.group(2)) + int(m.group(3)) != 7:
+            # Resource distribution event
+            # Since we don't know when finishes a resource
+            # distribution, the trick is to compute a resource
+            # distribution when the next one starts.
+            # So here we first need to compute the preceding
+            # resource distribution.
+            self._close_dice()
+            events.Dice.append(global_id)
+        else:  # M1 + M2 == 7 : Robber event
+            if events.Robber != []:
+                raise Exception("add_discourse_annotations : la liste RobberEvent n'a pas été vidée!")
+            events.Robber.append(global_id)
+        if events.Roll != '':
+            self._relation('Result', events.Roll, global_id)
+            events.Roll = ''
+
+    def _rel_get(self, global_id, m):
+        # <Y> gets <N> <R>.
+        # <Y> gets <N1> <R1>, <N2> <R2>.
+        self.events.Dice.append(global_id)
+
+    def _rel_no_get(self, global_id, m):
+        # No player gets anything.
+        self._relation('Result', self.events.Dice[0], global_id)
+        self.events.Dice[:] = []
+
+    def _rel_soldier(self, global_id, m):
+        # <X> played a Soldier card.
+        if self.events.Robber != []:
+            raise Exception("add_discourse_annotations : la liste RobberEvent n'a pas été vidée!")
+        self.events.Robber.append(global_id)
+
+    def _rel_robber(self, global_id, m):
+        # <Y> needs to discard.
+        # <Y> discarded <N> resources.
+        # <X> will move the robber.
+        # <X> moved the robber, must choose a victim.
+        self.events.Robber.append(global_id)
+
+    def _rel_robber_moved(self, global_id, m):
+        # <X> moved the robber.
+        # <X> stole a resource from <Z>.
+        self.events.Robber.append(global_id)
+        self._close_robber()
+
+    def _rel_offer(self, global_id, m):
+        # <X> made an offer to trade <M> <R1> for <N> <R2>.
+        # (maybe followed by 'from the bank or a port')
+        self.events.Trade[:] = [global_id]
+
+    def _rel_offer_more(self, global_id, m):
+        # ...
+        self.events.Trade.append(global_id)
+
+    def _rel_offer_from(self, global_id, m):
+        # from <Y>
+        trade = self.events.Trade
+        trade.append(global_id)
+        self._relation('Elaboration', trade[0], trade[1])
+        self._relation('Continuation', trade[1], global_id)
+        trade[0] = self._cdu(trade)
+
+    def _rel_cant(self, global_id, m):
+        # You can't make that trade.
+        self._relation('Question-answer_pair', self.events.Trade[0],
+                       global_id)
+        # this message does not clear the pending trade offer,
+        # it just means that the trade can't be made right now
+        # for example, if the offering player is in a building phase,
+        # the addressee needs to wait until the offering player is
+        # done, but the trade offer is accepted afterwards
+        # ex: s1-league2-game1, turns 423..425
+
+    def _rel_answer(self, global_id, m):
+        # <X> traded <M> <R1> for <N> <R2> from <Y>.
+        # <Y> rejected trade offer.
+        self._relation('Question-answer_pair', self.events.Trade[0],
+                       global_id)
+        self.events.Trade[:] = []
+
+    def _rel_card(self, global_id, m):
+        # <X> played a Monopoly card.
+        if self.events.Monopoly != "":
+            raise Exception("add_discourse_annotations : la chaîne MonopolyEvent n'a pas été vidée!")
+        self.events.Monopoly = global_id
+
+    def _rel_monopoly(self, global_id, m):
+        # <X> monopolized <R>.
+        self._relation('Sequence', self.events.Monopoly, global_id)
+        self.events.Monopoly = ""
+
+
+def add_units_annotations(tree, text):
+    """Add units annotations on non-linguistic events.
+
+    Parameters
+    ----------
+    tree :
+        XML tree extracted from the .aa file to modify
+    text : string
+        raw text extracted from the .ac file
+
+    Returns
+    -------
+    root :
+        modified XML tree with additional units annotations on
+        non-linguistic events
+    """
+    return NonlingAnnotator().add_units_annotations(tree, text)
+
+
 def add_discourse_annotations(tree, text, e, subdoc):
     """Add discourse annotations for non-linguistical event.
 
@@ -523,323 +802,123 @@ def add_discourse_annotations(tree, text, e, subdoc):
     errors : string list
         list of error messages
     """
+    annotator = NonlingAnnotator(events=e)
+    errors = annotator.add_discourse_annotations(tree, text, subdoc)
+    return tree, annotator.events, errors
 
-    root = tree
-    events = e
-    errors = []
-
-    JoinRegEx = re.compile(r'(.+) joined the game\.')
-    SitDownRegEx = re.compile(r'(.+) sat down at seat (\d)\.')
-
-    TurnToBuildRegEx = re.compile(r"It's (.+)'s turn to build a (road|settlement)\.")
-    BuiltRegEx = re.compile(r'(.+) built a (road|settlement)\.')
-
-    TurnToRollRegEx = re.compile(r"It's (.+)'s turn to roll the dice\.")
-    DiceRegEx = re.compile(r'(.+) rolled a (\d) and a (\d)\.')
-    GetRegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood)\.')
-    Get2RegEx = re.compile(r'(.+) gets (\d+) (clay|ore|sheep|wheat|wood), (\d+) (clay|ore|sheep|wheat|wood)\.')
-    #It is impossible in "Settlers of Catan" to get more than 2 different types of resources with one roll dice.
-    #That's why we actually don't need to bother with complex regular expression since there are in fact just two cases to consider. :)
-    NoGetRegEx = re.compile(r'No player gets anything\.')
-
-    SoldierRegEx = re.compile(r'(.+) played a Soldier card\.')
-    Discard1RegEx = re.compile(r'(.+) needs to discard\.')
-    Discard2RegEx = re.compile(r'(.+) discarded (\d+) resources\.')
-    Robber1RegEx = re.compile(r'(.+) will move the robber\.')
-    Robber2RegEx = re.compile(r'(.+) moved the robber\.')
-    Robber3RegEx = re.compile(r'(.+) moved the robber, must choose a victim\.')
-    StoleRegEx = re.compile(r'(.+) stole a resource from (.+)')
-
-    CantRegEx = re.compile(r"You can't make that trade\.")
-    RejectRegEx = re.compile(r'(.+) rejected trade offer\.')
-
-    CardRegEx = re.compile(r'(.+) played a Monopoly card\.')
-    MonopolyRegEx = re.compile(r'(.+) monopolized (clay|ore|sheep|wheat|wood)\.')
-
-    for unit in root:
-        if unit.findtext('characterisation/type') == 'NonplayerSegment':
-
-            start = int(unit.find('positioning/start/singlePosition').get(
-                'index'))
-            end = int(unit.find('positioning/end/singlePosition').get(
-                'index'))
-            event = text[start:end]
-            global_id = '_'.join([subdoc, unit.get('id')])
-
-            # Join / sit down events
-
-            if JoinRegEx.search(event) is not None:
-                # <X> joined the game.
-                mo = JoinRegEx.search(event)
-                X = mo.group(1)
-                events.Join[X] = global_id
-                continue
-
-            elif SitDownRegEx.search(event) is not None:
-                # <X> sat down at seat <N>.
-                mo = SitDownRegEx.search(event)
-                X = mo.group(1)
-                if events.Join.has_key(X):
-                    errors.extend(append_relation(
-                        root, 'Sequence', events.Join[X], global_id))
-                    del events.Join[X]
-                continue
-
-            # Game started / Board layout set events
-
-            elif event == "Game started.":
-                events.Start = global_id
-                continue
-
-            elif event == "Board layout set.":
-                if events.Start != '':
-                    errors.extend(append_relation(
-                        root, 'Sequence', events.Start, global_id))
-                    events.Start = ''
-                continue
-
-            # Building events
-
-            elif TurnToBuildRegEx.search(event) is not None:
-                # It's <X>'s turn to build a <C>.
-                mo = TurnToBuildRegEx.search(event)
-                X = mo.group(1)
-                C = mo.group(2)
-                events.Building[(X, C)] = global_id
-                if events.Building.has_key(('', '')):
-                    errors.extend(append_relation(
-                        root, 'Result', events.Building[('', '')], global_id))
-                    del events.Building[('', '')]
-                continue
-
-            elif BuiltRegEx.search(event) is not None:
-                # <X> built a <C>.
-                mo = BuiltRegEx.search(event)
-                X = mo.group(1)
-                C = mo.group(2)
-                if events.Building.has_key((X, C)):
-                    errors.extend(append_relation(
-                        root, 'Result', events.Building[(X, C)], global_id))
-                    del events.Building[(X, C)]
-                    events.Building[('', '')] = global_id
-                elif events.Building.has_key(('', '')):
-                    del events.Building[('', '')]
-                continue
-
-            # Resource distribution events
-            elif TurnToRollRegEx.search(event) is not None:
-                # It's <X>'s turn to roll the dice.
-                events.Roll = global_id
-                continue
-
-            elif DiceRegEx.search(event) is not None:
-                # <X> rolled a <M1> and a <M2>.
-                mo = DiceRegEx.search(event)
-                M1 = int(mo.group(2))
-                M2 = int(mo.group(3))
-                if M1 + M2 != 7: # Resource distribution event
-                    # Since we don't know when finishes a resource
-                    # distribution, the trick is to compute a resource
-                    # distribution when the next one starts.
-                    # So here we first need to compute the preceding
-                    # resource distribution.
-                    if len(events.Dice) > 0:
-                        if len(events.Dice) == 2:
-                            # Resource distribution: 1 player
-                            errors.extend(append_relation(
-                                root, 'Result', events.Dice[0], events.Dice[1]))
-                        else: # Resource Distribution : 2 or more players
-                            cdu_dice = append_schema(
-                                root, 'Complex_discourse_unit', events.Dice[1:])
-                            global_cdu_dice = '_'.join([subdoc, cdu_dice])
-                            errors.extend(append_relation(
-                                root, 'Result', events.Dice[0], global_cdu_dice))
-                            for i in range(1, len(events.Dice) - 1):
-                                errors.extend(append_relation(
-                                    root, 'Continuation', events.Dice[i], events.Dice[i+1]))
-                        events.Dice[:] = []
-                    events.Dice.append(global_id)
-                else: # M1 + M2 == 7 : Robber event
-                    if events.Robber != []:
-                        raise Exception("add_discourse_annotations : la liste RobberEvent n'a pas été vidée!")
-                    events.Robber.append(global_id)
-                if events.Roll != '':
-                    errors.extend(append_relation(
-                        root, 'Result', events.Roll, global_id))
-                    events.Roll = ''
-                continue
 
-            elif GetRegEx.search(event) is not None:
-                # <Y> gets <N> <R>.
-                events.Dice.append(global_id)
-                continue
+# ---------------------------------------------------------------------
+# Games
+# ---------------------------------------------------------------------
 
-            elif Get2RegEx.search(event) is not None:
-                # <Y> gets <N1> <R1>, <N2> <R2>.
-                events.Dice.append(global_id)
-                continue
 
-            elif NoGetRegEx.search(event) is not None:
-                # No player gets anything.
-                errors.extend(append_relation(
-                    root, 'Result', events.Dice[0], global_id))
-                events.Dice[:] = []
-                continue
+def _creation_dates(root):
+    "creation dates of the annotations in an XML tree"
+    res = []
+    for elm in root.iter('creation-date'):
+        try:
+            res.append(int(elm.text))
+        except (TypeError, ValueError):
+            continue
+    return res
 
-            # Robber events
-            elif SoldierRegEx.search(event) is not None:
-                # <X> played a Soldier card.
-                if events.Robber != []:
-                    raise Exception("add_discourse_annotations : la liste RobberEvent n'a pas été vidée!")
-                events.Robber.append(global_id)
-                continue
 
-            elif Discard1RegEx.search(event) is not None:
-                # <Y> needs to discard.
-                events.Robber.append(global_id)
-                continue
+def annotate_game(folder, metal, start=None):
+    """Add annotations on non-linguistic events to all the subdocs of
+    a game (units and discourse), and write the relations that would go
+    across subdocs to `Implicit_Relations.txt` in the game folder.
 
-            elif Discard2RegEx.search(event) is not None:
-                # <Y> discarded <N> resources.
-                events.Robber.append(global_id)
-                continue
-
-            elif Robber1RegEx.search(event) is not None:
-                # <X> will move the robber.
-                events.Robber.append(global_id)
-                continue
+    Parameters
+    ----------
+    folder : string
+        folder of the game
+    metal : string
+        version of the game to annotate (ex: GOLD)
+    start : int, optional
+        starting timestamp for the identifiers of the new annotations
+        (default: the latest creation date of the annotations already
+        in the game, so that annotating the same files gives the same
+        identifiers)
 
-            elif Robber2RegEx.search(event) is not None:
-                # <X> moved the robber.
-                events.Robber.append(global_id)
-                cdu_robber = append_schema(
-                    root, 'Complex_discourse_unit', events.Robber[1:])
-                global_cdu_robber = '_'.join([subdoc, cdu_robber])
-                errors.extend(append_relation(
-                    root, 'Result', events.Robber[0], global_cdu_robber))
-                for i in range(1, len(events.Robber) - 1):
-                    errors.extend(append_relation(
-                        root, 'Sequence', events.Robber[i], events.Robber[i+1]))
-                events.Robber[:] = []
-                continue
+    Returns
+    -------
+    name : string
+        name of the game
+    nb_subdocs : int
+    nb_implicit : int
+        number of implicit relations (across subdocs)
+    """
+    folder = os.path.abspath(folder)
+    name = os.path.basename(folder)
 
-            elif Robber3RegEx.search(event) is not None:
-                # <X> moved the robber, must choose a victim.
-                events.Robber.append(global_id)
-                continue
+    unitsfolder = os.path.join(folder, 'units', metal)
+    discoursefolder = os.path.join(folder, 'discourse', metal)
 
-            elif StoleRegEx.search(event) is not None:
-                # <X> stole a resource from <Z>.
-                events.Robber.append(global_id)
-                cdu_robber = append_schema(
-                    root, 'Complex_discourse_unit', events.Robber[1:])
-                global_cdu_robber = '_'.join([subdoc, cdu_robber])
-                errors.extend(append_relation(
-                    root, 'Result', events.Robber[0], global_cdu_robber))
-                for i in range(1, len(events.Robber) - 1):
-                    errors.extend(append_relation(
-                        root, 'Sequence', events.Robber[i], events.Robber[i+1]))
-                events.Robber[:] = []
-                continue
+    N = len(os.listdir(unitsfolder)) // 2
 
-            # Trade events
+    # read everything first: we need all of the existing annotations
+    # to pick the starting timestamp
+    subdocs = []
+    for i in range(1, N+1):
+        subdoc = name + '_%02d' % i
 
-            elif OFFER_PROG.search(event) is not None:
-                # <X> made an offer to trade <M> <R1> for <N> <R2>.
-                events.Trade[:] = []
-                events.Trade.append(global_id)
-                continue
-            elif event == '...':
-                # ...
-                events.Trade.append(global_id)
-                continue
-            elif (FROM_PROG.search(event) is not None
-                  and TRADE_PROG.search(event) is None
-                  and BANK_OFFER_PROG.search(event) is None):
-                # from <Y>
-                events.Trade.append(global_id)
-                errors.extend(append_relation(
-                    root, 'Elaboration', events.Trade[0], events.Trade[1]))
-                errors.extend(append_relation(
-                    root, 'Continuation', events.Trade[1], global_id))
-                cdu_offer = append_schema(
-                    root, 'Complex_discourse_unit', events.Trade)
-                global_cdu_offer = '_'.join([subdoc, cdu_offer])
-                events.Trade[0] = global_cdu_offer
-                continue
+        textname = os.path.join(folder, 'unannotated', subdoc + '.ac')
+        unitsname = os.path.join(unitsfolder, subdoc + '.aa')
+        discoursename = os.path.join(discoursefolder, subdoc + '.aa')
+        with codecs.open(textname, 'r', 'utf-8') as textfile:
+            text = textfile.read()
+        with codecs.open(unitsname, 'r', 'ascii') as unitsfile:
+            units_tree = ET.fromstring(unitsfile.read())
+        with codecs.open(discoursename, 'r', 'ascii') as discoursefile:
+            discourse_tree = ET.fromstring(discoursefile.read())
+        subdocs.append((subdoc, text, unitsname, units_tree,
+                        discoursename, discourse_tree))
+
+    if start is None:
+        dates = [0]
+        for _, _, _, units_tree, _, discourse_tree in subdocs:
+            dates.extend(_creation_dates(units_tree))
+            dates.extend(_creation_dates(discourse_tree))
+        start = max(dates)
+    init_mk_id(start)
 
-            elif BANK_OFFER_PROG.search(event) is not None:
-                # <X> made an offer to trade <M> <R1> for <N> <R2> from
-                # the bank or a port.
-                events.Trade[:] = []
-                events.Trade.append(global_id)
-                continue
+    Implicit_Relations = []
+    annotator = NonlingAnnotator()
 
-            elif CantRegEx.search(event) is not None:
-                # You can't make that trade.
-                errors.extend(append_relation(
-                    root, 'Question-answer_pair', events.Trade[0], global_id))
-                # this message does not clear the pending trade offer,
-                # it just means that the trade can't be made right now
-                # for example, if the offering player is in a building phase,
-                # the addressee needs to wait until the offering player is
-                # done, but the trade offer is accepted afterwards
-                # ex: s1-league2-game1, turns 423..425
-                # events.Trade[:] = []
-                continue
+    for (subdoc, text, unitsname, units_tree,
+         discoursename, discourse_tree) in subdocs:
+        units_root = annotator.add_units_annotations(units_tree, text)
+        errors = annotator.add_discourse_annotations(discourse_tree, text,
+                                                     subdoc)
+        Implicit_Relations.extend(errors)
 
-            elif TRADE_PROG.search(event) is not None:
-                # <X> traded <M> <R1> for <N> <R2> from <Y>.
-                errors.extend(append_relation(
-                    root, 'Question-answer_pair', events.Trade[0], global_id))
-                events.Trade[:] = []
-                continue
+        with codecs.open(unitsname, 'w', 'ascii') as out:
+            out.write(prettify(units_root))
+        with codecs.open(discoursename, 'w', 'ascii') as out:
+            out.write(prettify(discourse_tree))
 
-            elif RejectRegEx.search(event) is not None:
-                # <Y> rejected trade offer.
-                errors.extend(append_relation(
-                    root, 'Question-answer_pair', events.Trade[0], global_id))
-                events.Trade[:] = []
-                continue
+    if Implicit_Relations != []:
+        error_report = '\n'.join(Implicit_Relations)
+        filename = os.path.join(folder, 'Implicit_Relations.txt')
+        with codecs.open(filename, 'w', 'ascii') as out:
+            out.write(error_report)
 
-            # Monopoly events
+    return name, N, len(Implicit_Relations) // 2
 
-            elif CardRegEx.search(event) is not None:
-                # <X> played a Monopoly card.
-                if events.Monopoly != "":
-                    raise Exception("add_discourse_annotations : la chaîne MonopolyEvent n'a pas été vidée!")
-                events.Monopoly = global_id
-                continue
 
-            elif MonopolyRegEx.search(event) is not None:
-                # <X> monopolized <R>.
-                errors.extend(append_relation(
-                    root, 'Sequence', events.Monopoly, global_id))
-                events.Monopoly = ""
-                continue
+def _annotate_game(job):
+    "worker: `annotate_game` on a (folder, metal, start) tuple"
+    return annotate_game(*job)
 
 
+def find_games(folder, metal):
+    """Game folders to annotate: the folder itself if it is a game
+    with the given version, else all such games directly inside it
     """
-    For resources distributions, we complete the XML tree and empty the
-    list at the next dice roll.
-    So for the last turn we may have forgotten to annotate some events.
-    """
-    if len(events.Dice) > 0:
-        if len(events.Dice) == 2: # Resource distribution : 1 player
-            errors.extend(append_relation(
-                root, 'Result', events.Dice[0], events.Dice[1]))
-        else: # Resource Distribution : 2 or more players
-            cdu_dice = append_schema(
-                root, 'Complex_discourse_unit', events.Dice[1:])
-            global_cdu_dice = '_'.join([subdoc, cdu_dice])
-            errors.extend(append_relation(
-                root, 'Result', events.Dice[0], global_cdu_dice))
-            for i in range(1, len(events.Dice) - 1):
-                errors.extend(append_relation(
-                    root, 'Continuation', events.Dice[i], events.Dice[i+1]))
-        events.Dice[:] = []
-
-    return root, events, errors
+    if os.path.isdir(os.path.join(folder, 'units', metal)):
+        return [folder]
+    return [os.path.join(folder, d) for d in sorted(os.listdir(folder))
+            if os.path.isdir(os.path.join(folder, d, 'units', metal))]
 
 
 # ---------------------------------------------------------------------
@@ -850,65 +929,43 @@ def main():
 
     #ligne de commande : python nonling_annotations.py ../../data/pilot_nonling/test/pilot14/ SILVER
 
-    init_mk_id()
-
     parser = argparse.ArgumentParser()
 
-    parser.add_argument('folder', help='folder where the files to annotate are')
+    parser.add_argument('folder', nargs='+',
+                        help=('folder where the files to annotate are '
+                              '(a game, or a folder of games)'))
     parser.add_argument('metal', help=('version of the game you want to '
                                        'annotate (ex: GOLD)'))
+    parser.add_argument('--start', type=int,
+                        help=('starting timestamp for the new annotations '
+                              '(default: after the latest one in each '
+                              'game)'))
+    parser.add_argument('--jobs', '-j', metavar='N', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='number of games to annotate in parallel')
 
     args = parser.parse_args()
-    folder = os.path.abspath(args.folder)
-    metal = args.metal
-    name = os.path.basename(folder)
-
-    unitsfolder = os.path.join(folder, 'units', metal)
-    discoursefolder = os.path.join(folder, 'discourse', metal)
-
-    N = len(os.listdir(unitsfolder)) / 2
 
-    Implicit_Relations = []
-    events = Events()
-
-    for i in range(1, N+1):
-        e = events
-
-        subdoc = name + '_%02d' % i
-
-        textname = os.path.join(folder, 'unannotated', subdoc + '.ac')
-        unitsname = os.path.join(unitsfolder, subdoc + '.aa')
-        discoursename = os.path.join(discoursefolder, subdoc + '.aa')
-        textfile = codecs.open(textname, 'r', 'utf-8')
-        unitsfile = codecs.open(unitsname, 'r', 'ascii')
-        discoursefile = codecs.open(discoursename, 'r', 'ascii')
-
-        text = textfile.read()
-        stringtree_units = unitsfile.read()
-        units_tree = ET.fromstring(stringtree_units)
-        stringtree_discourse = discoursefile.read()
-        discourse_tree = ET.fromstring(stringtree_discourse)
-
-        units_root = add_units_annotations(units_tree, text)
-        discourse_root, events, errors = add_discourse_annotations(
-            discourse_tree, text, e, subdoc)
-
-        Implicit_Relations.extend(errors)
-
-        with codecs.open(unitsname, 'w', 'ascii') as out:
-            out.write(prettify(units_root))
-        with codecs.open(discoursename, 'w', 'ascii') as out:
-            out.write(prettify(discourse_root))
-
-        textfile.close()
-        unitsfile.close()
-        discoursefile.close()
-
-    if Implicit_Relations != []:
-        error_report = '\n'.join(Implicit_Relations)
-        filename = os.path.join(folder, 'Implicit_Relations.txt')
-        with codecs.open(filename, 'w', 'ascii') as out:
-            out.write(error_report)
+    games = []
+    for folder in args.folder:
+        games.extend(find_games(folder, args.metal))
+    if not games:
+        sys.exit('No games to annotate with version ' + args.metal)
+
+    jobs = [(game, args.metal, args.start) for game in games]
+    if args.jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(args.jobs, len(jobs)))
+        try:
+            results = list(pool.imap_unordered(_annotate_game, jobs))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_annotate_game(job) for job in jobs]
+    if len(results) > 1:
+        for name, nb_subdocs, nb_implicit in sorted(results):
+            print('{}: {} subdocs, {} implicit relations'.format(
+                name, nb_subdocs, nb_implicit), file=sys.stderr)
 
 
 if __name__ == '__main__':
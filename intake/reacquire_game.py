@@ -10,12 +10,15 @@ from __future__ import print_function
 import argparse
 import csv
 from glob import glob
+import multiprocessing
 import os
 import subprocess
 import sys
 
 from educe.stac.annotation import TurnId
 
+from corpus_batch import (run_batch, timed)
+
 
 # path to the folder containing the intake scripts (including this one)
 PATH_TO_INTAKE = os.path.dirname(os.path.abspath(__file__))
@@ -369,7 +372,8 @@ def transfer_turns(file_orig, file_dest):
     os.rename(file_res, file_dest)
 
 
-def augment_game(dir_orig, dir_dest, doc, gen, steps='all', seg_path=''):
+def augment_game(dir_orig, dir_dest, doc, gen, steps='all', seg_path='',
+                 timings=None):
     """Do the augmentation
 
     Parameters
@@ -392,6 +396,9 @@ def augment_game(dir_orig, dir_dest, doc, gen, steps='all', seg_path=''):
     seg_path : string, optional
         Path to the segmented file we should use ; This is necessary when
         there are more than one file under segmented/.
+    timings : dict, optional
+        If given, record there the time spent on each step (intake1,
+        intake2, weave, symlinks), in seconds.
     """
     # 1. locate original folder (existing version of the game) with files:
     # * for identical copy: soclog, pos-tagged, parsed
@@ -478,77 +485,90 @@ def augment_game(dir_orig, dir_dest, doc, gen, steps='all', seg_path=''):
     seg_dest = os.path.join(doc_dir_dest, 'segmented',
                             doc + '.soclog.seg.csv')
     if steps in ['all', 'intake1']:
-        # intake-1
-        # * creates dir_dest/{soclog,unsegmented,segmented}
-        # * copies soclog
-        # * calls intake/soclogtocsv to extract unsegmented
-        # * creates .aam file
-        # * calls segmentation/simple-segments to presegment automatically
-        # into segmented
-        intake1_cmd = [os.path.join(PATH_TO_INTAKE, 'intake-1.sh'),
-                       soclog_orig, doc, str(gen), "batch"]
-        subprocess.check_call(intake1_cmd)
-
-        # reinject edited lines from the previous version into the newly
-        # extracted one ; this transfers crappy manual editions as well
-        # as (the intended) segmentation
-        # 1. reinject edited text from old to new `unsegmented`
-        print('== Transfer edited turns from {} to {} =='.format(
-            useg_orig, useg_dest))
-        transfer_turns(useg_orig, useg_dest)
-        # 2. reinject edited text and segmentation from old to new
-        # `segmented`
-        print('== Transfer edited turns from {} to {} =='.format(
-            seg_orig, seg_dest))
-        transfer_turns(seg_orig, seg_dest)
-        # 3. reinject edited text from new `segmented` to new `unsegmented`
-        # so that they match and intake-2 does not complain
-        print('== Conform turn text from {} to {} =='.format(
-            seg_dest, useg_dest))
-        backport_turn_text(seg_dest, useg_dest)
-
-        # read doc portioning from segmented
-        portion_idx = read_portioning(seg_orig)
-        if len(portion_idx) == 1:
-            # no portioning in segmented: infer from the glozz files
-            # a doc split takes place immediately before the first turn of
-            # the next section
-            # FIXME maybe it should rather split after its last turn?
-            portion_idx = infer_portioning(udis_dir_orig)
-            backport_portioning(seg_dest, portion_idx)
+        with timed(timings, 'intake1'):
+            # intake-1
+            # * creates dir_dest/{soclog,unsegmented,segmented}
+            # * copies soclog
+            # * calls intake/soclogtocsv to extract unsegmented
+            # * creates .aam file
+            # * calls segmentation/simple-segments to presegment automatically
+            # into segmented
+            intake1_cmd = [os.path.join(PATH_TO_INTAKE, 'intake-1.sh'),
+                           soclog_orig, doc, str(gen), "batch"]
+            subprocess.check_call(intake1_cmd)
+
+            # reinject edited lines from the previous version into the newly
+            # extracted one ; this transfers crappy manual editions as well
+            # as (the intended) segmentation
+            # 1. reinject edited text from old to new `unsegmented`
+            print('== Transfer edited turns from {} to {} =='.format(
+                useg_orig, useg_dest))
+            transfer_turns(useg_orig, useg_dest)
+            # 2. reinject edited text and segmentation from old to new
+            # `segmented`
+            print('== Transfer edited turns from {} to {} =='.format(
+                seg_orig, seg_dest))
+            transfer_turns(seg_orig, seg_dest)
+            # 3. reinject edited text from new `segmented` to new `unsegmented`
+            # so that they match and intake-2 does not complain
+            print('== Conform turn text from {} to {} =='.format(
+                seg_dest, useg_dest))
+            backport_turn_text(seg_dest, useg_dest)
+
+            # read doc portioning from segmented
+            portion_idx = read_portioning(seg_orig)
+            if len(portion_idx) == 1:
+                # no portioning in segmented: infer from the glozz files
+                # a doc split takes place immediately before the first turn of
+                # the next section
+                # FIXME maybe it should rather split after its last turn?
+                portion_idx = infer_portioning(udis_dir_orig)
+                backport_portioning(seg_dest, portion_idx)
 
     if steps in ['all', 'intake2']:
-        # intake-2: segmented => unannotated aa/ac
-        intake2_cmd = [os.path.join(PATH_TO_INTAKE, 'intake-2.sh'),
-                       # this argument should be seg_dest
-                       # and subprocess.check_call() should not have any 'cwd'
-                       # parameter, but the current version of intake-2 writes
-                       # its files into the current working directory...
-                       os.path.join('segmented', doc + '.soclog.seg.csv'),
-                       str(gen)]
-        subprocess.check_call(intake2_cmd, cwd=doc_dir_dest)
+        with timed(timings, 'intake2'):
+            # intake-2: segmented => unannotated aa/ac
+            intake2_cmd = [os.path.join(PATH_TO_INTAKE, 'intake-2.sh'),
+                           # this argument should be seg_dest
+                           # and subprocess.check_call() should not have
+                           # any 'cwd' parameter, but the current version
+                           # of intake-2 writes its files into the current
+                           # working directory...
+                           os.path.join('segmented', doc + '.soclog.seg.csv'),
+                           str(gen)]
+            subprocess.check_call(intake2_cmd, cwd=doc_dir_dest)
 
     # move back to the original working dir to call the weaving script
     os.chdir(caller_cwd)
     if steps in ['all', 'weave']:
-        # weaving
-        weave_cmd = ['stac-oneoff', 'weave',
-                     dir_dest, dir_orig,
-                     '--gen', str(gen),
-                     '--doc', doc,
-                     '--annotator', '[GOLD|SILVER|BRONZE]',
-                     '-o', dir_dest]
-        subprocess.check_call(weave_cmd)
+        with timed(timings, 'weave'):
+            # weaving
+            weave_cmd = ['stac-oneoff', 'weave',
+                         dir_dest, dir_orig,
+                         '--gen', str(gen),
+                         '--doc', doc,
+                         '--annotator', '[GOLD|SILVER|BRONZE]',
+                         '-o', dir_dest]
+            subprocess.check_call(weave_cmd)
 
     # create symlinks to unannotated/*.ac in each of the subdirs in
     # discourse and units
-    for ac_path in glob(doc_dir_dest + '/unannotated/*.ac'):
-        for tgt_dir in ['discourse', 'units']:
-            for subdir in glob('{}/{}/*/'.format(doc_dir_dest, tgt_dir)):
-                os.symlink(
-                    os.path.relpath(ac_path, subdir),
-                    os.path.join(subdir, os.path.basename(ac_path))
-                )
+    with timed(timings, 'symlinks'):
+        for ac_path in glob(doc_dir_dest + '/unannotated/*.ac'):
+            for tgt_dir in ['discourse', 'units']:
+                for subdir in glob('{}/{}/*/'.format(doc_dir_dest, tgt_dir)):
+                    os.symlink(
+                        os.path.relpath(ac_path, subdir),
+                        os.path.join(subdir, os.path.basename(ac_path))
+                    )
+
+
+def corpus_docs(dir_orig):
+    """Games of the annotated corpus that we can re-acquire (those with
+    a soclog folder)
+    """
+    return sorted(d for d in os.listdir(dir_orig)
+                  if os.path.isdir(os.path.join(dir_orig, d, 'soclog')))
 
 
 def main():
@@ -560,8 +580,19 @@ def main():
                         help='folder of the annotated corpus')
     parser.add_argument('dir_dest', metavar='DIR',
                         help='folder for the augmented corpus')
-    parser.add_argument('doc', metavar='DOC',
-                        help='document')
+    parser.add_argument('doc', metavar='DOC', nargs='*',
+                        help='document(s)')
+    # whole corpus
+    parser.add_argument('--all', action='store_true',
+                        help='re-acquire all the games in dir_orig')
+    parser.add_argument('--jobs', '-j', metavar='N', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='number of games to process in parallel '
+                        '(with several games or --all)')
+    parser.add_argument('--log-dir', metavar='DIR',
+                        default='reacquire_game.logs',
+                        help='where to keep the completion log and output '
+                        'of each game (with several games or --all)')
     # select generation
     parser.add_argument('--gen', metavar='N', type=int, default=2,
                         help='max generation of turns to include (1, 2, 3)')
@@ -575,10 +606,31 @@ def main():
     parser.add_argument('--segmented', metavar='FILE',
                         help='segmented file to use (if >1 in segmented/)')
     args = parser.parse_args()
-    # do the job
-    augment_game(args.dir_orig, args.dir_dest, args.doc, args.gen,
-                 steps=args.steps,
-                 seg_path=args.segmented)
+    docs = corpus_docs(args.dir_orig) if args.all else args.doc
+    if not docs:
+        parser.error('no document given (nor --all)')
+    if len(docs) == 1 and not args.all:
+        # do the job
+        augment_game(args.dir_orig, args.dir_dest, docs[0], args.gen,
+                     steps=args.steps,
+                     seg_path=args.segmented)
+        return
+    if args.segmented:
+        parser.error('--segmented only makes sense with a single document')
+    # several games: each worker moves to dir_dest, so we create it here
+    dir_orig = os.path.abspath(args.dir_orig)
+    dir_dest = os.path.abspath(args.dir_dest)
+    if not os.path.isdir(dir_dest):
+        os.mkdir(dir_dest)
+    results = run_batch(augment_game, docs,
+                        lambda doc: (dir_orig, dir_dest, doc, args.gen),
+                        os.path.abspath(args.log_dir),
+                        {'gen': args.gen, 'steps': args.steps,
+                         'dir_dest': dir_dest},
+                        jobs=args.jobs,
+                        kwargs={'steps': args.steps})
+    if any(r.status != 'ok' for r in results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,196 @@
+"""Byte offset index of the game segments of a soclog.
+
+A soclog for a full game runs to thousands of lines, most of which
+tools interested in a particular part of the game have to skip over.
+The index records where (in bytes, from the start of the file) the
+lines marking the game boundaries start:
+
+* `start_game`: `SOCStartGame` lines (there are usually two of them,
+  opening and closing the block of lines that sets up the game)
+* `turns`: `SOCTurn` lines, which start each player's game turn,
+  along with the player number
+* `dice_prompts`: Server messages saying it is somebody's "turn to
+  roll the dice"
+
+so that one can seek straight to eg. the 10th game turn instead of
+scanning the soclog from the start.
+
+The index is saved as JSON next to whatever other files are produced
+for the soclog (see `soclogtocsv_batch.py`), and records the size
+and modification time of the soclog it was built from, so that
+`load_index` can tell if it is stale.
+"""
+
+from __future__ import print_function
+
+import argparse
+import io
+import json
+import os
+import re
+import sys
+
+INDEX_VERSION = 1
+
+_TURN = re.compile(br':SOCTurn:game=[^|]+\|playerNumber=(?P<plnb>[0-9]+)')
+_START_GAME = b':SOCStartGame:'
+_DICE_PROMPT = re.compile(br'\|nickname=Server\|text=.*'
+                          br' turn to roll the dice')
+
+
+def _stamp(soclog_path):
+    "(size, mtime) of the soclog, to check if an index is out of date"
+    stat = os.stat(soclog_path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def index_soclog(soclog_path, contents=None):
+    """Build the index for a soclog (see module docstring).
+
+    Parameters
+    ----------
+    soclog_path : string
+        Path to the soclog
+    contents : bytes, optional
+        Contents of the soclog, if the caller has already read them
+        (otherwise, we read the file)
+
+    Returns
+    -------
+    index : dict
+        Index, with the offsets of each kind of line in increasing
+        order (`turns` are `[offset, player number]` pairs)
+    """
+    index = {
+        'version': INDEX_VERSION,
+        'soclog': os.path.abspath(soclog_path),
+        'stamp': _stamp(soclog_path),
+        'start_game': [],
+        'turns': [],
+        'dice_prompts': [],
+    }
+    offset = 0
+    if contents is None:
+        soclog = open(soclog_path, 'rb')
+    else:
+        soclog = io.BytesIO(contents)
+    with soclog:
+        for line in soclog:
+            if _START_GAME in line:
+                index['start_game'].append(offset)
+            elif b':SOCTurn:' in line:
+                match = _TURN.search(line)
+                if match:
+                    index['turns'].append([offset,
+                                           int(match.group('plnb'))])
+            elif (b'turn to roll the dice' in line and
+                  _DICE_PROMPT.search(line)):
+                index['dice_prompts'].append(offset)
+            offset += len(line)
+    index['size'] = offset
+    return index
+
+
+def index_name(soclog_path):
+    """Default file name for the index of a soclog"""
+    return os.path.basename(soclog_path) + '.index.json'
+
+
+def save_index(index, index_path):
+    """Write the index for a soclog to a JSON file"""
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w') as ostream:
+        json.dump(index, ostream, indent=1)
+    os.rename(tmp_path, index_path)
+
+
+def is_fresh(index):
+    """True if the soclog has not changed since the index was built"""
+    try:
+        return (index.get('version') == INDEX_VERSION and
+                index['stamp'] == _stamp(index['soclog']))
+    except OSError:
+        return False
+
+
+def load_index(index_path, soclog_path=None):
+    """Read the index for a soclog, rebuilding (and saving) it if
+    it is missing or out of date.
+
+    Parameters
+    ----------
+    index_path : string
+        Path to the index
+    soclog_path : string, optional
+        Path to the soclog, in case we need to build the index from
+        scratch (default: whichever soclog the saved index refers to)
+    """
+    index = None
+    if os.path.exists(index_path):
+        with open(index_path) as istream:
+            index = json.load(istream)
+        if soclog_path is not None and\
+           index.get('soclog') != os.path.abspath(soclog_path):
+            index = None
+    if index is None or not is_fresh(index):
+        if soclog_path is None and index is not None:
+            soclog_path = index['soclog']
+        if soclog_path is None:
+            raise ValueError('No soclog to rebuild index {} from'.format(
+                index_path))
+        index = index_soclog(soclog_path)
+        save_index(index, index_path)
+    return index
+
+
+def turn_segments(index):
+    """Byte ranges of each game turn in the soclog ::
+
+        Index -> [(Int, Int, Int)]
+
+    Each game turn is given as `(player number, start, end)`, from its
+    `SOCTurn` line up to (excluding) the next one, or the end of the
+    file for the last turn. Everything before the first turn (joining,
+    sitting down, setting up the board, placing the initial pieces...)
+    is not included.
+    """
+    turns = index['turns']
+    ends = [offset for offset, _ in turns[1:]] + [index['size']]
+    return [(plnb, start, end) for (start, plnb), end in zip(turns, ends)]
+
+
+def read_segment(soclog_path, start, end):
+    """Lines of the soclog between two byte offsets (as returned by
+    `turn_segments`, or taken from the index) ::
+
+        (FilePath, Int, Int) -> [String]
+    """
+    with open(soclog_path, 'rb') as soclog:
+        soclog.seek(start)
+        chunk = soclog.read(end - start)
+    return io.StringIO(chunk.decode('utf-8')).readlines()
+
+
+def main():
+    """
+    Build indices for soclogs given on the command line
+    """
+    psr = argparse.ArgumentParser(description='index game turn boundaries '
+                                  'in soclog files')
+    psr.add_argument('soclog', metavar='FILE', nargs='+')
+    psr.add_argument('--output-dir', metavar='DIR',
+                     help=('where to save the indices (default: next to '
+                           'each soclog)'))
+    args = psr.parse_args()
+
+    for soclog_path in args.soclog:
+        index = index_soclog(soclog_path)
+        out_dir = args.output_dir or os.path.dirname(soclog_path)
+        save_index(index, os.path.join(out_dir,
+                                       index_name(soclog_path)))
+        print('{}: {} game turns'.format(soclog_path, len(index['turns'])),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -32,11 +32,13 @@ from __future__ import print_function
 
 import argparse
 import codecs
+import io
 from collections import namedtuple, OrderedDict
 from itertools import chain
 import re
 import string
 import sys
+import time
 
 from educe.stac.util import stac_csv_format as stac_csv
 
@@ -319,6 +321,9 @@ class State(namedtuple('State',
 EMPTY_STATE = State(OrderedDict(), OrderedDict())
 
 
+_BUILDUP_VALUE = re.compile(r'^\[(.*)\]$')
+
+
 def parse_state(snippet):
     """
     From a substring soclog entry to some slightly higher level
@@ -331,7 +336,7 @@ def parse_state(snippet):
         if value.isdigit():
             resources[key] = value
             continue
-        num_match = re.match(r'^\[(.*)\]$', value)
+        num_match = _BUILDUP_VALUE.match(value)
         if num_match:
             nums = num_match.group(1).split(',')
             buildups[key] = nums
@@ -341,6 +346,17 @@ def parse_state(snippet):
     return State(resources, buildups)
 
 
+# 2017-03-21 ugly local fix to undo escaping of stars (MM);
+# another solution would be to use re.escape() in the expression
+# for SERVER_RE, but we are in a hurry and I am worried about
+# potential side effects
+_EVENT_PHRASES = [(gen_key, [(x.replace(r'\*', '*')
+                              .replace(r'\,', ','))
+                             for x in gen_events])
+                  for gen_key, gen_events in EVENTS.items()]
+# end ugly local fix
+
+
 def guess_generation(event):
     """
     Given an event string, determine what generation of this
@@ -351,15 +367,7 @@ def guess_generation(event):
     gen : Gen
         Generation this event belongs to.
     """
-    for gen_key, gen_events in EVENTS.items():
-        # 2017-03-21 ugly local fix to undo escaping of stars (MM);
-        # another solution would be to use re.escape() in the expression
-        # for SERVER_RE, but we are in a hurry and I am worried about
-        # potential side effects
-        gen_events = [(x.replace(r'\*', '*')
-                       .replace(r'\,', ','))
-                      for x in gen_events]
-        # end ugly local fix
+    for gen_key, gen_events in _EVENT_PHRASES:
         if any(x in event for x in gen_events):
             gen = gen_key
             break
@@ -383,6 +391,259 @@ def mk_turn(turn_id, timestamp, speaker, text, state=None):
                          comment=YUCK)
 
 
+# ---------------------------------------------------------------------
+# non-linguistic events (3rd gen onwards)
+# ---------------------------------------------------------------------
+
+# Each event is handled by a small function ::
+#
+#     (NonlingEvent, Dict String String, Dict, String) -> Either None String
+#
+# which takes the fields matched by the regex for the event, the parsing
+# state (which it may update) and the previous line, and returns the
+# text of the UI turn to generate for this line (None if there should
+# not be one)
+
+
+def _render_event(evt, evt_fields, parsing_state):
+    "fill in the message template for the event"
+    # if a player name is expected but the soclog line only
+    # provides a player number, map it
+    if 'name' in evt.fnames and 'name' not in evt_fields:
+        if 'plnb' in evt_fields:
+            # use player name instead of number, in the generated
+            # message
+            pl_nb = evt_fields['plnb']
+            evt_fields['name'] = parsing_state['plnb2name'][pl_nb]
+        else:
+            raise ValueError("Fail to find required player name")
+    return evt.template.format(**evt_fields)
+
+
+def _render_event_default(evt, evt_fields, parsing_state, _):
+    "just fill in the message template (no special handling)"
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_game_state(evt, evt_fields, parsing_state, _):
+    "keep only the first 'game state 0'"
+    game_state_cur = parsing_state.get('game_state')
+    game_state_nxt = evt_fields['game_state']
+    # update parsing state
+    parsing_state['game_state'] = game_state_nxt
+    if game_state_nxt != '0' or game_state_nxt == game_state_cur:
+        return None
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_start_game(evt, evt_fields, parsing_state, _):
+    "keep only the first 'start game'"
+    if 'start game' in parsing_state:
+        return None
+    parsing_state['start game'] = True
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_join_game(evt, evt_fields, parsing_state, _):
+    "keep only the latest 'join game' event"
+    if evt_fields['host'] != 'dummyhost':
+        return None
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_sit_down(evt, evt_fields, parsing_state, _):
+    "sit down and remember the player's name"
+    # sit down generates two messages, the first one with
+    # nickname "dummy" should be ignored
+    if evt_fields['name'] == 'dummy':
+        return None
+    # store mapping from player number to nickname
+    pl_nb = evt_fields['plnb']
+    pl_name = evt_fields['name']
+    if 'plnb2name' not in parsing_state:
+        parsing_state['plnb2name'] = dict()
+    parsing_state['plnb2name'][pl_nb] = pl_name
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_begin_turn(_, evt_fields, parsing_state, __):
+    "remember whose turn it is (no message)"
+    pl_nb = evt_fields['plnb']
+    parsing_state['cur_plnb'] = pl_nb
+    pl_name = parsing_state['plnb2name'][pl_nb]
+    parsing_state['cur_name'] = pl_name
+    return None
+
+
+def _on_end_turn(evt, evt_fields, parsing_state, _):
+    "end the turn of the current player"
+    # retrieve name of current player from context
+    evt_fields['name'] = parsing_state['cur_name']
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_clear_offer(_, evt_fields, parsing_state, __):
+    "remember who is trying to trade (no message)"
+    # store the last player involved in this type of event
+    # so we know which player is trying to trade (useful to
+    # display an informative message for failed trades)
+    pl_nb = evt_fields['plnb']
+    if pl_nb != '-1':
+        pl_name = parsing_state['plnb2name'][pl_nb]
+        parsing_state['offering_player'] = pl_name
+    return None
+
+
+def _on_make_offer(evt, evt_fields, parsing_state, _):
+    "addressees of an offer (second occurrence of the line only)"
+    make_offer_cur = parsing_state.get('make_offer', False)
+    if not make_offer_cur:
+        # mark the first occurrence of the "make offer" event
+        # as seen, don't generate any message
+        parsing_state['make_offer'] = True
+        return None
+    # second occurrence: prepare message
+    pls_tgt = evt_fields['pls_tgt']
+    tgt_idc = [i for i, x in enumerate(pls_tgt.split(','))
+               if x == 'true']
+    evt_fields['names_tgt'] = 'or '.join(
+        parsing_state['plnb2name'][str(i)]
+        for i in tgt_idc)
+    # and discharge the "make offer" marker
+    parsing_state['make_offer'] = False
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _nonzero_resources(snippet):
+    "'clay=0|ore=1|...' to eg. '1 ore'"
+    res = []
+    for x in snippet.split('|'):
+        resource, qty = x.split('=')
+        if int(qty) > 0:
+            res.append((resource, int(qty)))
+    return ', '.join('{} {}'.format(qty, resource)
+                     for resource, qty in res)
+
+
+def _on_bank_trade(evt, evt_fields, parsing_state, _):
+    "trade with the bank or a port"
+    # prepare clean information for message
+    evt_fields['give_nz'] = _nonzero_resources(evt_fields['give'])
+    evt_fields['get_nz'] = _nonzero_resources(evt_fields['get'])
+    # retrieve player name from context
+    evt_fields['name'] = parsing_state['offering_player']
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_reject_offer(evt, evt_fields, parsing_state, line_prev):
+    "reject an offer (first occurrence of the line only)"
+    # reject offer generates two identical messages, the
+    # second one should be ignored
+    if evt.regex.search(line_prev):
+        return None
+    return _render_event(evt, evt_fields, parsing_state)
+
+
+def _on_resource_count(_, evt_fields, parsing_state, __):
+    "accumulate resource counts (no message, see `parse_line`)"
+    # the soclog contains one line per player ; accumulate
+    # them, then generate a UI message after the Server msg
+    # on resource distribution
+    min_plnb = min(int(x) for x
+                   in parsing_state['plnb2name'].keys())
+    pl_nb = evt_fields['plnb']
+    if pl_nb == str(min_plnb):
+        parsing_state['res_cnt'] = dict()
+    parsing_state['res_cnt'][pl_nb] = int(evt_fields['res_cnt'])
+    return None
+
+
+def _on_player_scores(_, evt_fields, parsing_state, __):
+    "score of each player"
+    pl_scores = evt_fields['scores'].split('|')
+    msg_fields = []
+    for pl_nb in sorted(parsing_state['plnb2name'].keys(), key=int):
+        msg_fields.append(
+            '{pl_name} has {pl_sc} points.'.format(
+                pl_name=parsing_state['plnb2name'][pl_nb],
+                pl_sc=pl_scores[int(pl_nb)])
+        )
+    return ' '.join(msg_fields)
+
+
+_EVENT_HANDLERS = {
+    'game state': _on_game_state,
+    'join game': _on_join_game,
+    'sit down': _on_sit_down,
+    'start game': _on_start_game,
+    'begin turn': _on_begin_turn,
+    'end turn': _on_end_turn,
+    'clear offer': _on_clear_offer,
+    'make offer': _on_make_offer,
+    'bank trade': _on_bank_trade,
+    'reject offer': _on_reject_offer,
+    'resource_count': _on_resource_count,
+    'player_scores': _on_player_scores,
+}
+
+
+class NonlingEvent(namedtuple('NonlingEvent',
+                              'gen key anchor regex template fnames '
+                              'handler')):
+    """
+    A precompiled entry from OTHER_EVENTS, EVENTS_GEN4 or EVENTS_GEN5
+
+    The anchor is the SOC message type at the start of the regex (eg.
+    `SOCMakeOffer`): a line cannot match the event unless it contains
+    the anchor
+    """
+
+
+def _mk_nonling_events():
+    "compile the non-linguistic event table (in order of generation)"
+    events = []
+    for gen, evt_dict in [(3, OTHER_EVENTS),
+                          (4, EVENTS_GEN4),
+                          (5, EVENTS_GEN5)]:
+        for key, (evt_re, evt_msg) in evt_dict.items():
+            fnames = frozenset(name for _, name, _, _
+                               in string.Formatter().parse(evt_msg))
+            events.append(NonlingEvent(
+                gen=gen,
+                key=key,
+                anchor=re.match(r'SOC\w+', evt_re).group(0),
+                regex=re.compile(evt_re),
+                template=evt_msg,
+                fnames=fnames,
+                handler=_EVENT_HANDLERS.get(key, _render_event_default)))
+    return events
+
+
+NONLING_EVENTS = _mk_nonling_events()
+
+# non-linguistic events that could match a line, by SOC message type
+# (filled in lazily, see `_candidate_events`)
+_EVENTS_BY_TYPE = {}
+
+
+def _candidate_events(line, msg_type):
+    """
+    Non-linguistic events that could match a line, given its SOC
+    message type (the token after the timestamp)
+    """
+    if line.count('SOC') != msg_type.count('SOC'):
+        # there is an SOC message type name somewhere in the rest
+        # of the line: the events could match anywhere, so we have
+        # to look for them everywhere
+        return [e for e in NONLING_EVENTS if e.anchor in line]
+    try:
+        return _EVENTS_BY_TYPE[msg_type]
+    except KeyError:
+        events = [e for e in NONLING_EVENTS if e.anchor in msg_type]
+        _EVENTS_BY_TYPE[msg_type] = events
+        return events
+
+
 def parse_line(ctr, line, sel_gen=3, parsing_state=None):
     """Parse timestamped line.
 
@@ -422,11 +683,14 @@ def parse_line(ctr, line, sel_gen=3, parsing_state=None):
     # YYYY:MM:DD:HH:MM:SS:mmm:+HHMM
     # here, we keep only part of it, forgetting the year, month, day
     # and signed UTC offset
-    timestamp = line.split(":+", 1)[0]
+    timestamp, _, rest = line.partition(":+")
     timestamp = ":".join(timestamp.split(":")[-4:])
+    msg_type = rest.split(":", 2)[1] if ":" in rest else ""
 
     # server message
-    match_server = SERVER.search(line)
+    # (the literal checks just save us from running the regexes on
+    # lines that cannot possibly match them)
+    match_server = 'Server|text=' in line and SERVER.search(line)
     if match_server:
         event = match_server.group("event")
         gen = guess_generation(event)
@@ -478,7 +742,7 @@ def parse_line(ctr, line, sel_gen=3, parsing_state=None):
         return turns
 
     # player message
-    match_player = PLAYER.search(line)
+    match_player = '|speaking-queue=[]|' in line and PLAYER.search(line)
     if match_player:
         gen = 1
         ctr.incr_at_gen(gen)
@@ -490,236 +754,84 @@ def parse_line(ctr, line, sel_gen=3, parsing_state=None):
                     match_player.group("text"),
                     state=state),
         ]
-    else:
-        # WIP non-ling event
-        gen = 3
-        if sel_gen < gen:
-            return None
 
-        for k, evt_re_msg in OTHER_EVENTS.items():
-            evt_re, evt_msg = evt_re_msg  # unpack the event regex and msg
-            evt_re_obj = re.compile(evt_re)
-            evt_search = evt_re_obj.search(line)
-            if not evt_search:
-                continue
-
-            # get named groups from regex
-            evt_fields = evt_search.groupdict()
-            if k == 'game state':
-                game_state_cur = parsing_state.get('game_state')
-                game_state_nxt = evt_fields['game_state']
-                # update parsing state
-                parsing_state['game_state'] = game_state_nxt
-                # keep only the first "game state 0"
-                if (game_state_nxt != '0' or
-                    game_state_nxt == game_state_cur):
-                    continue
-            elif k == 'start game':
-                # keep only the first "start game"
-                if 'start game' in parsing_state:
-                    continue
-                else:
-                    parsing_state['start game'] = True
-            elif k == 'join game':
-                # keep only the latest "join game" event
-                if evt_fields['host'] != 'dummyhost':
-                    continue
-            elif k == 'sit down':
-                # sit down generates two messages, the first one with
-                # nickname "dummy" should be ignored
-                if evt_fields['name'] == 'dummy':
-                    continue
-                # store mapping from player number to nickname
-                pl_nb = evt_fields['plnb']
-                pl_name = evt_fields['name']
-                if 'plnb2name' not in parsing_state:
-                    parsing_state['plnb2name'] = dict()
-                parsing_state['plnb2name'][pl_nb] = pl_name
-            elif k == 'begin turn':
-                pl_nb = evt_fields['plnb']
-                parsing_state['cur_plnb'] = pl_nb
-                pl_name = parsing_state['plnb2name'][pl_nb]
-                parsing_state['cur_name'] = pl_name
-                continue
-            elif k == 'end turn':
-                # retrieve name of current player from context
-                evt_fields['name'] = parsing_state['cur_name']
-            elif k == 'clear offer':
-                # store the last player involved in this type of event
-                # so we know which player is trying to trade (useful to
-                # display an informative message for failed trades)
-                pl_nb = evt_fields['plnb']
-                if pl_nb != '-1':
-                    pl_name = parsing_state['plnb2name'][pl_nb]
-                    parsing_state['offering_player'] = pl_name
-                continue
-            elif k == 'make offer':
-                make_offer_cur = parsing_state.get('make_offer', False)
-                if not make_offer_cur:
-                    # mark the first occurrence of the "make offer" event
-                    # as seen, don't generate any message
-                    parsing_state['make_offer'] = True
-                    continue
-                # second occurrence: prepare message
-                pls_tgt = evt_fields['pls_tgt']
-                tgt_idc = [i for i, x in enumerate(pls_tgt.split(','))
-                           if x == 'true']
-                evt_fields['names_tgt'] = 'or '.join(
-                    parsing_state['plnb2name'][str(i)]
-                    for i in tgt_idc)
-                # and discharge the "make offer" marker
-                parsing_state['make_offer'] = False
-            elif k == 'bank trade':
-                # prepare clean information for message
-                # * give
-                res_give = []
-                for x in evt_fields['give'].split('|'):
-                    resource, qty = x.split('=')
-                    if int(qty) > 0:
-                        res_give.append((resource, int(qty)))
-                evt_fields['give_nz'] = ', '.join(
-                    '{} {}'.format(qty, resource)
-                    for resource, qty in res_give
-                )
-                # * get
-                res_get = []
-                for x in evt_fields['get'].split('|'):
-                    resource, qty = x.split('=')
-                    if int(qty) > 0:
-                        res_get.append((resource, int(qty)))
-                evt_fields['get_nz'] = ', '.join(
-                    '{} {}'.format(qty, resource)
-                    for resource, qty in res_get
-                )
-                # * retrieve player name from context
-                evt_fields['name'] = parsing_state['offering_player']
-            elif k == 'reject offer':
-                reject_re_obj = re.compile(OTHER_EVENTS['reject offer'][0])
-                # reject offer generates two identical messages, the
-                # second one should be ignored
-                reject_prev = reject_re_obj.search(line_prev)
-                if reject_prev:
-                    continue
-
-            # this line matches a known pattern: generate a nonling turn
-            gen = 3
-            ctr.incr_at_gen(gen)
-            # extract the field names from the "format string"
-            msg_fnames = [name for text, name, spec, conv
-                          in string.Formatter().parse(evt_msg)]
-            # if a player name is expected but the soclog line only
-            # provides a player number, map it
-            if 'name' in msg_fnames and 'name' not in evt_fields:
-                if 'plnb' in evt_fields:
-                    # use player name instead of number, in the generated
-                    # message
-                    pl_nb = evt_fields['plnb']
-                    evt_fields['name'] = parsing_state['plnb2name'][pl_nb]
-                else:
-                    raise ValueError("Fail to find required player name")
-            return [
-                mk_turn(str(ctr),
-                        timestamp,
-                        'UI',  # custom emitter
-                        evt_msg.format(**evt_fields),  # defined text
-                        state=None),
-            ]
-        # end WIP
-
-        # 2017-03-08 trial at having a message for game state: how
-        # much resources each player has, after the resource distribution
-        # following a dice roll
-        gen = 4
-        if sel_gen < gen:
-            return None
+    # non-ling events: 3rd gen (OTHER_EVENTS), 2017-03-08 4th gen
+    # trial at having a message for game state (how much resources each
+    # player has after the resource distribution following a dice roll,
+    # see above), 2017-03-22 5th gen message to display the score of
+    # each player
+    for evt in _candidate_events(line, msg_type):
+        if evt.gen > sel_gen:
+            break
+        evt_search = evt.regex.search(line)
+        if not evt_search:
+            continue
+        # get named groups from regex
+        text = evt.handler(evt, evt_search.groupdict(), parsing_state,
+                           line_prev)
+        if text is None:
+            continue
+        # this line matches a known pattern: generate a nonling turn
+        ctr.incr_at_gen(evt.gen)
+        return [
+            mk_turn(str(ctr),
+                    timestamp,
+                    'UI',  # custom emitter
+                    text,
+                    state=None),
+        ]
 
-        for k, evt_re_msg in EVENTS_GEN4.items():
-            evt_re, evt_msg = evt_re_msg  # unpack the event regex and msg
-            evt_re_obj = re.compile(evt_re)
-            evt_search = evt_re_obj.search(line)
-            if not evt_search:
-                continue
-
-            # get named groups from regex
-            evt_fields = evt_search.groupdict()
-            if k == 'resource_count':
-                # the soclog contains one line per player ; accumulate
-                # them, then generate a UI message after the Server msg
-                # on resource distribution
-                min_plnb = min(int(x) for x
-                               in parsing_state['plnb2name'].keys())
-                pl_nb = evt_fields['plnb']
-                if pl_nb == str(min_plnb):
-                    parsing_state['res_cnt'] = dict()
-                parsing_state['res_cnt'][pl_nb] = int(evt_fields['res_cnt'])
-                continue
-
-        # 2017-03-22 new message to display the score of each player
-        gen = 5
-        if sel_gen < gen:
-            return None
+    # last resort case
+    return None
 
-        for k, evt_re_msg in EVENTS_GEN5.items():
-            evt_re, evt_msg = evt_re_msg  # unpack the event regex and msg
-            evt_re_obj = re.compile(evt_re)
-            evt_search = evt_re_obj.search(line)
-            if not evt_search:
-                continue
-
-            # get named groups from regex
-            evt_fields = evt_search.groupdict()
-            if k == 'player_scores':
-                pl_scores = evt_fields['scores'].split('|')
-                sorted_pl_names = [pl_name for pl_nb, pl_name in sorted(
-                    parsing_state['plnb2name'].items(),
-                    key=lambda kv: int(kv[0]))]
-                msg_fields = []
-                for pl_nb in sorted(parsing_state['plnb2name'].keys(),
-                                    key=int):
-                    msg_fields.append(
-                        '{pl_name} has {pl_sc} points.'.format(
-                            pl_name=parsing_state['plnb2name'][pl_nb],
-                            pl_sc=pl_scores[int(pl_nb)])
-                    )
-                msg = ' '.join(msg_fields)
-            # generate turn with the previously built message
-            # (simpler than for gen3 because it was simpler to directly
-            # build the final message)
-            ctr.incr_at_gen(gen)
-            return [
-                mk_turn(str(ctr),
-                        timestamp,
-                        'UI',  # custom emitter
-                        msg,
-                        state=None)
-            ]
-        # end gen5
-
-        # last resort case
-        return None
 
+class SoclogConverter(object):
+    """
+    Incremental soclog to Turn conversion: feed it the soclog a line
+    (or a chunk of text) at a time, as it comes, and get back the
+    turns for whatever it has seen so far.
 
-def soclog_to_turns(soclog, sel_gen=3):
-    """Generator from soclog to Turn objects.
+    The turn counter and parsing state are kept from one call to the
+    next, so feeding a soclog in pieces gives the same turns as
+    converting it in one go (`soclog_to_turns`).
+
+    Spectator messages (gen2) take their timestamp from the line that
+    follows them; rather than block waiting for it, we just hold on to
+    the message until the next line comes in.
 
     Parameters
     ----------
-    soclog : File
-        The soclog file
     sel_gen : int, optional
-        Select generation for the extraction script: 1st gen corresponds
-        to intake scripts until 2016-01, gen2 adds spectator messages,
-        gen3 is for situated communication.
+        Max generation to include (see `soclog_to_turns`)
     """
-    # WIP keep parsing state ; currently stores mapping from player number
-    # to name
-    parsing_state = dict()
-
-    ctr = TurnCounter()
-    for line in soclog:
+    def __init__(self, sel_gen=3):
+        self.sel_gen = sel_gen
+        self.ctr = TurnCounter()
+        # WIP keep parsing state ; currently stores mapping from player
+        # number to name
+        self.parsing_state = dict()
+        self._spectator = None
+        self._partial = u''
+
+    @property
+    def pending(self):
+        """True if we are holding on to some input (a spectator
+        message, an incomplete line) we cannot convert yet
+        """
+        return self._spectator is not None or bool(self._partial)
+
+    def feed_line(self, line):
+        """Turns for a single line of the soclog ::
+
+            String -> [Turn]
+        """
+        if self._spectator is not None:
+            # the line after a spectator message is only there to
+            # give it a timestamp (we won't use it anyway)
+            return [self._spectator_turn(line)]
         line = line.strip()
         if not line:
-            continue
+            return []
         # line: <timestamp>:<SOCevent>:<description>
         # timestamp is in fact formatted as
         # year:month:day:hour:min:sec:millisec:timezone
@@ -732,43 +844,169 @@ def soclog_to_turns(soclog, sel_gen=3):
 
         if len(timestamp_ht) == 2:
             # timestamped line
-            turns = parse_line(ctr, line, sel_gen=sel_gen,
-                              parsing_state=parsing_state)
-            if turns is not None:
-                for turn in turns:
-                    yield turn
+            turns = parse_line(self.ctr, line, sel_gen=self.sel_gen,
+                               parsing_state=self.parsing_state)
+            return turns or []
         elif len(timestamp_ht) == 1:
             # non-timestamped lines were included from gen2 on
             gen = 2
-            if sel_gen < gen:
-                continue
+            if self.sel_gen < gen:
+                return []
             # gen2 linguistic info: spectator messages
             match_spect = SPECTATOR.search(line)
             if match_spect:
-                # get timestamp from the next line (we won't use it anyway)
-                next_line = next(soclog)
-                timestamp = next_line.split(":+", 1)[0]
-                timestamp = ":".join(timestamp.split(":")[-4:])
-                # increase counter, 2nd generation
-                ctr.incr_at_gen(gen)
-                # these messages have no game state
-                state = EMPTY_STATE
-                # create turn
-                turn = stac_csv.Turn(number=str(ctr),
-                                     timestamp=timestamp,
-                                     emitter=match_spect.group("name"),
-                                     res=state.resources_string() or YUCK,
-                                     builds=state.buildups_string() or YUCK,
-                                     rawtext=match_spect.group(
-                                         "text").replace('&', r'\&'),
-                                     annot=YUCK,
-                                     comment=YUCK)
-                yield turn
+                # wait for the next line for the timestamp
+                self._spectator = match_spect
+                return []
             else:
                 raise ValueError("Weird line with no timestamp: " + line)
         else:
             raise ValueError("You should not be here")
 
+    def _spectator_turn(self, next_line):
+        "turn for the pending spectator message"
+        match_spect = self._spectator
+        self._spectator = None
+        gen = 2
+        timestamp = next_line.split(":+", 1)[0]
+        timestamp = ":".join(timestamp.split(":")[-4:])
+        # increase counter, 2nd generation
+        self.ctr.incr_at_gen(gen)
+        # these messages have no game state
+        state = EMPTY_STATE
+        return stac_csv.Turn(number=str(self.ctr),
+                             timestamp=timestamp,
+                             emitter=match_spect.group("name"),
+                             res=state.resources_string() or YUCK,
+                             builds=state.buildups_string() or YUCK,
+                             rawtext=match_spect.group(
+                                 "text").replace('&', r'\&'),
+                             annot=YUCK,
+                             comment=YUCK)
+
+    def feed(self, text):
+        """Turns for a chunk of the soclog, which need not end on a
+        line boundary (any incomplete line at the end is held back
+        until the rest of it is fed in) ::
+
+            String -> [Turn]
+        """
+        lines = (self._partial + text).split(u'\n')
+        self._partial = lines.pop()
+        turns = []
+        for line in lines:
+            turns.extend(self.feed_line(line + u'\n'))
+        return turns
+
+
+def soclog_to_turns(soclog, sel_gen=3):
+    """Generator from soclog to Turn objects.
+
+    Parameters
+    ----------
+    soclog : File
+        The soclog file
+    sel_gen : int, optional
+        Select generation for the extraction script: 1st gen corresponds
+        to intake scripts until 2016-01, gen2 adds spectator messages,
+        gen3 is for situated communication.
+    """
+    converter = SoclogConverter(sel_gen=sel_gen)
+    for line in soclog:
+        for turn in converter.feed_line(line):
+            yield turn
+
+
+def follow_soclog(soclog, sel_gen=3, poll_interval=0.1, idle_timeout=None):
+    """Generator from a soclog that is still being written to (eg. by
+    the game server) to Turn objects, like `tail -f`.
+
+    We yield the turns for each line as soon as it is complete, and
+    otherwise check for more lines every `poll_interval` seconds (so
+    turns come out at most that long after their line is written).
+
+    Parameters
+    ----------
+    soclog : File
+        The soclog file, opened for reading (in text mode)
+    sel_gen : int, optional
+        Max generation to include (see `soclog_to_turns`)
+    poll_interval : float, optional
+        Seconds to wait before checking again when there is nothing
+        new in the soclog
+    idle_timeout : float, optional
+        Stop if nothing has been added to the soclog for this many
+        seconds (default: follow forever)
+    """
+    converter = SoclogConverter(sel_gen=sel_gen)
+    last_seen = time.time()
+    while True:
+        chunk = soclog.readline()
+        if chunk:
+            last_seen = time.time()
+            for turn in converter.feed(chunk):
+                yield turn
+            continue
+        if (idle_timeout is not None and
+                time.time() - last_seen >= idle_timeout):
+            return
+        time.sleep(poll_interval)
+
+
+def write_turns(turns, output):
+    """Write turns out as CSV (with a header).
+
+    Parameters
+    ----------
+    turns : iterable of Turn
+        Turns to write
+    output : File
+        Where to write the CSV (opened in binary mode)
+
+    Returns
+    -------
+    nb_turns : int
+        Number of turns (CSV rows) written
+    """
+    outcsv = stac_csv.mk_csv_writer(output)
+    outcsv.writeheader()
+    nb_turns = 0
+    for turn in turns:
+        outcsv.writerow(turn.to_dict())
+        nb_turns += 1
+    return nb_turns
+
+
+def convert_soclog(soclog_path, output, sel_gen=3):
+    """Convert a soclog file to CSV (see `write_turns`)"""
+    with codecs.open(soclog_path, 'r', 'utf-8') as soclog:
+        return write_turns(soclog_to_turns(soclog, sel_gen=sel_gen),
+                           output)
+
+
+def benchmark(soclog_path, sel_gen=3, repeat=3):
+    """Time the conversion of a soclog file (without writing it out).
+
+    The file is read into memory first so that we only measure the
+    parsing itself.
+
+    Returns
+    -------
+    lines_per_sec : float
+        Number of soclog lines converted per second (best of `repeat`
+        runs)
+    """
+    with codecs.open(soclog_path, 'r', 'utf-8') as soclog:
+        lines = soclog.readlines()
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        for _ in soclog_to_turns(iter(lines), sel_gen=sel_gen):
+            pass
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(lines) / max(best, 1e-9)
+
 
 def main():
     """
@@ -782,13 +1020,41 @@ def main():
                      default=sys.stdout)
     psr.add_argument('--gen', metavar='N', type=int, default=3,
                      help='generation of turns to include (1, 2, 3)')
+    psr.add_argument('--benchmark', metavar='N', type=int,
+                     help=('do not write anything; just convert the '
+                           'soclog N times and report the number of '
+                           'lines per second'))
+    psr.add_argument('--follow', action='store_true',
+                     help=('keep reading the soclog as it grows '
+                           '(like tail -f), writing out each turn as '
+                           'soon as we see it'))
+    psr.add_argument('--poll', metavar='SECS', type=float, default=0.1,
+                     help=('with --follow, how often to check the '
+                           'soclog for new lines (default: 0.1)'))
+    psr.add_argument('--idle-timeout', metavar='SECS', type=float,
+                     help=('with --follow, stop when the soclog has not '
+                           'grown for this long (default: never)'))
     args = psr.parse_args()
 
-    with codecs.open(args.soclog, 'r', 'utf-8') as soclog:
-        outcsv = stac_csv.mk_csv_writer(args.output)
-        outcsv.writeheader()
-        for turn in soclog_to_turns(soclog, sel_gen=args.gen):
-            outcsv.writerow(turn.to_dict())
+    if args.benchmark:
+        lines_per_sec = benchmark(args.soclog, sel_gen=args.gen,
+                                  repeat=args.benchmark)
+        print('{:.0f} lines/s'.format(lines_per_sec), file=sys.stderr)
+        return
+
+    if args.follow:
+        with io.open(args.soclog, 'r', encoding='utf-8') as soclog:
+            outcsv = stac_csv.mk_csv_writer(args.output)
+            outcsv.writeheader()
+            args.output.flush()
+            for turn in follow_soclog(soclog, sel_gen=args.gen,
+                                      poll_interval=args.poll,
+                                      idle_timeout=args.idle_timeout):
+                outcsv.writerow(turn.to_dict())
+                args.output.flush()
+        return
+
+    convert_soclog(args.soclog, args.output, sel_gen=args.gen)
 
 
 if __name__ == '__main__':
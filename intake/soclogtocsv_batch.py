@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Convert a whole batch of soclog files (eg. a season) to CSV, in
+parallel.
+
+This does what running `soclogtocsv.py` on each file would, but with
+a pool of worker processes, and without paying for starting up Python
+for each file. Each soclog is read once, however many generations we
+ask for, and that same read also gives us a byte offset index of the
+game turn boundaries (see `soclog_index.py`), which we save alongside
+the CSV files.
+
+The soclogs can be given on the command line, or as a mapping file
+in the format expected by `intake-1-batch.sh` (`clean-name,soclog` on
+each line; as for that script, relative soclog paths are relative to
+the current directory).
+"""
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+from soclog_index import (index_name, index_soclog, save_index)
+from soclogtocsv import (soclog_to_turns, write_turns)
+
+
+def read_mapping(mapping_path):
+    """(clean name, soclog path) pairs from a mapping file
+
+    The soclog paths are returned as written: like `intake-1-batch.sh`,
+    we take relative paths to be relative to the current directory
+    (not to the mapping file)
+    """
+    pairs = []
+    with open(mapping_path) as istream:
+        for line in istream:
+            line = line.strip()
+            if not line:
+                continue
+            clean, original = line.split(',', 1)
+            pairs.append((clean, original))
+    return pairs
+
+
+def clean_name(soclog_path):
+    """Default name for the outputs of a soclog"""
+    bname = os.path.basename(soclog_path)
+    if bname.endswith('.soclog'):
+        bname = bname[:-len('.soclog')]
+    return bname
+
+
+def csv_path(output_dir, name, gen, gens):
+    """Where to write the CSV for a soclog, for the given generation
+    (we only mention the generation in the file name if we are doing
+    more than one)
+    """
+    if len(gens) == 1:
+        fname = name + '.soclog.csv'
+    else:
+        fname = '{}.gen{}.soclog.csv'.format(name, gen)
+    return os.path.join(output_dir, fname)
+
+
+def convert_one(job):
+    """Convert one soclog to CSV for each of the generations asked for,
+    and index it
+
+    Parameters
+    ----------
+    job : (string, string, string, [int])
+        Name, soclog path, output directory, generations
+
+    Returns
+    -------
+    res : (string, [int], int)
+        Name, number of turns for each generation, number of game turns
+    """
+    name, soclog_path, output_dir, gens = job
+    with open(soclog_path, 'rb') as soclog:
+        contents = soclog.read()
+    # same lines as codecs.open(...).readlines() would give
+    lines = contents.decode('utf-8').splitlines(True)
+    counts = []
+    for gen in gens:
+        with open(csv_path(output_dir, name, gen, gens), 'wb') as output:
+            counts.append(write_turns(soclog_to_turns(iter(lines),
+                                                      sel_gen=gen),
+                                      output))
+    index = index_soclog(soclog_path, contents=contents)
+    save_index(index, os.path.join(output_dir, index_name(name + '.soclog')))
+    return name, counts, len(index['turns'])
+
+
+def main():
+    """
+    Parse CLI args, convert all the soclogs
+    """
+    psr = argparse.ArgumentParser(description='soclog to CSV segmentation '
+                                  'files, for many soclogs at once')
+    psr.add_argument('soclog', metavar='FILE', nargs='*')
+    psr.add_argument('--mapping', metavar='FILE',
+                     help='mapping file (clean-name,soclog per line)')
+    psr.add_argument('--output-dir', metavar='DIR', required=True)
+    psr.add_argument('--gen', metavar='N', type=int, nargs='+',
+                     default=[3],
+                     help=('generation(s) of turns to include (1, 2, 3); '
+                           'with more than one, we write one CSV per '
+                           'generation'))
+    psr.add_argument('--jobs', '-j', metavar='N', type=int,
+                     default=multiprocessing.cpu_count(),
+                     help='number of soclogs to convert in parallel')
+    args = psr.parse_args()
+
+    soclogs = [(clean_name(f), f) for f in args.soclog]
+    if args.mapping:
+        soclogs.extend(read_mapping(args.mapping))
+    if not soclogs:
+        sys.exit('No soclogs to convert (see --help)')
+    if not os.path.exists(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    jobs = [(name, soclog_path, args.output_dir, args.gen)
+            for name, soclog_path in soclogs]
+    if args.jobs > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(args.jobs, len(jobs)))
+        try:
+            results = list(pool.imap_unordered(convert_one, jobs))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [convert_one(job) for job in jobs]
+    for name, counts, nb_game_turns in sorted(results):
+        print('{}: {} turns ({}), {} game turns'.format(
+            name,
+            ', '.join(str(c) for c in counts),
+            ', '.join('gen {}'.format(g) for g in args.gen),
+            nb_game_turns), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
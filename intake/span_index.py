@@ -0,0 +1,137 @@
+"""Sorted interval index over the annotations of a document.
+
+The intake scripts that align two versions of a game (eg.
+`split_annotated.py`) keep asking which units lie within a turn, which
+turns overlap or enclose an EDU, and so on. Answering these by looping
+over `doc.units` is quadratic on large games. A `SpanIndex` answers
+them in logarithmic time (plus the number of results).
+
+The annotations are sorted by span, and we keep a segment tree over the
+sorted list with the smallest and largest end of the spans in each
+subtree: this lets us skip whole subtrees that cannot hold a match.
+
+The queries follow the educe definitions, ie. for spans `x` and `q`:
+
+* `overlapping(q)`: `x.overlaps(q)` (some characters in common, ie.
+  `max(starts) < min(ends)`; so never an empty span, and nothing for
+  an empty `q`)
+* `covering(q)`: `x.encloses(q)`
+* `contained_in(q)`: `q.encloses(x)`
+
+The index does not notice if the spans of the annotations are modified
+afterwards; build a new one if you do.
+"""
+
+from bisect import bisect_left, bisect_right
+
+
+def _text_span(anno):
+    "default key: the text span of an annotation"
+    return anno.text_span()
+
+
+class SpanIndex(object):
+    """
+    Index of annotations by span (see module docstring)
+
+    Parameters
+    ----------
+    annos : iterable of Annotation
+        Annotations to index
+
+    key : function from Annotation to Span, optional
+        Span of an annotation (default: its `text_span()`)
+
+    Results are returned in order of span (start, then end), and in
+    their original order for identical spans.
+    """
+    def __init__(self, annos, key=_text_span):
+        items = []
+        for i, anno in enumerate(annos):
+            span = key(anno)
+            items.append((span.char_start, span.char_end, i, anno))
+        items.sort(key=lambda x: x[:3])
+        self._annos = [x[3] for x in items]
+        self._starts = [x[0] for x in items]
+        self._ends = [x[1] for x in items]
+        # segment tree: node 1 is the root, the children of node k are
+        # 2k and 2k+1, leaf i is node size+i
+        size = 1
+        while size < len(items):
+            size *= 2
+        self._size = size
+        inf = float('inf')
+        self._min_end = [inf] * (2 * size)
+        self._max_end = [-inf] * (2 * size)
+        for i, end in enumerate(self._ends):
+            self._min_end[size + i] = end
+            self._max_end[size + i] = end
+        for node in range(size - 1, 0, -1):
+            self._min_end[node] = min(self._min_end[2 * node],
+                                      self._min_end[2 * node + 1])
+            self._max_end[node] = max(self._max_end[2 * node],
+                                      self._max_end[2 * node + 1])
+
+    def __len__(self):
+        return len(self._annos)
+
+    def __iter__(self):
+        return iter(self._annos)
+
+    def _search(self, lo, hi, keep):
+        """(Sorted) positions in [lo, hi) of the annotations whose end
+        passes the `keep(min_end, max_end)` test (which must also
+        tell if any end in a subtree could pass it)
+        """
+        res = []
+        if lo >= hi:
+            return res
+        stack = [(1, 0, self._size)]
+        while stack:
+            node, nlo, nhi = stack.pop()
+            if nhi <= lo or hi <= nlo or\
+               not keep(self._min_end[node], self._max_end[node]):
+                continue
+            if nhi - nlo == 1:
+                res.append(nlo)
+                continue
+            mid = (nlo + nhi) // 2
+            # right first, so that we pop (and output) left first
+            stack.append((2 * node + 1, mid, nhi))
+            stack.append((2 * node, nlo, mid))
+        return res
+
+    def overlapping(self, span):
+        """Annotations that have some characters in common with
+        the span ::
+
+            Span -> [Annotation]
+        """
+        if span.char_start >= span.char_end:
+            return []
+        hi = bisect_left(self._starts, span.char_end)
+        found = self._search(0, hi,
+                             lambda _, max_end: max_end > span.char_start)
+        return [self._annos[i] for i in found
+                if self._starts[i] < self._ends[i]]
+
+    def covering(self, span):
+        """Annotations that enclose the span ::
+
+            Span -> [Annotation]
+        """
+        hi = bisect_right(self._starts, span.char_start)
+        found = self._search(0, hi,
+                             lambda _, max_end: max_end >= span.char_end)
+        return [self._annos[i] for i in found]
+
+    def contained_in(self, span):
+        """Annotations that are enclosed in the span ::
+
+            Span -> [Annotation]
+        """
+        lo = bisect_left(self._starts, span.char_start)
+        hi = bisect_right(self._starts, span.char_end)
+        found = self._search(lo, hi,
+                             lambda min_end, _: min_end <= span.char_end)
+        return [self._annos[i] for i in found]
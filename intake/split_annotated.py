@@ -8,7 +8,9 @@ import argparse
 import copy
 from glob import glob
 import itertools
+import multiprocessing
 import os
+import sys
 
 import educe.glozz
 from educe.annotation import (RelSpan, Schema, Span)
@@ -16,6 +18,9 @@ from educe.stac.annotation import (addressees, DIALOGUE_ACTS, is_edu,
                                    is_turn)
 from educe.stac.corpus import write_annotation_file
 
+from corpus_batch import (run_batch, timed)
+from span_index import SpanIndex
+
 
 DIALOGUE_ACTS = DIALOGUE_ACTS + ['Strategic_comment']
 # copied from educe.stac.edit.cmd.split_edu
@@ -69,12 +74,13 @@ def fix_likely_annotation_errors(anno_doc, verbose=1):
         Same document but filtered.
     """
     # units
+    edu_index = SpanIndex(x for x in anno_doc.units if is_edu(x))
     anno_units_err = [
         x for x in anno_doc.units
         if (x.span.char_start == x.span.char_end or
             (is_empty_dialogue_act(x) and
-             any(y.encloses(x) for y in anno_doc.units
-                 if y.text_span() != x.text_span() and is_edu(y))))
+             any(y.text_span() != x.text_span()
+                 for y in edu_index.covering(x.text_span()))))
     ]
     # schemas
     anno_schms_err = [
@@ -115,14 +121,14 @@ def fix_likely_annotation_errors(anno_doc, verbose=1):
                           if x not in anno_relas_err]
 
     # fix span of units that overflow from their turn
-    turns = [x for x in anno_doc.units if is_turn(x)]
+    turn_index = SpanIndex(x for x in anno_doc.units if is_turn(x))
     edus = [x for x in anno_doc.units if is_edu(x)]
     for edu in edus:
-        enclosing_turns = [x for x in turns if x.encloses(edu)]
+        enclosing_turns = turn_index.covering(edu.text_span())
         if len(enclosing_turns) == 1:
             continue
 
-        overlapping_turns = [x for x in turns if x.overlaps(edu)]
+        overlapping_turns = turn_index.overlapping(edu.text_span())
         if len(overlapping_turns) != 1:
             raise ValueError('No unique overlapping turn for {}'.format(edu))
         turn = overlapping_turns[0]
@@ -208,18 +214,24 @@ def infer_resegmentation(unanno_doc, anno_doc, verbose=0):
     cautious_map = dict()
     new_cdus = []
 
+    u_edu_index = SpanIndex((x for x in unanno_doc.units if is_edu(x)),
+                            key=lambda x: x.span)
+    a_edu_index = SpanIndex((x for x in anno_doc.units if is_edu(x)),
+                            key=lambda x: x.span)
+    # the relation endpoints never change (only how we map them)
+    rels_ends = [x for rel in anno_doc.relations
+                 for x in [rel.source, rel.target]]
+
     turns = [x for x in unanno_doc.units if is_turn(x)]
     for turn in turns:
         # `unannotated` was the starting point for the annotation process
-        u_edus = [x for x in unanno_doc.units
-                  if is_edu(x) and turn.span.encloses(x.span)]
+        u_edus = u_edu_index.contained_in(turn.span)
         u_ids = set(x.local_id() for x in u_edus)
 
         # `annotated` is the result of the annotation process
         # find conflicts, as pair-wise overlaps between annotations
         # from `annotated`
-        a_edus = [x for x in anno_doc.units
-                  if is_edu(x) and turn.span.encloses(x.span)]
+        a_edus = a_edu_index.contained_in(turn.span)
         # 1. map new segments to their original equivalent, backporting
         # dialogue act annotation
         dup_items = [(elt_a, elt_b) for elt_a, elt_b
@@ -258,9 +270,10 @@ def infer_resegmentation(unanno_doc, anno_doc, verbose=0):
                         if elt_a.overlaps(elt_b)]
 
         # * Two cases are very close: EDU merges, and CDUs
-        rels_support = set(anno_map.get(x, x)
-                           for rel in anno_doc.relations
-                           for x in [rel.source, rel.target])
+        # (we only need to know which EDUs support a relation if there
+        # are conflicts, which most turns don't have)
+        rels_support = (set(anno_map.get(x, x) for x in rels_ends)
+                        if pw_conflicts else set())
         edu_merges = []  # list of (list of elt_a, elt_b)
         cdu_guess = []  # list of (list of elt_a, elt_b)
         for elt_b, pairs in itertools.groupby(pw_conflicts,
@@ -347,7 +360,7 @@ def infer_resegmentation(unanno_doc, anno_doc, verbose=0):
                  approximate_cover(sorted_b, elt_a))):
                 edu_splits[elt_a] = sorted_b
         pw_conflicts = [(elt_a, elt_b) for elt_a, elt_b in pw_conflicts
-                        if elt_a not in set(edu_splits.keys())]
+                        if elt_a not in edu_splits]
         # map the split segment to the first of the resulting EDUs + mark
         for elt_a, elts_b in edu_splits.items():
             map_items = [(elt_a, elts_b[0])]
@@ -403,7 +416,7 @@ def infer_resegmentation(unanno_doc, anno_doc, verbose=0):
     return anno_doc
 
 
-def split_annotated(dir_orig, doc, verbose=0):
+def split_annotated(dir_orig, doc, verbose=0, timings=None):
     """Do the split
 
     Parameters
@@ -412,6 +425,9 @@ def split_annotated(dir_orig, doc, verbose=0):
         Folder of the annotated corpus
     doc : string
         Name of the document
+    timings : dict(string, float), optional
+        If given, the time spent reading, fixing, resegmenting and
+        writing files is added to it
     """
     # locate game folder
     dir_orig = os.path.abspath(dir_orig)
@@ -452,16 +468,23 @@ def split_annotated(dir_orig, doc, verbose=0):
         text_file = os.path.splitext(anno_file)[0] + '.ac'
 
         # read and filter the `annotated` file
-        anno_doc = educe.glozz.read_annotation_file(anno_file, text_file)
-        anno_doc = fix_likely_annotation_errors(anno_doc, verbose=verbose)
+        with timed(timings, 'read'):
+            anno_doc = educe.glozz.read_annotation_file(anno_file, text_file)
+        with timed(timings, 'fix'):
+            anno_doc = fix_likely_annotation_errors(anno_doc,
+                                                    verbose=verbose)
 
         # read the `unannotated` file
         unanno_file = os.path.join(unannotated_dir,
                                    os.path.basename(anno_file))
-        unanno_doc = educe.glozz.read_annotation_file(unanno_file, text_file)
+        with timed(timings, 'read'):
+            unanno_doc = educe.glozz.read_annotation_file(unanno_file,
+                                                          text_file)
 
         # infer resegmentation in `annotated`
-        anno_doc = infer_resegmentation(unanno_doc, anno_doc, verbose=verbose)
+        with timed(timings, 'resegment'):
+            anno_doc = infer_resegmentation(unanno_doc, anno_doc,
+                                            verbose=verbose)
 
         # create `units` doc from the cleaned `annotated`
         # port annotations: dialogue acts, resources, preferences
@@ -491,12 +514,13 @@ def split_annotated(dir_orig, doc, verbose=0):
 
         # dump both files
         bname = os.path.basename(os.path.splitext(anno_file)[0])
-        # discourse file
         disc_anno_file = os.path.join(disc_dir, bname + '.aa')
-        write_annotation_file(disc_anno_file, disc_doc)
-        # units file
         units_anno_file = os.path.join(units_dir, bname + '.aa')
-        write_annotation_file(units_anno_file, units_doc)
+        with timed(timings, 'write'):
+            # discourse file
+            write_annotation_file(disc_anno_file, disc_doc)
+            # units file
+            write_annotation_file(units_anno_file, units_doc)
         # create two symlinks to the same .ac file, for discourse and units
         ac_path = os.path.join(game_dir_orig, 'unannotated',
                                bname + '.ac')
@@ -544,6 +568,14 @@ def split_annotated(dir_orig, doc, verbose=0):
         print()
 
 
+def corpus_docs(dir_orig):
+    """Games of the annotated corpus that we can split (those with an
+    annotated folder)
+    """
+    return sorted(d for d in os.listdir(dir_orig)
+                  if os.path.isdir(os.path.join(dir_orig, d, 'annotated')))
+
+
 def main():
     """Split an annotated file into two files for units and discourse."""
     parser = argparse.ArgumentParser(
@@ -551,11 +583,35 @@ def main():
     )
     parser.add_argument('dir_orig', metavar='DIR',
                         help='folder of the annotated corpus')
-    parser.add_argument('doc', metavar='DOC',
-                        help='document')
+    parser.add_argument('doc', metavar='DOC', nargs='*',
+                        help='document(s)')
+    # whole corpus
+    parser.add_argument('--all', action='store_true',
+                        help='split all the games in dir_orig')
+    parser.add_argument('--jobs', '-j', metavar='N', type=int,
+                        default=multiprocessing.cpu_count(),
+                        help='number of games to process in parallel '
+                        '(with several games or --all)')
+    parser.add_argument('--log-dir', metavar='DIR',
+                        default='split_annotated.logs',
+                        help='where to keep the completion log and output '
+                        'of each game (with several games or --all)')
     args = parser.parse_args()
-    # do the job
-    split_annotated(args.dir_orig, args.doc)
+    docs = corpus_docs(args.dir_orig) if args.all else args.doc
+    if not docs:
+        parser.error('no document given (nor --all)')
+    if len(docs) == 1 and not args.all:
+        # do the job
+        split_annotated(args.dir_orig, docs[0])
+        return
+    dir_orig = os.path.abspath(args.dir_orig)
+    results = run_batch(split_annotated, docs,
+                        lambda doc: (dir_orig, doc),
+                        os.path.abspath(args.log_dir),
+                        {'dir_orig': dir_orig},
+                        jobs=args.jobs)
+    if any(r.status != 'ok' for r in results):
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -9,6 +9,7 @@ Helper functions for EDU segmentation
 """
 
 from   itertools import chain
+import multiprocessing
 import re
 import sys
 
@@ -35,23 +36,252 @@ def span_text(text, sp):
     """
     return text[sp[0]:sp[1]]
 
+# ---------------------------------------------------------------------
+# rules
+# ---------------------------------------------------------------------
+
+def _sub_re(xs):
+    return '(' + '|'.join(xs) + ')'
+
+def _mk_group(name, *args):
+    return '(?P<' + name + '>' + "".join(args) + ')'
+
+def _bracket(s):
+    return '(' + s + ')'
+
+# hmm, interesting that the turn number is considered part of the text
+# for the annotations
+DROP_TURN_PREFIX = r'^\d* : [^:]* : (.*)'
+
+# lhs things that trigger a split
+LHS_WORDS = [ 'yeah', 'sure', 'ok', 'okay', 'no(pe)?'
+            , 'right', 'well'
+            , '(sorry|apologies)'
+            , 'tch', '[ao]h well', 'uh oh'
+            ]
+LHS_PUNCT = [ ',', '\.\.\.', '!', ' -' ]
+LHS = _mk_group('prefix', r'\s*', _sub_re(LHS_WORDS), _sub_re(LHS_PUNCT))\
+    + _mk_group('suffix', '.+$')
+
+# rhs things that trigger a split
+RHS_WORDS = [ 'sorry'
+            , 'thanks'
+            , 'haha', 'doh!'
+            #, r'[:;]-?[PD\(\)/\\]'
+            ]
+RHS = _mk_group('prefix', '.+')\
+    + _mk_group('suffix', r'\s', _sub_re(RHS_WORDS), '.*$')
+
+EMPTY = r'((^$)|^[\?\.!]*$)'
+
+RESOURCE_ALLOC = r'(.* gets \d* (wheat|wood|clay|sheep|ore)[,\.])'
+# 2017-03-09 Game State message: resource count for each player
+RESOURCE_COUNT = r'(.* has \d* resource(s)?\.)'
+# end Game State message
+# gen5
+# 2017-03-21 time left Server message
+# ">>> Less than X minutes remaining. Type *ADDTIME* to
+# extend this game another Y minutes."
+TIME_LEFT = r'(>>> Less than \d+ minutes remaining[\.])'
+# 2017-03-22 final scores
+FINAL_SCORES = r'(.* has \d* points\.)'
+# end gen5 messages
+INTERJECTIONS = [ r'a+r*g*h+'
+                , 'bah'
+                , 'eww'
+                , 'huh'
+                , 'oh' # notice this cancels out the 'oh' split above
+                , 'woo'
+                , 'wow'
+                ]
+INTERJECTION = r'(^' + '|'.join(map(_bracket, INTERJECTIONS)) + '$)'
+
+# should be fused with its left neighbour
+FUSIBLE_LEFT = [r'^XXXXXXXXXXXXXX$']
+
+# should be fused with its right neighbour
+FUSIBLE_RIGHT = [RESOURCE_ALLOC, RESOURCE_COUNT, INTERJECTION, TIME_LEFT,
+                 FINAL_SCORES]
+
+# ---------------------------------------------------------------------
+# segmenter
+# ---------------------------------------------------------------------
+
+class Segmenter(object):
+    """
+    Rule based segmenter (on top of the sentence tokenizer), with all
+    of its rules compiled once and for all.
+
+    Segmenting a whole list of texts at a time (`segment_turns`,
+    `segment_texts`) also lets us spread the work over several
+    processes.
+    """
+    def __init__(self, sent_tokenizer=None):
+        self.tokenizer = sent_tokenizer or tokenizer
+        self.drop_turn_prefix = re.compile(DROP_TURN_PREFIX)
+        self.lhs_re = re.compile(LHS, flags=re.IGNORECASE)
+        self.rhs_re = re.compile(RHS, flags=re.IGNORECASE)
+        self.empty_re = re.compile(EMPTY)
+        self.fusible_left_re = re.compile('|'.join(FUSIBLE_LEFT),
+                                          flags=re.IGNORECASE)
+        self.fusible_right_re = re.compile('|'.join(FUSIBLE_RIGHT),
+                                           flags=re.IGNORECASE)
+
+    def segment_turn(self, orig_text):
+        """
+        Segment a piece of text corresponding to a STAC turn.
+        This is a segment wrapper that chops off the turn number and
+        emitter prefixes.
+        """
+        match = self.drop_turn_prefix.match(orig_text)
+        if match:
+            start = match.start(1)
+            return [shift_span(start, x)
+                    for x in self.segment(match.group(1))]
+        else:
+            return self.segment(orig_text)
+
+    def segment(self, t):
+        """
+        Given a piece of text, return a list of text spans corresponding
+        to segments of the text. The segments follow each other
+        consecutively but there may be gaps (no guarantee of adjacency)
+        """
+        spans1 = self.tokenizer.span_tokenize(t)
+        spans2 = concat([ self.resegment(t,s) for s in spans1 ])
+        spans3 = self.fuse_segments(t,spans2)
+        spans4 = ungap_segments(spans3)
+        return spans4
+
+    def segment_turns(self, texts, jobs=1):
+        """
+        `segment_turn` on each of a list of texts; with `jobs` > 1,
+        farm them out to that many worker processes
+        """
+        return self._map(_segment_turn_job, self.segment_turn, texts, jobs)
+
+    def segment_texts(self, texts, jobs=1):
+        """
+        `segment` on each of a list of texts; with `jobs` > 1, farm
+        them out to that many worker processes
+        """
+        return self._map(_segment_job, self.segment, texts, jobs)
+
+    def _map(self, job, fun, texts, jobs):
+        "apply a segmentation function to each text"
+        texts = list(texts)
+        if jobs <= 1 or len(texts) < 2:
+            return [fun(t) for t in texts]
+        pool = multiprocessing.Pool(processes=jobs,
+                                    initializer=_init_worker,
+                                    initargs=(self,))
+        try:
+            chunksize = max(1, len(texts) // (jobs * 4))
+            return pool.map(job, texts, chunksize)
+        finally:
+            pool.close()
+            pool.join()
+
+    def resegment(self, t, seg):
+        """
+        Apply hand-crafted segmentation rules. This is very crude: we hunt
+        for entries that would correspond to the left and right hand sides
+        of a split. For LHS splits, we also require a bit of separating
+        punctuation between the two sides. We also allow an arbitrary
+        number of LHS splits, whereas we only allow a single RHS split.
+        """
+        res = []
+        while True:
+            seg_start = seg[0]
+            fragment  = span_text(t,seg)
+            match = self.lhs_re.match(fragment)
+            if match:
+                # split off the prefix and try again on the rest
+                res.append(shift_span(seg_start, match.span('prefix')))
+                seg = shift_span(seg_start, match.span('suffix'))
+                continue
+            match = self.rhs_re.match(fragment)
+            if match:
+                res.append(shift_span(seg_start, match.span('prefix')))
+                res.append(shift_span(seg_start, match.span('suffix')))
+            else:
+                res.append(seg)
+            return res
+
+    def fuse_segments(self, t, xs):
+        """
+        Given a list of adjacent segments, return a list of segments
+        such that some things which have been wrongly broken into segments
+        are fused back into one.
+        """
+        def txt(idx):
+            return span_text(t,xs[idx])
+
+        res = []
+        # start of a run of segments to be fused with their right
+        # neighbour (and so on up to the next segment we emit)
+        fuse_start = None
+        i = 0
+        while i < len(xs):
+            if i + 1 == len(xs):
+                seg = xs[i]
+                i += 1
+            elif (self.empty_re.match(txt(i + 1)) or
+                  self.fusible_left_re.match(txt(i + 1))):
+                seg = (xs[i][0], xs[i + 1][1])
+                i += 2
+            elif self.fusible_right_re.match(txt(i)):
+                if fuse_start is None:
+                    fuse_start = xs[i][0]
+                i += 1
+                continue
+            else: # default case, just keep walking
+                seg = xs[i]
+                i += 1
+            if fuse_start is not None:
+                seg = (fuse_start, seg[1])
+                fuse_start = None
+            res.append(seg)
+        return res
+
+
+# worker process state for Segmenter._map
+_WORKER_SEGMENTER = None
+
+def _init_worker(segmenter):
+    global _WORKER_SEGMENTER
+    _WORKER_SEGMENTER = segmenter
+
+def _segment_turn_job(text):
+    return _WORKER_SEGMENTER.segment_turn(text)
+
+def _segment_job(text):
+    return _WORKER_SEGMENTER.segment(text)
+
+
+_DEFAULT_SEGMENTER = None
+
+def default_segmenter():
+    """
+    Segmenter with the default tokenizer (shared by the module level
+    functions below)
+    """
+    global _DEFAULT_SEGMENTER
+    if _DEFAULT_SEGMENTER is None:
+        _DEFAULT_SEGMENTER = Segmenter()
+    return _DEFAULT_SEGMENTER
+
+# ---------------------------------------------------------------------
+# module level interface
+# ---------------------------------------------------------------------
+
 def segment_turn(orig_text):
     """
     Segment a piece of text corresponding to a STAC turn.
     This is a segment wrapper that chops off the turn number and
     emitter prefixes.
     """
-    # hmm, interesting that the turn number is considered part of the text
-    # for the annotations
-    drop_turn_prefix = re.compile(r'^\d* : [^:]* : (.*)')
-    match = drop_turn_prefix.match(orig_text)
-    if match:
-        text = match.group(1)
-        post_process = lambda xs: [ shift_span(match.start(1), x) for x in xs ]
-    else:
-        text = orig_text
-        post_process = lambda x: x
-    return post_process(segment(text))
+    return default_segmenter().segment_turn(orig_text)
 
 def segment(t):
     """
@@ -59,68 +289,13 @@ def segment(t):
     to segments of the text. The segments follow each other
     consecutively but there may be gaps (no guarantee of adjacency)
     """
-    spans1 = tokenizer.span_tokenize(t)
-    spans2 = concat([ resegment(t,s) for s in spans1 ])
-    spans3 = fuse_segments(t,spans2)
-    spans4 = ungap_segments(spans3)
-    return spans4
+    return default_segmenter().segment(t)
 
 def resegment(t,seg):
     """
-    Apply hand-crafted segmentation rules. This is very crude: we hunt for
-    entries that would correspond to the left and right hand sides of a split.
-    For LHS splits, we also require a bit of separating punctuation between the
-    two sides. We also allow an arbitrary number of LHS splits, whereas we only
-    allow a single RHS split.
+    Apply hand-crafted segmentation rules (see `Segmenter.resegment`)
     """
-    seg_start = seg[0]
-    fragment  = span_text(t,seg)
-
-    def sub_re(xs):
-        return '(' + '|'.join(xs) + ')'
-
-    def mk_group(name, *args):
-        return '(?P<' + name + '>' + "".join(args) + ')'
-
-    def get_span(m,group):
-        return shift_span(seg_start,m.span(group))
-
-    def from_match(m):
-        lhs_span = get_span(m,'prefix')
-        rhs_span = get_span(m,'suffix')
-        return (lhs_span, rhs_span)
-
-    # lhs things that trigger a split
-    lhs_words = [ 'yeah', 'sure', 'ok', 'okay', 'no(pe)?'
-                , 'right', 'well'
-                , '(sorry|apologies)'
-                , 'tch', '[ao]h well', 'uh oh'
-                ]
-    lhs_punct = [ ',', '\.\.\.', '!', ' -' ]
-    lhs       = mk_group('prefix', r'\s*', sub_re(lhs_words), sub_re(lhs_punct))\
-              + mk_group('suffix', '.+$')
-    lhs_re    = re.compile(lhs, flags=re.IGNORECASE)
-    match_lhs = lhs_re.match(fragment)
-
-    # rhs things that trigger a split
-    rhs_words  = [ 'sorry'
-                 , 'thanks'
-                 , 'haha', 'doh!'
-                 #, r'[:;]-?[PD\(\)/\\]'
-                 ]
-    rhs       = mk_group('prefix', '.+')\
-              + mk_group('suffix', r'\s', sub_re(rhs_words), '.*$')
-    rhs_re    = re.compile(rhs, flags=re.IGNORECASE)
-    match_rhs = rhs_re.match(fragment)
-
-    if match_lhs:
-        (prefix, suffix)=from_match(match_lhs)
-        return [prefix] + resegment(t,suffix)
-    elif match_rhs:
-        (prefix, suffix)=from_match(match_rhs)
-        return [prefix, suffix]
-    else:
-        return [seg]
+    return default_segmenter().resegment(t, seg)
 
 def fuse_segments(t,xs):
     """
@@ -128,71 +303,7 @@ def fuse_segments(t,xs):
     such that some things which have been wrongly broken into segments
     are fused back into one.
     """
-
-    def bracket(s):
-        return '(' + s + ')'
-    def fuse(ys):
-        return (ys[0][0],ys[-1][1])
-    def txt(idx):
-        return span_text(t,xs[idx])
-
-    empty          = r'((^$)|^[\?\.!]*$)'
-    empty_re       = re.compile(empty)
-
-    resource_alloc = r'(.* gets \d* (wheat|wood|clay|sheep|ore)[,\.])'
-    # 2017-03-09 Game State message: resource count for each player
-    resource_count = r'(.* has \d* resource(s)?\.)'
-    # end Game State message
-    # gen5
-    # 2017-03-21 time left Server message
-    # ">>> Less than X minutes remaining. Type *ADDTIME* to
-    # extend this game another Y minutes."
-    time_left = r'(>>> Less than \d+ minutes remaining[\.])'
-    # 2017-03-22 final scores
-    final_scores = r'(.* has \d* points\.)'
-    # end gen5 messages
-    interjections  = [ r'a+r*g*h+'
-                     , 'bah'
-                     , 'eww'
-                     , 'huh'
-                     , 'oh' # notice this cancels out the 'oh' split above
-                     , 'woo'
-                     , 'wow'
-                     ]
-    interjection   = r'(^' + '|'.join(map(bracket, interjections)) + '$)'
-
-    # should be fused with its left neighbour
-    fusible_left     = [r'^XXXXXXXXXXXXXX$']
-    fusible_left_re  = re.compile('|'.join(fusible_left), flags=re.IGNORECASE)
-
-    # should be fused with its right neighbour
-    fusible_right = [resource_alloc, resource_count, interjection, time_left,
-                     final_scores]
-    fusible_right_re = re.compile('|'.join(fusible_right), flags=re.IGNORECASE)
-
-    if len(xs) < 2:
-        return xs
-
-    elif empty_re.match(txt(1)):
-        fused = fuse(xs[0:2])
-        return [fused] + fuse_segments(t,xs[2:])
-
-    elif fusible_left_re.match(txt(1)):
-        fused = fuse(xs[0:2])
-        return [fused] + fuse_segments(t,xs[2:])
-
-    elif fusible_right_re.match(txt(0)):
-        head  = xs[0]
-        rest  = fuse_segments(t,xs[1:])
-        if len(rest) > 0:
-            fused = fuse([head,rest[0]])
-            return [fused] + rest[1:]
-        else:
-            return [head]
-
-    else: # default case, just keep walking
-        head  = xs[0]
-        return [head] + fuse_segments(t,xs[1:])
+    return default_segmenter().fuse_segments(t, xs)
 
 def ungap_segments(xs):
     """
@@ -42,13 +42,32 @@ def dialogue_map(corpus):
     return dialogues
 
 
-def guess_doc(corpus, doc_subdoc):
+def doc_index(corpus):
+    """
+    Return a dictionary mapping (doc, subdoc) pairs to the
+    (file id, document) for that pair (if there are several,
+    the first one we come across, as with `guess_doc`)
+    """
+    index = {}
+    for key, doc in corpus.items():
+        index.setdefault((key.doc, key.subdoc), (key, doc))
+    return index
+
+
+def guess_doc(corpus, doc_subdoc, index=None):
     """
     Return the file id and document associated with the given
     global annotation ID
+
+    If you are going to be doing this a lot, pass in an `index`
+    (see `doc_index`) to avoid scanning the whole corpus each time
     """
-    matches = [(k, v) for k, v in corpus.items() if
-               (k.doc, k.subdoc) == doc_subdoc]  # live input; no subdoc
+    if index is not None:
+        match = index.get(doc_subdoc)
+        matches = [] if match is None else [match]
+    else:
+        matches = [(k, v) for k, v in corpus.items() if
+                   (k.doc, k.subdoc) == doc_subdoc]  # live input; no subdoc
     if not matches:
         raise Exception(('Found no documents with key {}'
                          '').format(doc_subdoc))
@@ -76,6 +95,38 @@ def split_id(anno_id):
     return ((doc, subdoc), suffix)
 
 
+def _split_predictions(predictions):
+    """
+    Split the ids in attelo predictions, checking that both ends
+    come from the same document ::
+
+        [(string, string, string)] ->
+        iter((string, string), string or None, string, string)
+
+    (doc/subdoc, parent local id (None for the root), child local
+    id, label). EDUs are involved in many predictions each, so we
+    only split each id once
+    """
+    memo = {}
+
+    def _split(anno_id):
+        "memoised `split_id`"
+        res = memo.get(anno_id)
+        if res is None:
+            res = split_id(anno_id)
+            memo[anno_id] = res
+        return res
+
+    for id_parent, id_child, label in predictions:
+        doc_subdoc, local_id_child = _split(id_child)
+        if id_parent == 'ROOT':
+            local_id_parent = None
+        else:
+            doc_subdoc1, local_id_parent = _split(id_parent)
+            assert doc_subdoc1 == doc_subdoc
+        yield doc_subdoc, local_id_parent, local_id_child, label
+
+
 def mk_relation(tstamp, local_id_parent, local_id_child, label):
     """
     Given a document and edu ids, create a relation
@@ -131,14 +182,12 @@ def add_predictions(tstamp, corpus, predictions):
 
     :type predictions: [(string, string, string)]
     """
-    # build dictionary from FileId to relations in that document
-    for id_parent, id_child, label in predictions:
-        if id_parent == 'ROOT':
+    index = doc_index(corpus)
+    for doc_subdoc, local_id_parent, local_id_child, label in\
+            _split_predictions(predictions):
+        if local_id_parent is None:
             continue
-        doc_subdoc1, local_id_parent = split_id(id_parent)
-        doc_subdoc2, local_id_child = split_id(id_child)
-        assert doc_subdoc1 == doc_subdoc2
-        _, doc = guess_doc(corpus, doc_subdoc1)
+        _, doc = guess_doc(corpus, doc_subdoc, index=index)
         if label != 'UNRELATED':
             doc.relations.append(mk_relation(tstamp,
                                              local_id_parent,
@@ -156,25 +205,24 @@ def remove_unseen_edus(corpus, predictions):
 
     Note that this mutates the corpus
     """
+    index = doc_index(corpus)
     unseen = {}
     # build dictionary from FileId to relations in that document
-    for id_parent, id_child, _ in predictions:
-        doc_subdoc2, local_id_child = split_id(id_child)
-        if id_parent != 'ROOT':
-            doc_subdoc1, local_id_parent = split_id(id_parent)
-            assert doc_subdoc1 == doc_subdoc2
-        key, doc = guess_doc(corpus, doc_subdoc2)
+    for doc_subdoc, local_id_parent, local_id_child, _ in\
+            _split_predictions(predictions):
+        key, doc = guess_doc(corpus, doc_subdoc, index=index)
         if key not in unseen:
             unseen[key] = set(x.local_id() for x in doc.units
                               if educe.stac.is_edu(x))
-        if id_parent != 'ROOT':
+        if local_id_parent is not None:
             unseen[key].discard(local_id_parent)
         unseen[key].discard(local_id_child)
 
     for key, doc in corpus.items():
-        if key not in unseen:
+        if not unseen.get(key):
             continue
-        edus = [x for x in doc.units if educe.stac.is_edu(x)]
-        for edu in edus:
-            if edu.local_id() in unseen[key]:
-                doc.units.remove(edu)
+        # in place: the unit list may be shared with other copies of
+        # the document (see `copy_discourse_corpus`)
+        doc.units[:] = [x for x in doc.units
+                        if not (educe.stac.is_edu(x) and
+                                x.local_id() in unseen[key])]
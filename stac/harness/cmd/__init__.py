@@ -5,7 +5,8 @@ irit-rst-dt subcommands
 # Author: Eric Kow
 # License: CeCILL-B (French BSD3)
 
-from . import (clean,
+from . import (bench_decoders,
+               clean,
                count,
                evaluate,
                gather,
@@ -26,4 +27,5 @@ SUBCOMMANDS =\
         parse,
         serve,
         stop,
+        bench_decoders,
     ]
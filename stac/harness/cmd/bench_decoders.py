@@ -0,0 +1,329 @@
+# Author: Eric Kow
+# License: CeCILL-B (French BSD3-like)
+
+"""
+time the configured parsers over documents of different sizes
+"""
+
+from __future__ import print_function
+from collections import namedtuple
+from os import path as fp
+import csv
+import multiprocessing
+import resource
+import sys
+import time
+
+from attelo.harness import (RuntimeConfig)
+from attelo.io import (Torpor)
+from attelo.table import (FAKE_ROOT_ID)
+from educe.stac.util.args import (announce_output_dir, get_output_dir)
+
+from ..harness import (IritHarness)
+from ..packed import (load_multipack)
+from ..pipeline import (latest_snap)
+from ..util import (exit_ungathered)
+
+NAME = 'bench-decoders'
+
+DEFAULT_BUCKETS = [10, 20, 40, 80, 160]
+"upper bounds (in EDUs) of the document size buckets"
+
+# pylint: disable=too-few-public-methods
+
+
+class BenchRow(namedtuple('BenchRow',
+                          ['config',
+                           'bucket',
+                           'docs',
+                           'edus',
+                           'pairs',
+                           'seconds',
+                           'peak_rss',
+                           'rss_increase'])):
+    """
+    Timings for one configuration on one bucket of documents
+
+    Parameters
+    ----------
+    edus, pairs: int
+        Total number of EDUs/candidate pairs in the bucket
+
+    seconds: float
+        Total time spent in the parser (not counting model loading)
+
+    peak_rss, rss_increase: float
+        Peak resident memory of the benchmarking process (MB), and
+        how much of it came from parsing this bucket
+    """
+    @property
+    def seconds_per_doc(self):
+        "average time per document"
+        return self.seconds / self.docs if self.docs else 0.
+
+    @property
+    def pairs_per_second(self):
+        "throughput"
+        return self.pairs / self.seconds if self.seconds else 0.
+
+
+_STATE = {}
+"""Benchmark inputs (harness, configs, buckets); set before we fork
+off the workers, which just inherit it"""
+
+
+def _maxrss():
+    "peak resident set size of this process so far (MB)"
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on Mac OS X
+    scale = 1024. * 1024 if sys.platform == 'darwin' else 1024.
+    return maxrss / scale
+
+
+def _num_edus(dpack):
+    "number of real (non-root) EDUs in a datapack"
+    return len([e for e in dpack.edus if e.id != FAKE_ROOT_ID])
+
+
+# ---------------------------------------------------------------------
+# documents
+# ---------------------------------------------------------------------
+
+
+def _bucket_labels(bounds):
+    "human readable names for buckets with the given upper bounds"
+    lows = [1] + [b + 1 for b in bounds]
+    labels = ['{}-{}'.format(lo, hi) for lo, hi in zip(lows, bounds)]
+    labels.append('{}+'.format(lows[-1]))
+    return labels
+
+
+def _bucketed(mpack, bounds, max_docs):
+    """Group the datapacks by number of EDUs ::
+
+        [(String, [DataPack])]
+    """
+    labels = _bucket_labels(bounds)
+    buckets = [[] for _ in labels]
+    for key in sorted(mpack):
+        dpack = mpack[key]
+        size = _num_edus(dpack)
+        idx = len([b for b in bounds if b < size])
+        buckets[idx].append(dpack)
+    return [(l, b[:max_docs] if max_docs else b)
+            for l, b in zip(labels, buckets) if b]
+
+
+def _truncated(dpack, size):
+    """Version of the datapack restricted to its first `size` EDUs
+    (in textual order) and the pairs between them
+    """
+    edus = sorted((e for e in dpack.edus if e.id != FAKE_ROOT_ID),
+                  key=lambda e: e.span())
+    keep = frozenset(e.id for e in edus[:size]) | frozenset([FAKE_ROOT_ID])
+    idxes = [i for i, (edu1, edu2) in enumerate(dpack.pairings)
+             if edu1.id in keep and edu2.id in keep]
+    res = dpack.selected(idxes)
+    return res._replace(edus=[e for e in res.edus if e.id in keep])
+
+
+def _synthetic(mpack, sizes, max_docs):
+    """Datapacks of exactly the given sizes, made by truncating
+    the gathered documents that are big enough ::
+
+        [(String, [DataPack])]
+    """
+    res = []
+    for size in sizes:
+        dpacks = [_truncated(mpack[k], size) for k in sorted(mpack)
+                  if _num_edus(mpack[k]) >= size]
+        if max_docs:
+            dpacks = dpacks[:max_docs]
+        if dpacks:
+            res.append((str(size), dpacks))
+        else:
+            print('[bench] no documents with at least {} EDUs'
+                  ''.format(size), file=sys.stderr)
+    return res
+
+
+# ---------------------------------------------------------------------
+# benchmark
+# ---------------------------------------------------------------------
+
+
+def _bench_job(job):
+    """Time a single configuration on a bucket of documents ::
+
+        (Int, Int) -> BenchRow
+
+    Runs in a fresh worker process so that the peak memory
+    is that of this job only (plus the shared inputs)
+    """
+    econf_idx, bucket_idx = job
+    hconf = _STATE['hconf']
+    econf = _STATE['evaluations'][econf_idx]
+    label, dpacks = _STATE['buckets'][bucket_idx]
+
+    parser = econf.parser.payload
+    cache = hconf.model_paths(econf.learner, None, econf.parser)
+    parser.fit([], [], cache=cache)  # we assume everything is cached
+
+    rss_before = _maxrss()
+    start = time.time()
+    for dpack in dpacks:
+        parser.transform(dpack)
+    seconds = time.time() - start
+    peak = _maxrss()
+    return BenchRow(config=econf.key,
+                    bucket=label,
+                    docs=len(dpacks),
+                    edus=sum(_num_edus(d) for d in dpacks),
+                    pairs=sum(len(d.pairings) for d in dpacks),
+                    seconds=seconds,
+                    peak_rss=peak,
+                    rss_increase=peak - rss_before)
+
+
+def _run_benchmark(jobs):
+    "run each job in its own worker, one at a time"
+    pool = multiprocessing.Pool(processes=1, maxtasksperchild=1)
+    try:
+        rows = []
+        for row in pool.imap(_bench_job, jobs):
+            print('[bench] {}\t{}\t{:.4f}s/doc'.format(row.config,
+                                                     row.bucket,
+                                                     row.seconds_per_doc),
+                  file=sys.stderr)
+            rows.append(row)
+        return rows
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _save_csv(rows, path):
+    "write the benchmark results"
+    with open(path, 'w') as stream:
+        writer = csv.writer(stream)
+        writer.writerow(['config', 'bucket', 'docs', 'edus', 'pairs',
+                         'seconds', 'seconds_per_doc', 'pairs_per_second',
+                         'peak_rss_mb', 'rss_increase_mb'])
+        for row in rows:
+            writer.writerow([row.config, row.bucket, row.docs, row.edus,
+                             row.pairs,
+                             '{:.4f}'.format(row.seconds),
+                             '{:.4f}'.format(row.seconds_per_doc),
+                             '{:.1f}'.format(row.pairs_per_second),
+                             '{:.1f}'.format(row.peak_rss),
+                             '{:.1f}'.format(row.rss_increase)])
+
+
+def _summary(rows, buckets):
+    """Table of seconds per document, one row per configuration and
+    one column per bucket
+    """
+    labels = [l for l, _ in buckets]
+    configs = []
+    for row in rows:
+        if row.config not in configs:
+            configs.append(row.config)
+    cells = {(r.config, r.bucket): r for r in rows}
+    width = max(len(c) for c in configs + ['config'])
+    lines = ['s/doc'.ljust(width) + ''.join(l.rjust(12) for l in labels)]
+    lines.append('-' * len(lines[0]))
+    for config in configs:
+        line = config.ljust(width)
+        for label in labels:
+            row = cells.get((config, label))
+            line += ('-' if row is None else
+                     '{:.4f}'.format(row.seconds_per_doc)).rjust(12)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+# ---------------------------------------------------------------------
+# main
+# ---------------------------------------------------------------------
+
+
+def config_argparser(psr):
+    """
+    Subcommand flags.
+
+    You should create and pass in the subparser to which the flags
+    are to be added.
+    """
+    psr.set_defaults(func=main)
+    psr.add_argument("--output", metavar="DIR",
+                     help="output directory")
+    psr.add_argument("--test", action='store_true',
+                     help="use the test data rather than the training "
+                     "data")
+    psr.add_argument("--buckets", metavar='N', type=int, nargs='+',
+                     default=DEFAULT_BUCKETS,
+                     help="upper bounds (in EDUs) of the document size "
+                     "buckets (default: %(default)s)")
+    psr.add_argument("--synthetic", metavar='N', type=int, nargs='+',
+                     help="instead of bucketing documents by size, "
+                     "truncate them to exactly these sizes (in EDUs)")
+    psr.add_argument("--max-docs", metavar='N', type=int,
+                     help="use at most this many documents per bucket")
+    psr.add_argument("--config", metavar='KEY', nargs='+',
+                     help="only benchmark these evaluation configs "
+                     "(default: all of EVALUATIONS)")
+
+
+def main(args):
+    """
+    Subcommand main.
+
+    You shouldn't need to call this yourself if you're using
+    `config_argparser`
+
+    We rely on the models saved by `irit-stac model` (in the latest
+    snapshot), so run that first.
+    """
+    snap_dir = latest_snap()
+    if not fp.exists(snap_dir):
+        sys.exit("No models to benchmark. "
+                 "Please run `irit-stac gather` and `irit-stac model`")
+    hconf = IritHarness()
+    hconf.load(RuntimeConfig.empty(), snap_dir, snap_dir)
+    paths = hconf.mpack_paths(test_data=args.test)
+    if not fp.exists(paths['edu_input']):
+        exit_ungathered()
+    mpack = load_multipack(paths['edu_input'],
+                           paths['pairings'],
+                           paths['features'],
+                           paths['vocab'],
+                           verbose=True)
+    with Torpor('preparing documents'):
+        if args.synthetic:
+            buckets = _synthetic(mpack, sorted(args.synthetic),
+                                 args.max_docs)
+        else:
+            buckets = _bucketed(mpack, sorted(args.buckets), args.max_docs)
+
+    evaluations = hconf.evaluations
+    if args.config:
+        evaluations = [e for e in evaluations if e.key in args.config]
+        unknown = set(args.config) - set(e.key for e in evaluations)
+        if unknown:
+            sys.exit('Unknown evaluation configs: ' +
+                     ', '.join(sorted(unknown)))
+
+    _STATE.update(hconf=hconf,
+                  evaluations=evaluations,
+                  buckets=buckets)
+    jobs = [(i, j) for i in range(len(evaluations))
+            for j in range(len(buckets))]
+    rows = _run_benchmark(jobs)
+
+    odir = get_output_dir(args)
+    _save_csv(rows, fp.join(odir, 'bench-decoders.csv'))
+    summary = _summary(rows, buckets)
+    with open(fp.join(odir, 'bench-decoders.txt'), 'w') as stream:
+        print(summary, file=stream)
+    print(summary)
+    announce_output_dir(odir)
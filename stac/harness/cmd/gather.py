@@ -8,17 +8,34 @@ gather features
 from __future__ import print_function
 from os import path as fp
 import os
+import sys
 
 from attelo.harness.util import call, force_symlink
+from attelo.io import (Torpor)
 
+from ..extract import (check_extraction,
+                       corpus_docs,
+                       extract_corpus,
+                       extract_corpus_sharded)
+from ..incremental import (extract_corpus_incremental)
 from ..local import (TEST_CORPUS,
                      TRAINING_CORPUS,
                      LEX_DIR,
+                     LOCAL_TMP,
                      ANNOTATORS)
+from ..packed import (save_packed_multipack)
+from ..turn_constraint import (PAIRINGS_MODES,
+                               load_pairings_mode,
+                               prune_gathered_pairs,
+                               save_pairings_mode)
 from ..util import (current_tmp, latest_tmp)
 
 NAME = 'gather'
 
+GATHER_CACHE = fp.join(LOCAL_TMP, 'gather-cache')
+"""Per-document features and manifests for incremental gathering
+(one subdirectory per corpus)"""
+
 
 def config_argparser(psr):
     """
@@ -34,19 +51,46 @@ def config_argparser(psr):
                     choices=['head', 'broadcast', 'custom'],
                     default='head',
                     help='CDUs stripping method')
+    psr.add_argument('--pairings',
+                     choices=PAIRINGS_MODES,
+                     default=None,
+                     help='candidate pairs to emit: all pairs, or only '
+                     'those that respect the turn constraint (default: '
+                     'all, or whatever the training data used if '
+                     '--skip-training)')
+    psr.add_argument('--jobs', '-j', metavar='N', type=int,
+                     default=1,
+                     help='shard the documents across this many worker '
+                     'processes (default: %(default)s)')
+    psr.add_argument('--incremental', action='store_true',
+                     help='only extract features for the documents that '
+                     'have changed since the last incremental gather '
+                     '(see GATHER_CACHE)')
+    psr.add_argument('--rebuild', action='store_true',
+                     help='with --incremental: forget what we extracted '
+                     'before and start from scratch')
+    psr.add_argument('--check-extract', metavar='N', type=int,
+                     default=0,
+                     help='first check that our feature extraction gives '
+                     'the same results as the stac-learning extract '
+                     'command line on N training documents')
     psr.set_defaults(func=main)
 
 
 def extract_features(corpus, output_dir,
-                     vocab_path=None, strip_mode=None):
+                     vocab_path=None, strip_mode=None,
+                     pairings_mode='all', jobs=1,
+                     incremental=False, rebuild=False):
     """Extract features for a corpus, dump the instances.
 
     Run feature extraction for a particular corpus; and store the
     results in the output directory. Output file name will be
     computed from the corpus file name.
 
-    This triggers two distinct processes, for pairs of EDUs then for
-    single EDUs.
+    This extracts features for pairs of EDUs then for single EDUs,
+    calling educe directly rather than going through the
+    `stac-learning extract` command line. The pair features are
+    also saved in packed form (see `stac.harness.packed`).
 
     Parameters
     ----------
@@ -60,20 +104,81 @@ def extract_features(corpus, output_dir,
         have in training)
     strip_mode: one of {'head', 'broadcast', 'custom'}
         Method to strip CDUs
+    pairings_mode: one of PAIRINGS_MODES
+        Which candidate pairs to keep in the pair features
+    jobs: int
+        Number of worker processes to shard the documents across
+    incremental: bool
+        Reuse features from previous runs for unchanged documents
+    rebuild: bool
+        If incremental, throw away any features from previous runs
+    """
+    if incremental:
+        cache_dir = fp.join(GATHER_CACHE, fp.basename(corpus))
+        extract_corpus_incremental(corpus, LEX_DIR, output_dir, ANNOTATORS,
+                                   cache_dir,
+                                   jobs=jobs,
+                                   vocab_path=vocab_path,
+                                   strip_mode=strip_mode,
+                                   rebuild=rebuild)
+    elif jobs > 1:
+        extract_corpus_sharded(corpus, LEX_DIR, output_dir, ANNOTATORS,
+                               jobs,
+                               vocab_path=vocab_path,
+                               strip_mode=strip_mode)
+    else:
+        extract_corpus(corpus, LEX_DIR, output_dir, ANNOTATORS,
+                       vocab_path=vocab_path,
+                       strip_mode=strip_mode)
+    core_path = fp.join(output_dir,
+                        fp.basename(corpus) + '.relations.sparse')
+    paths = {'edu_input': core_path + '.edu_input',
+             'pairings': core_path + '.pairings',
+             'features': core_path,
+             'vocab': vocab_path or (core_path + '.vocab')}
+    if pairings_mode == 'tc':
+        kept, total = prune_gathered_pairs(paths)
+        print('[gather] {}: kept {} of {} candidate pairs (turn '
+              'constraint)'.format(fp.basename(corpus), kept, total),
+              file=sys.stderr)
+    with Torpor('[{}] saving packed datapack'.format(fp.basename(corpus))):
+        save_packed_multipack(paths['edu_input'],
+                              paths['pairings'],
+                              paths['features'],
+                              paths['vocab'])
+
+
+def _check_extract(num_docs, strip_mode):
+    """Stop if in-process feature extraction disagrees with the
+    `stac-learning extract` command line on the first few training
+    documents (see `check_extraction`)
     """
-    # TODO: perhaps we could just directly invoke the appropriate
-    # educe module here instead of going through the command line?
-    cmd = ["stac-learning", "extract",
-           corpus,
-           LEX_DIR,
-           output_dir,
-           "--anno", ANNOTATORS]
-    if vocab_path is not None:
-        cmd.extend(['--vocabulary', vocab_path])
-    if strip_mode is not None:
-        cmd.extend(['--strip-mode', strip_mode])
-    call(cmd)
-    call(cmd + ["--single"])
+    docs = corpus_docs(TRAINING_CORPUS)[:num_docs]
+    mismatches = check_extraction(TRAINING_CORPUS, LEX_DIR, ANNOTATORS,
+                                  docs, strip_mode=strip_mode)
+    if mismatches:
+        sys.exit(('In-process feature extraction does not match '
+                  'stac-learning extract on {} (in {}); has educe '
+                  'changed?').format(', '.join(docs),
+                                     ', '.join(mismatches)))
+    print('[gather] in-process extraction matches stac-learning extract '
+          'on {} documents'.format(len(docs)), file=sys.stderr)
+
+
+def _pairings_mode(args, tdir):
+    """Pairings mode to use for this run.
+
+    When only gathering test data, we must use the same mode as
+    the training data it will be evaluated against
+    """
+    if not args.skip_training:
+        return args.pairings or 'all'
+    recorded = load_pairings_mode(tdir)
+    if args.pairings is not None and args.pairings != recorded:
+        sys.exit(("The training data in {} was gathered with --pairings "
+                  "{}; refusing to gather test data with --pairings "
+                  "{}").format(tdir, recorded, args.pairings))
+    return recorded
 
 
 def main(args):
@@ -83,11 +188,20 @@ def main(args):
     You shouldn't need to call this yourself if you're using
     `config_argparser`
     """
+    if args.check_extract > 0:
+        _check_extract(args.check_extract, args.strip_mode)
     if args.skip_training:
         tdir = latest_tmp()
+        pairings_mode = _pairings_mode(args, tdir)
     else:
         tdir = current_tmp()
-        extract_features(TRAINING_CORPUS, tdir, strip_mode=args.strip_mode)
+        pairings_mode = _pairings_mode(args, tdir)
+        extract_features(TRAINING_CORPUS, tdir, strip_mode=args.strip_mode,
+                         pairings_mode=pairings_mode,
+                         jobs=args.jobs,
+                         incremental=args.incremental,
+                         rebuild=args.rebuild)
+        save_pairings_mode(tdir, pairings_mode)
 
     if TEST_CORPUS is not None:
         vocab_path = fp.join(tdir,
@@ -95,7 +209,11 @@ def main(args):
                               '.relations.sparse.vocab'))
         extract_features(TEST_CORPUS, tdir,
                          vocab_path=vocab_path,
-                         strip_mode=args.strip_mode)
+                         strip_mode=args.strip_mode,
+                         pairings_mode=pairings_mode,
+                         jobs=args.jobs,
+                         incremental=args.incremental,
+                         rebuild=args.rebuild)
 
     with open(os.path.join(tdir, "versions-gather.txt"), "w") as stream:
         call(["pip", "freeze"], stdout=stream)
@@ -12,11 +12,12 @@ import os
 from attelo.harness.config import (DataConfig, RuntimeConfig)
 from attelo.harness.parse import (learn)
 from attelo.harness.util import (call, force_symlink)
-from attelo.io import (load_multipack, Torpor)
+from attelo.io import (Torpor)
 
 from ..harness import (IritHarness)
 from ..local import (DIALOGUE_ACT_LEARNER,
                      SNAPSHOTS)
+from ..packed import (load_multipack)
 from ..pipeline import (dact_features_path,
                         dact_model_path,
                         latest_snap,
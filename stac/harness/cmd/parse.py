@@ -35,6 +35,7 @@ from ..pipeline import\
      unannotated_stub_path,
      unannotated_dir_path,
      unseg_path)
+from ..turn_constraint import (prune_gathered_pairs)
 
 
 NAME = 'parse'
@@ -160,6 +161,13 @@ def _feature_extraction(lconf, log):
            lconf.abspath(LEX_DIR),
            lconf.tmp_dir]
     call(cmd, stderr=log)
+    # emit the same candidate pairs as the models were trained on
+    if lconf.pairings_mode == 'tc':
+        fpath = minicorpus_path(lconf) + '.relations.sparse'
+        prune_gathered_pairs({'edu_input': fpath + '.edu_input',
+                              'pairings': fpath + '.pairings',
+                              'features': fpath,
+                              'vocab': vocab_path})
 
 
 def _format_decoder_output(lconf, log):
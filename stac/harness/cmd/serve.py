@@ -3,6 +3,14 @@
 
 """
 server version of parse (soclog in, ??? out)
+
+By default, each request is a single message with the soclog lines,
+and the reply is Settlers XML. Clients can ask for another format by
+sending a two part message instead: the first part names the formats
+they accept, in order of preference (eg. `msgpack,json`), the second
+is the soclog. The reply is then also in two parts: the format we
+picked, and the output in that format (XML if we support none of the
+ones asked for).
 """
 
 from __future__ import print_function
@@ -12,6 +20,7 @@ import tempfile
 import zmq
 
 from attelo.harness.util import makedirs
+from stac.settlers_xml import (FORMATS)
 
 from . import parse as p
 from ..pipeline import (StandaloneParser,
@@ -30,19 +39,26 @@ _DEBUG = 0
 # ---------------------------------------------------------------------
 
 
-def xml_output_path(lconf):
-    "final output of the server"
-    return attelo_result_path(lconf, lconf.test_evaluation) + ".settlers-xml"
+def response_path(lconf):
+    "final output of the server (in the format the client wants)"
+    base = attelo_result_path(lconf, lconf.test_evaluation)
+    if lconf.response_format == 'xml':
+        return base + ".settlers-xml"
+    else:
+        return base + ".settlers." + lconf.response_format
 
 
 def _to_xml(lconf, log):
     """
-    Convert to Settlers XML format
+    Convert to Settlers XML format (or one of the equivalent formats)
     """
+    flags = ["--compact"] if lconf.compact_xml else []
     lconf.pyt("parser/to_settlers_xml",
               minicorpus_path(lconf),
               attelo_result_path(lconf, lconf.test_evaluation),
-              "--output", xml_output_path(lconf),
+              "--output", response_path(lconf),
+              "--format", lconf.response_format,
+              *flags,
               stdout=log)
 
 
@@ -52,7 +68,7 @@ SERVER_STAGES = p.CORE_STAGES +\
               lambda lcf, _: decode(lcf, [lcf.test_evaluation]),
               "Decoding"),
         Stage("0800-xml", _to_xml,
-              "Converting (-> settlers xml)"),
+              "Converting (-> settlers xml/json/msgpack)"),
     ]
 
 # ---------------------------------------------------------------------
@@ -79,6 +95,10 @@ def config_argparser(psr):
                      type=int,
                      required=True,
                      help="port to listen on")
+    psr.add_argument("--compact",
+                     action='store_true',
+                     help="send unindented XML (same document, less "
+                     "to generate, send and parse)")
 
 
 def _mk_server_temp(args):
@@ -103,12 +123,45 @@ def _reset_parser(args):
     open(soclog, 'wb').close()
     hconf = StandaloneParser(soclog=soclog,
                              tmp_dir=tmp_dir)
+    hconf.compact_xml = args.compact
+    hconf.response_format = 'xml'
     if hconf.test_evaluation is None:
         sys.exit("Can't run server: you didn't specify a test "
                  "evaluation in the local configuration")
     return hconf
 
 
+def supported_formats():
+    "response formats we can produce here"
+    formats = []
+    for fmt in FORMATS:
+        if fmt == 'msgpack':
+            try:
+                # pylint: disable=unused-variable
+                import msgpack
+                # pylint: enable=unused-variable
+            except ImportError:
+                continue
+        formats.append(fmt)
+    return formats
+
+
+def _negotiate(frames, formats):
+    """
+    Split an incoming request into the response format and the
+    soclog lines ::
+
+        ([String], [String]) -> (String, String)
+    """
+    if len(frames) == 1:
+        return 'xml', frames[0]
+    wanted = [x.strip().lower() for x in frames[0].split(',')]
+    for fmt in wanted:
+        if fmt in formats:
+            return fmt, frames[-1]
+    return 'xml', frames[-1]
+
+
 def main(args):
     """
     Subcommand main.
@@ -124,12 +177,19 @@ def main(args):
 # pylint: enable=no-member
     socket.bind("tcp://*:{}".format(args.port))
     lconf = _reset_parser(args)
+    formats = supported_formats()
     while True:
-        incoming = socket.recv()
+        frames = socket.recv_multipart()
+        fmt, incoming = _negotiate(frames, formats)
         with open(lconf.soclog, 'ab') as fout:
             print(incoming.strip(), file=fout)
+        lconf.response_format = fmt
         run_pipeline(lconf, SERVER_STAGES)
-        with open(xml_output_path(lconf), 'rb') as fin:
-            socket.send(fin.read())
+        with open(response_path(lconf), 'rb') as fin:
+            payload = fin.read()
+        if len(frames) == 1:
+            socket.send(payload)
+        else:
+            socket.send_multipart([fmt, payload])
         if not args.incremental:
             lconf = _reset_parser(args)
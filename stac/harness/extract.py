@@ -0,0 +1,571 @@
+# Author: Eric Kow
+# License: CeCILL-B (French BSD3-like)
+
+"""
+In-process feature extraction
+
+This does what `stac-learning extract` (and its `--single` variant)
+would do, but from within the harness, so that we only pay for
+starting up Python and importing educe/sklearn once per gather
+instead of once per call.
+"""
+
+from __future__ import print_function
+from argparse import Namespace
+from os import path as fp
+import multiprocessing
+import os
+import re
+import shutil
+import sys
+import tempfile
+
+from educe.learning.edu_input_format import (dump_all,
+                                             dump_svmlight_file,
+                                             labels_comment)
+from educe.learning.keygroup_vectorizer import (KeyGroupVectorizer)
+from educe.learning.vocabulary_format import (dump_vocabulary,
+                                              load_vocabulary)
+from educe.stac.annotation import (COORDINATING_RELATIONS,
+                                   DIALOGUE_ACTS,
+                                   SUBORDINATING_RELATIONS)
+from educe.stac.learning.doc_vectorizer import (DialogueActVectorizer,
+                                                LabelVectorizer)
+from educe.stac import (corenlp, postag)
+from nltk.corpus import verbnet as vnet
+import educe.stac
+import educe.stac.learning.features as stac_features
+
+from attelo.harness.util import (call)
+from attelo.io import (Torpor, load_vocab)
+from stac.lexicon import (load_lexicon_index)
+
+from .local import (LEXICON_INDEX_CACHE)
+
+
+def _docs_regex(docs):
+    "regular expression matching exactly the given document names"
+    return '^(' + '|'.join(re.escape(d) for d in docs) + ')$'
+
+
+def mk_extract_args(corpus, lex_dir, output_dir, annotators,
+                    vocab_path=None, strip_mode=None, single=False,
+                    docs=None):
+    """Arguments for the educe feature extraction functions, as the
+    `stac-learning extract` command line would have produced them
+
+    If `docs` is set, only those documents are read
+    """
+    return Namespace(corpus=corpus,
+                     resources=lex_dir,
+                     output=output_dir,
+                     doc=None if docs is None else _docs_regex(docs),
+                     subdoc=None,
+                     stage=None,
+                     annotator=annotators,
+                     vocabulary=vocab_path,
+                     strip_mode=strip_mode or 'head',
+                     single=single,
+                     parsing=False,
+                     ignore_cdus=False,
+                     debug=False,
+                     verbose=0)
+
+
+def _out_path(args, ext):
+    "output file for the given corpus"
+    return fp.join(args.output, fp.basename(args.corpus) + '.' + ext)
+
+
+def _vectorizer(args):
+    """Feature vectorizer, reusing the vocabulary if we were given one
+    (ie. for test data)
+    """
+    vzer = KeyGroupVectorizer()
+    if args.vocabulary is not None:
+        vzer.vocabulary_ = load_vocabulary(args.vocabulary)
+    return vzer
+
+
+def _vectorize(vzer, args, feats):
+    "sparse feature vectors (fit on the fly unless the vocab is fixed)"
+    if args.vocabulary is not None:
+        return vzer.transform(feats)
+    else:
+        return vzer.fit_transform(feats)
+
+
+def extract_pairs(inputs, args):
+    """Extract and save features for pairs of EDUs (`.relations.sparse`)
+    """
+    stage = 'discourse'
+    dialogues = list(stac_features.mk_high_level_dialogues(inputs, stage))
+    instance_generator = lambda x: x.edu_pairs()
+    labels = frozenset(SUBORDINATING_RELATIONS + COORDINATING_RELATIONS)
+    feats = stac_features.extract_pair_features(inputs, stage)
+    vzer = _vectorizer(args)
+    # pylint: disable=invalid-name
+    X_gen = _vectorize(vzer, args, feats)
+    # pylint: enable=invalid-name
+    labtor = LabelVectorizer(instance_generator, labels, zero=False)
+    y_gen = labtor.fit_transform(dialogues)
+    out_file = _out_path(args, 'relations.sparse')
+    dump_all(X_gen, y_gen, out_file, labtor.labelset_, dialogues,
+             instance_generator)
+    dump_vocabulary(vzer.vocabulary_, out_file + '.vocab')
+
+
+def extract_single(inputs, args):
+    """Extract and save features for single EDUs
+    (`.dialogue-acts.sparse`)
+    """
+    stage = 'units'
+    dialogues = list(stac_features.mk_high_level_dialogues(inputs, stage))
+    instance_generator = lambda x: x.edus[1:]  # drop fake root
+    feats = stac_features.extract_single_features(inputs, stage)
+    # the dialogue act vocabulary is always learned from the data itself
+    vzer = KeyGroupVectorizer()
+    # pylint: disable=invalid-name
+    X_gen = vzer.fit_transform(feats)
+    # pylint: enable=invalid-name
+    labtor = DialogueActVectorizer(instance_generator, DIALOGUE_ACTS)
+    y_gen = labtor.transform(dialogues)
+    out_file = _out_path(args, 'dialogue-acts.sparse')
+    dump_svmlight_file(X_gen, y_gen, out_file,
+                       comment=labels_comment(labtor.labelset_))
+    dump_vocabulary(vzer.vocabulary_, out_file + '.vocab')
+
+
+_SHARED_READ_API = ['mk_is_interesting',
+                    'strip_cdus',
+                    'LEXICONS',
+                    'read_pdtb_lexicon',
+                    'VerbNetEntry',
+                    'VERBNET_CLASSES',
+                    '_fuse_corpus',
+                    'FeatureInput']
+"""Bits of `educe.stac.learning.features` that `read_shared_inputs`
+relies on besides `read_corpus_inputs` (not all of them public; see
+`check_extraction`)"""
+
+
+def read_shared_inputs(pair_args, single_args):
+    """Feature inputs for both the pair and the single EDU extraction
+    (in that order), as `stac_features.read_corpus_inputs` would have
+    returned them for each set of arguments.
+
+    The two only differ in which stages of the corpus they read, so we
+    slurp the union of their documents once, and read the POS tags and
+    parses for it once; each input then gets the corpus entries for its
+    own stages. The lexicons come from the compiled lexicon index
+    (`stac.lexicon`, cached in `LEXICON_INDEX_CACHE`).
+
+    If the installed educe lacks any of `_SHARED_READ_API`, we warn and
+    fall back to calling `read_corpus_inputs` for each
+    """
+    missing = [x for x in _SHARED_READ_API if not hasattr(stac_features, x)]
+    if missing:
+        print(('[extract] WARNING: educe.stac.learning.features has no '
+               '{}; reading the corpus once for each kind of feature '
+               'instead').format(', '.join(missing)),
+              file=sys.stderr)
+        return (stac_features.read_corpus_inputs(pair_args),
+                stac_features.read_corpus_inputs(single_args))
+    is_pair = stac_features.mk_is_interesting(pair_args, False)
+    is_single = stac_features.mk_is_interesting(single_args, True)
+    reader = educe.stac.Reader(pair_args.corpus)
+    anno_files = reader.filter(reader.files(),
+                               lambda k: is_pair(k) or is_single(k))
+    corpus = reader.slurp(anno_files, verbose=True)
+    if not pair_args.ignore_cdus:
+        stac_features.strip_cdus(corpus, mode=pair_args.strip_mode)
+    postags = postag.read_tags(corpus, pair_args.corpus)
+    parses = corenlp.read_results(corpus, pair_args.corpus)
+
+    lex_index = load_lexicon_index(pair_args.resources, LEXICON_INDEX_CACHE)
+    lexicons = lex_index.lexicons()
+    verbnet_entries = [stac_features.VerbNetEntry(x,
+                                                  frozenset(vnet.lemmas(x)))
+                       for x in stac_features.VERBNET_CLASSES]
+
+    def for_stages(is_interesting):
+        "inputs restricted to the corpus entries we want"
+        # fusing replaces the entries with fused copies, so the shared
+        # documents are left alone for the other input
+        sub_corpus = {k: corpus[k] for k in corpus if is_interesting(k)}
+        # pylint: disable=protected-access
+        stac_features._fuse_corpus(sub_corpus, postags)
+        # pylint: enable=protected-access
+        return stac_features.FeatureInput(corpus=sub_corpus,
+                                          postags=postags,
+                                          parses=parses,
+                                          lexicons=lexicons,
+                                          pdtb_lex=lex_index.pdtb_lex,
+                                          verbnet_entries=verbnet_entries,
+                                          inquirer_lex={})
+
+    return for_stages(is_pair), for_stages(is_single)
+
+
+def extract_corpus(corpus, lex_dir, output_dir, annotators,
+                   vocab_path=None, strip_mode=None, docs=None):
+    """Extract pair and single EDU features for a corpus, in this
+    process.
+
+    The pair features need the discourse stage of the corpus whereas
+    the single EDU features need the units stage, but we read the
+    corpus and its resources (lexicons, POS tags, parses) only once
+    for both (see `read_shared_inputs`), and we no longer start up a
+    fresh process (and import educe, sklearn, etc) for each of them.
+
+    Parameters
+    ----------
+    corpus: filepath
+        Selected corpus
+    lex_dir: filepath
+        Lexicon directory
+    output_dir: filepath
+        Folder where instances will be dumped
+    annotators: string
+        Which annotators to read from
+    vocab_path: filepath
+        Vocabulary to use for the pair features (needed if extracting
+        test data)
+    strip_mode: one of {'head', 'broadcast', 'custom'}
+        Method to strip CDUs
+    docs: [string] or None
+        Only extract features for these documents
+    """
+    if not fp.exists(output_dir):
+        os.makedirs(output_dir)
+    pair_args = mk_extract_args(corpus, lex_dir, output_dir, annotators,
+                                vocab_path=vocab_path,
+                                strip_mode=strip_mode,
+                                docs=docs)
+    single_args = mk_extract_args(corpus, lex_dir, output_dir, annotators,
+                                  strip_mode=strip_mode,
+                                  single=True,
+                                  docs=docs)
+    cname = fp.basename(corpus)
+    with Torpor('[{}] reading corpus'.format(cname)):
+        pair_inputs, single_inputs = read_shared_inputs(pair_args,
+                                                        single_args)
+    steps = [(pair_inputs, pair_args, extract_pairs, 'pair'),
+             (single_inputs, single_args, extract_single, 'single EDU')]
+    for inputs, args, extract, what in steps:
+        with Torpor('[{}] extracting {} features'.format(cname, what)):
+            extract(inputs, args)
+
+
+def _doc_inputs(inputs, doc):
+    "the same feature inputs, restricted to a single document"
+    return inputs._replace(corpus={k: v for k, v in inputs.corpus.items()
+                                   if k.doc == doc})
+
+
+def extract_docs(corpus, lex_dir, doc_dirs, annotators,
+                 vocab_path=None, strip_mode=None):
+    """Extract pair and single EDU features for some documents of a
+    corpus, saving them separately for each document (the files that
+    `extract_corpus` would have produced for that document alone).
+
+    The corpus and its resources are read only once for all of the
+    documents.
+
+    Parameters
+    ----------
+    doc_dirs: dict(string, filepath)
+        Output directory for each document
+    (see `extract_corpus` for the others)
+    """
+    docs = sorted(doc_dirs)
+    cname = fp.basename(corpus)
+    pair_args = mk_extract_args(corpus, lex_dir, None, annotators,
+                                vocab_path=vocab_path,
+                                strip_mode=strip_mode,
+                                docs=docs)
+    single_args = mk_extract_args(corpus, lex_dir, None, annotators,
+                                  strip_mode=strip_mode,
+                                  single=True,
+                                  docs=docs)
+    with Torpor('[{}] reading {} documents'.format(cname, len(docs))):
+        pair_inputs, single_inputs = read_shared_inputs(pair_args,
+                                                        single_args)
+    with Torpor('[{}] extracting features for {} documents'.format(
+            cname, len(docs))):
+        for doc in docs:
+            output_dir = doc_dirs[doc]
+            if not fp.exists(output_dir):
+                os.makedirs(output_dir)
+            extract_pairs(_doc_inputs(pair_inputs, doc),
+                          mk_extract_args(corpus, lex_dir, output_dir,
+                                          annotators,
+                                          vocab_path=vocab_path,
+                                          strip_mode=strip_mode,
+                                          docs=[doc]))
+            extract_single(_doc_inputs(single_inputs, doc),
+                           mk_extract_args(corpus, lex_dir, output_dir,
+                                           annotators,
+                                           strip_mode=strip_mode,
+                                           single=True,
+                                           docs=[doc]))
+
+
+# ---------------------------------------------------------------------
+# checking against the command line
+# ---------------------------------------------------------------------
+
+
+def _normalised_sparse(path):
+    """Order independent view of an svmlight file (with its vocabulary
+    in `path + '.vocab'`): the header lines, and the sorted rows, each as
+    a label and its sorted (feature name, value) pairs
+    """
+    vocab = load_vocab(path + '.vocab')
+    base = _index_base(path)
+    header, rows, stream = _split_header(path)
+    res = []
+    with stream:
+        for line in rows:
+            parts = line.split('#', 1)[0].split()
+            if not parts:
+                continue
+            feats = []
+            for item in parts[1:]:
+                idx, val = item.split(':', 1)
+                feats.append((vocab[int(idx) - base], val))
+            res.append((parts[0], tuple(sorted(feats))))
+    return header, sorted(res)
+
+
+def _normalised_lines(path):
+    "order independent view of a text file"
+    with open(path) as stream:
+        return sorted(stream)
+
+
+_CHECKED_OUTPUTS = [('relations.sparse', _normalised_sparse),
+                    ('relations.sparse.edu_input', _normalised_lines),
+                    ('relations.sparse.pairings', _normalised_lines),
+                    ('dialogue-acts.sparse', _normalised_sparse)]
+'files compared by `check_extraction`, and how to compare them'
+
+
+def check_extraction(corpus, lex_dir, annotators, docs,
+                     vocab_path=None, strip_mode=None):
+    """Extract features for a few documents both with `extract_corpus`
+    and with the `stac-learning extract` command line, and compare the
+    results (up to the order of rows and vocabulary).
+
+    `extract_corpus` uses educe internals (see `read_shared_inputs`),
+    so this is how we notice if educe changed under our feet.
+
+    Returns
+    -------
+    mismatches: [string]
+        The output files that differ (empty if all is well)
+    """
+    cname = fp.basename(corpus)
+    tmp_dir = tempfile.mkdtemp(prefix='stac-check-extract')
+    cli_dir = fp.join(tmp_dir, 'cli')
+    ours_dir = fp.join(tmp_dir, 'in-process')
+    try:
+        os.makedirs(cli_dir)
+        cmd = ['stac-learning', 'extract',
+               corpus,
+               lex_dir,
+               cli_dir,
+               '--anno', annotators,
+               '--doc', _docs_regex(docs)]
+        if vocab_path is not None:
+            cmd.extend(['--vocabulary', vocab_path])
+        if strip_mode is not None:
+            cmd.extend(['--strip-mode', strip_mode])
+        with Torpor('[{}] extracting with stac-learning'.format(cname)):
+            call(cmd)
+            call(cmd + ['--single'])
+        extract_corpus(corpus, lex_dir, ours_dir, annotators,
+                       vocab_path=vocab_path,
+                       strip_mode=strip_mode,
+                       docs=docs)
+        mismatches = []
+        for suffix, normalise in _CHECKED_OUTPUTS:
+            fname = cname + '.' + suffix
+            if (normalise(fp.join(cli_dir, fname)) !=
+                    normalise(fp.join(ours_dir, fname))):
+                mismatches.append(fname)
+        return mismatches
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+# ---------------------------------------------------------------------
+# sharded extraction
+# ---------------------------------------------------------------------
+
+
+def corpus_docs(corpus):
+    "names of the documents in a corpus"
+    reader = educe.stac.Reader(corpus)
+    return sorted(frozenset(k.doc for k in reader.files()))
+
+
+def _extract_shard(job):
+    "worker: run `extract_corpus` on a shard (tuple of arguments)"
+    corpus, lex_dir, shard_dir, annotators, vocab_path, strip_mode, docs =\
+        job
+    extract_corpus(corpus, lex_dir, shard_dir, annotators,
+                   vocab_path=vocab_path,
+                   strip_mode=strip_mode,
+                   docs=docs)
+
+
+def _split_header(path):
+    """Leading comment lines (eg. labels) and an iterator over the
+    rest of an svmlight file (caller must close the stream)
+    """
+    stream = open(path)
+    header = []
+    for line in stream:
+        if line.startswith('#'):
+            header.append(line)
+        else:
+            first = [line]
+            break
+    else:
+        first = []
+
+    def rows():
+        "remaining lines"
+        for line in first:
+            yield line
+        for line in stream:
+            yield line
+    return header, rows(), stream
+
+
+def _index_base(path):
+    """Whether the svmlight file uses 0 or 1 based feature indices.
+
+    Same heuristic as `load_svmlight_file` (zero_based='auto', which is
+    how the files are read back): zero based iff any index is 0
+    """
+    _, rows, stream = _split_header(path)
+    with stream:
+        for line in rows:
+            for item in line.split()[1:]:
+                if item.startswith('#'):
+                    break
+                if item.split(':', 1)[0] == '0':
+                    return 0
+    return 1
+
+
+def _remap_row(line, remap):
+    "svmlight row with its feature indices translated"
+    parts = line.split('#', 1)[0].split()
+    if not parts:
+        return line
+    feats = []
+    for item in parts[1:]:
+        idx, val = item.split(':', 1)
+        feats.append((remap[int(idx)], val))
+    feats.sort()
+    return ' '.join([parts[0]] +
+                    ['{}:{}'.format(i, v) for i, v in feats]) + '\n'
+
+
+def merge_sparse(shard_paths, out_path, fixed_vocab=False):
+    """Merge svmlight feature files (each with a vocabulary alongside
+    in `<path>.vocab`) into a single file with a single vocabulary
+
+    Parameters
+    ----------
+    shard_paths: [filepath]
+        Feature files for each shard, in order
+
+    out_path: filepath
+        Merged feature file (vocabulary in `out_path + '.vocab'`)
+
+    fixed_vocab: bool
+        If True, the shards were all extracted with the same vocabulary
+        so we just concatenate them
+    """
+    headers = []
+    vocabs = [load_vocab(p + '.vocab') for p in shard_paths]
+    merged = {}
+    if fixed_vocab:
+        merged = {f: i for i, f in enumerate(vocabs[0])}
+    else:
+        for vocab in vocabs:
+            for feat in vocab:
+                if feat not in merged:
+                    merged[feat] = len(merged)
+    base = _index_base(shard_paths[0])
+    with open(out_path, 'w') as ostream:
+        for i, (path, vocab) in enumerate(zip(shard_paths, vocabs)):
+            header, rows, stream = _split_header(path)
+            with stream:
+                if i == 0:
+                    ostream.writelines(header)
+                elif header != headers[0]:
+                    raise ValueError(('Shard {} and {} have different '
+                                      'headers (labels?)').format(
+                                          shard_paths[0], path))
+                headers.append(header)
+                if fixed_vocab:
+                    ostream.writelines(rows)
+                    continue
+                shard_base = _index_base(path)
+                remap = {j + shard_base: merged[f] + base
+                         for j, f in enumerate(vocab)}
+                for line in rows:
+                    ostream.write(_remap_row(line, remap))
+    dump_vocabulary(merged, out_path + '.vocab')
+
+
+def concatenate_files(paths, out_path):
+    "concatenate text files"
+    with open(out_path, 'w') as ostream:
+        for path in paths:
+            with open(path) as istream:
+                shutil.copyfileobj(istream, ostream)
+
+
+def extract_corpus_sharded(corpus, lex_dir, output_dir, annotators,
+                           jobs, vocab_path=None, strip_mode=None):
+    """Like `extract_corpus`, but sharding the documents across `jobs`
+    worker processes, then merging the results (see `merge_sparse`).
+
+    The output files are the same as for `extract_corpus`, up to the
+    order of the vocabulary/rows.
+    """
+    docs = corpus_docs(corpus)
+    jobs = max(1, min(jobs, len(docs)))
+    shards = [docs[i::jobs] for i in range(jobs)]
+    shard_root = fp.join(output_dir, 'shards')
+    shard_dirs = [fp.join(shard_root, 'shard-{}'.format(i))
+                  for i in range(len(shards))]
+    tasks = [(corpus, lex_dir, d, annotators, vocab_path, strip_mode, s)
+             for d, s in zip(shard_dirs, shards)]
+    pool = multiprocessing.Pool(processes=jobs)
+    try:
+        pool.map(_extract_shard, tasks)
+    finally:
+        pool.close()
+        pool.join()
+
+    cname = fp.basename(corpus)
+    with Torpor('[{}] merging {} shards'.format(cname, len(shards))):
+        pair_paths = [fp.join(d, cname + '.relations.sparse')
+                      for d in shard_dirs]
+        out_pairs = fp.join(output_dir, cname + '.relations.sparse')
+        merge_sparse(pair_paths, out_pairs,
+                     fixed_vocab=vocab_path is not None)
+        for ext in ['.edu_input', '.pairings']:
+            concatenate_files([p + ext for p in pair_paths], out_pairs + ext)
+        single_paths = [fp.join(d, cname + '.dialogue-acts.sparse')
+                        for d in shard_dirs]
+        merge_sparse(single_paths,
+                     fp.join(output_dir, cname + '.dialogue-acts.sparse'))
+    shutil.rmtree(shard_root)
@@ -1,15 +1,18 @@
 '''
 Paths to files used or generated by the test harness
 '''
+from __future__ import print_function
 from collections import Counter
 from os import path as fp
 import sys
 
 from attelo.fold import (make_n_fold)
-from attelo.harness import Harness
+from attelo.harness import (ClusterStage, Harness)
 from attelo.harness.evaluate import (evaluate_corpus,
                                      prepare_dirs)
-from attelo.io import (load_fold_dict,
+import attelo.harness.evaluate as attelo_evaluate
+from attelo.io import (Torpor,
+                       load_fold_dict,
                        save_fold_dict)
 from attelo.parser.intra import (IntraInterPair)
 from attelo.util import (mk_rng)
@@ -20,10 +23,18 @@ from .local import (CONFIG_FILE,
                     FIXED_FOLD_FILE,
                     GRAPH_DOCS,
                     METRICS,
+                    PRUNING_SETTINGS,
                     REPORT_DIGITS,
                     TEST_CORPUS,
                     TEST_EVALUATION_KEY,
                     TRAINING_CORPUS)
+from .packed import (ensure_packed,
+                     load_multipack,
+                     packed_prefix,
+                     use_packed)
+from .pruning import (pruning_report, save_pruning_report)
+from .turn_constraint import (load_pairings_mode,
+                              pairings_mode_path)
 from .util import (latest_tmp, exit_ungathered)
 
 
@@ -51,7 +62,17 @@ class IritHarness(Harness):
         evidence_of_gathered = self.mpack_paths(False)['edu_input']
         if not fp.exists(evidence_of_gathered):
             exit_ungathered()
-        evaluate_corpus(self)
+        if self.pairings_mode != 'all':
+            print("[irit-stac] NB: features were gathered with "
+                  "--pairings {}; scores only count the candidate pairs "
+                  "kept by this mode".format(self.pairings_mode),
+                  file=sys.stderr)
+        if runcfg.stage in [None, ClusterStage.start]:
+            self.pack_datapacks()
+        with use_packed(attelo_evaluate):
+            evaluate_corpus(self)
+        if runcfg.stage in [None, ClusterStage.end]:
+            self.report_pruning()
 
     # ------------------------------------------------------
     # local settings
@@ -96,6 +117,17 @@ class IritHarness(Harness):
     def graph_docs(self):
         return GRAPH_DOCS
 
+    @property
+    def pairings_mode(self):
+        """Which candidate pairs were kept when gathering the features
+        (see `stac.harness.turn_constraint.PAIRINGS_MODES`)
+        """
+        # eval dirs live within the features dir they were made from
+        for dirname in [self.eval_dir, fp.dirname(self.eval_dir)]:
+            if fp.exists(pairings_mode_path(dirname)):
+                return load_pairings_mode(dirname)
+        return 'all'
+
     def create_folds(self, mpack):
         """
         Generate the folds file; return the resulting folds
@@ -150,6 +182,9 @@ class IritHarness(Harness):
         res : dict
             Paths to files that enable to read a datapack.
             Useful keys are 'edu_input', 'pairings', 'features', 'vocab'.
+            The 'packed' key is the prefix for the binary version of
+            the datapack written by gather (see `stac.harness.packed`);
+            `load_multipack` prefers it when it is up to date.
         """
         ext = 'relations.sparse'
         core_path = self._eval_data_path(ext, test_data=test_data)
@@ -157,7 +192,8 @@ class IritHarness(Harness):
             'edu_input': core_path + '.edu_input',
             'pairings': core_path + '.pairings',
             'features': (core_path + '.stripped') if stripped else core_path,
-            'vocab': core_path + '.vocab'
+            'vocab': core_path + '.vocab',
+            'packed': packed_prefix(core_path)
         }
 
     def model_paths(self, rconf, fold, parser):
@@ -216,6 +252,50 @@ class IritHarness(Harness):
                     'label': _eval_model_path(rconf, "relate")}
 
 
+    def pack_datapacks(self):
+        """Make sure the evaluation directory has up to date packed
+        versions of the datapacks (normally hardlinked from gather).
+
+        Besides loading faster, this is what keeps memory down when
+        evaluating in parallel: the feature matrices and targets are
+        then slices of read-only memory mapped files, which joblib
+        hands over to its workers by reference (file and offset)
+        instead of pickling a copy for each of them. So the workers
+        all share the same pages, and each extra worker only costs
+        its own working memory.
+        """
+        for test_data in ([False] if self.testset is None
+                          else [False, True]):
+            paths = self.mpack_paths(test_data)
+            if not fp.exists(paths['features']):
+                continue
+            with Torpor('checking packed datapack ({})'.format(
+                    fp.basename(paths['features']))):
+                ensure_packed(paths['edu_input'],
+                              paths['pairings'],
+                              paths['features'],
+                              paths['vocab'])
+
+    # ------------------------------------------------------
+    # reports
+    # ------------------------------------------------------
+
+    def report_pruning(self):
+        """Recall of gold edges vs. pairs kept for each of the
+        candidate pair pruning settings (`PRUNING_SETTINGS`)
+        """
+        paths = self.mpack_paths(False)
+        with Torpor('reporting on candidate pair pruning'):
+            mpack = load_multipack(paths['edu_input'],
+                                   paths['pairings'],
+                                   paths['features'],
+                                   paths['vocab'])
+            rows = pruning_report(mpack, PRUNING_SETTINGS)
+            save_pruning_report(rows,
+                                fp.join(self.eval_dir,
+                                        'pruning-report.txt'),
+                                digits=self.report_digits)
+
     # ------------------------------------------------------
     # utility
     # ------------------------------------------------------
@@ -0,0 +1,240 @@
+# Author: Eric Kow
+# License: CeCILL-B (French BSD3-like)
+
+"""
+Incremental feature extraction
+
+We keep a cache of features extracted for each document of a corpus,
+along with a manifest recording a hash of the document files (and of
+the extraction settings). On later runs, only the documents that have
+changed (or are new) are extracted again; the outputs are then spliced
+together from the per-document pieces.
+"""
+
+from __future__ import print_function
+from os import path as fp
+import hashlib
+import json
+import multiprocessing
+import os
+import shutil
+import sys
+
+from attelo.io import (Torpor)
+from stac.lexicon import (lexicon_digest)
+
+from .extract import (concatenate_files,
+                      corpus_docs,
+                      extract_docs,
+                      merge_sparse)
+
+MANIFEST_NAME = 'manifest.json'
+
+_OUTPUTS = ['relations.sparse', 'dialogue-acts.sparse']
+'feature files we produce for each corpus'
+
+
+def _hash_files(paths, hasher=None):
+    "hash of the contents (and names) of the given files"
+    hasher = hasher or hashlib.sha1()
+    for path in paths:
+        hasher.update(path.encode('utf-8'))
+        with open(path, 'rb') as stream:
+            for block in iter(lambda: stream.read(1 << 16), b''):
+                hasher.update(block)
+    return hasher.hexdigest()
+
+
+def _dir_files(dirname):
+    "all files under a directory (sorted, for reproducible hashes)"
+    res = []
+    for parent, _, fnames in os.walk(dirname):
+        res.extend(fp.join(parent, f) for f in fnames)
+    return sorted(res)
+
+
+def doc_hashes(corpus):
+    """Hash of everything we have on each document of the corpus
+    (all stages, pos tags, parses) ::
+
+        FilePath -> Dict String String
+    """
+    return {doc: _hash_files(_dir_files(fp.join(corpus, doc)))
+            for doc in corpus_docs(corpus)}
+
+
+def extraction_settings(lex_dir, annotators, vocab_path, strip_mode):
+    """Everything besides the document itself that affects its features;
+    if any of this changes, we need to start from scratch
+    """
+    return {'lexicons': lexicon_digest(lex_dir),
+            'annotators': annotators,
+            'strip_mode': strip_mode,
+            'vocabulary': (None if vocab_path is None else
+                           _hash_files([vocab_path]))}
+
+
+def _count_rows(path):
+    "number of instances in a features file"
+    if not fp.exists(path):
+        return 0
+    with open(path) as stream:
+        return sum(1 for l in stream if l.strip() and not l.startswith('#'))
+
+
+class Manifest(object):
+    """
+    What we have extracted so far for a corpus (in a cache directory).
+
+    For each document, we record the hash of its files and the number
+    of feature rows we got out of it
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.settings = None
+        self.docs = {}
+        path = self.path
+        if fp.exists(path):
+            with open(path) as stream:
+                blob = json.load(stream)
+            self.settings = blob['settings']
+            self.docs = blob['docs']
+
+    @property
+    def path(self):
+        "where the manifest is saved"
+        return fp.join(self.cache_dir, MANIFEST_NAME)
+
+    def doc_dir(self, doc):
+        "where the features for a document are cached"
+        return fp.join(self.cache_dir, 'docs', doc)
+
+    def reset(self, settings):
+        "forget everything (and delete the cached features)"
+        if fp.exists(self.cache_dir):
+            shutil.rmtree(self.cache_dir)
+        self.settings = settings
+        self.docs = {}
+
+    def forget(self, doc):
+        "forget about a single document"
+        self.docs.pop(doc, None)
+        if fp.exists(self.doc_dir(doc)):
+            shutil.rmtree(self.doc_dir(doc))
+
+    def record(self, corpus_name, doc, doc_hash):
+        "note that we have just extracted features for this document"
+        doc_dir = self.doc_dir(doc)
+        self.docs[doc] = {'hash': doc_hash,
+                          'rows': {o: _count_rows(fp.join(doc_dir,
+                                                          corpus_name +
+                                                          '.' + o))
+                                   for o in _OUTPUTS}}
+
+    def save(self):
+        "write the manifest (atomically)"
+        if not fp.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as stream:
+            json.dump({'settings': self.settings, 'docs': self.docs},
+                      stream, indent=1, sort_keys=True)
+        os.rename(tmp_path, self.path)
+
+
+def _extract_chunk(job):
+    """worker: extract features for a chunk of documents, each into its
+    own directory (tuple of arguments)
+    """
+    corpus, lex_dir, doc_dirs, annotators, vocab_path, strip_mode = job
+    for doc_dir in doc_dirs.values():
+        if fp.exists(doc_dir):
+            shutil.rmtree(doc_dir)
+    extract_docs(corpus, lex_dir, doc_dirs, annotators,
+                 vocab_path=vocab_path,
+                 strip_mode=strip_mode)
+    return sorted(doc_dirs)
+
+
+def _splice(manifest, corpus_name, docs, output_dir):
+    """Combine the cached per-document features into the usual
+    corpus-wide files
+    """
+    pair_paths = [fp.join(manifest.doc_dir(d), corpus_name +
+                          '.relations.sparse') for d in docs]
+    pair_paths = [p for p in pair_paths if fp.exists(p)]
+    single_paths = [fp.join(manifest.doc_dir(d), corpus_name +
+                            '.dialogue-acts.sparse') for d in docs]
+    single_paths = [p for p in single_paths if fp.exists(p)]
+    if not pair_paths or not single_paths:
+        raise ValueError('No features extracted for ' + corpus_name)
+    out_pairs = fp.join(output_dir, corpus_name + '.relations.sparse')
+    fixed_vocab = manifest.settings['vocabulary'] is not None
+    merge_sparse(pair_paths, out_pairs, fixed_vocab=fixed_vocab)
+    for ext in ['.edu_input', '.pairings']:
+        concatenate_files([p + ext for p in pair_paths], out_pairs + ext)
+    merge_sparse(single_paths,
+                 fp.join(output_dir, corpus_name + '.dialogue-acts.sparse'))
+
+
+def extract_corpus_incremental(corpus, lex_dir, output_dir, annotators,
+                               cache_dir,
+                               jobs=1, vocab_path=None, strip_mode=None,
+                               rebuild=False):
+    """Like `extract_corpus`, but only extracting features for the
+    documents that have changed since the last run.
+
+    Parameters
+    ----------
+    cache_dir: filepath
+        Where to keep the per-document features and manifest for this
+        corpus
+    jobs: int
+        Number of worker processes; the changed documents are split
+        into as many chunks, each read and extracted in one go
+    rebuild: bool
+        Throw away the cache and extract everything again
+    (see `extract_corpus` for the others)
+    """
+    cname = fp.basename(corpus)
+    manifest = Manifest(cache_dir)
+    settings = extraction_settings(lex_dir, annotators, vocab_path,
+                                   strip_mode)
+    if rebuild or manifest.settings != settings:
+        manifest.reset(settings)
+
+    with Torpor('[{}] checking for changed documents'.format(cname)):
+        hashes = doc_hashes(corpus)
+    for doc in [d for d in manifest.docs if d not in hashes]:
+        manifest.forget(doc)
+    stale = [d for d in sorted(hashes)
+             if manifest.docs.get(d, {}).get('hash') != hashes[d]]
+    print('[{}] {} of {} documents to extract'.format(cname, len(stale),
+                                                      len(hashes)),
+          file=sys.stderr)
+
+    nchunks = max(1, min(jobs, len(stale)))
+    chunks = [stale[i::nchunks] for i in range(nchunks)]
+    tasks = [(corpus, lex_dir, {d: manifest.doc_dir(d) for d in c},
+              annotators, vocab_path, strip_mode) for c in chunks if c]
+    if len(tasks) > 1:
+        pool = multiprocessing.Pool(processes=len(tasks))
+        try:
+            for docs in pool.imap_unordered(_extract_chunk, tasks):
+                for doc in docs:
+                    manifest.record(cname, doc, hashes[doc])
+                manifest.save()
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            for doc in _extract_chunk(task):
+                manifest.record(cname, doc, hashes[doc])
+            manifest.save()
+    manifest.save()
+
+    with Torpor('[{}] splicing features'.format(cname)):
+        if not fp.exists(output_dir):
+            os.makedirs(output_dir)
+        _splice(manifest, cname, sorted(hashes), output_dir)
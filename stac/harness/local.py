@@ -52,6 +52,8 @@ from .config.common import (ORACLE,
                             )
 
 from .ilp import (ILPDecoder, SCIP_BIN_DIR)
+from .pruning import (PruningSettings,
+                      pruned_decoder)
 from .turn_constraint import (tc_decoder,
                               tc_learner)
 # PATHS
@@ -111,6 +113,11 @@ LEX_DIR = "lexicon"
 Lexicons used to help feature extraction
 """
 
+LEXICON_INDEX_CACHE = fp.join(LOCAL_TMP, 'lexicon-index.pickle')
+"""
+Where to save the compiled lexicon index (see `stac.lexicon`)
+"""
+
 ANNOTATORS = educe.stac.corpus.METAL_STR
 """
 Which annotators to read from during feature extraction
@@ -141,6 +148,20 @@ def decoder_ilp():
     return Keyed('ilp', ILPDecoder())
 
 
+PRUNING_SETTINGS = [
+    Keyed('d10', PruningSettings.make(max_edu_dist=10)),
+    Keyed('t5', PruningSettings.make(max_turn_dist=5)),
+    # Keyed('s01', PruningSettings.make(min_score=0.1)),
+]
+"""Candidate pair pruning settings. Each of these can be put in front of
+a decoder with `pruned_decoder` (see `_core_parsers`).
+
+The evaluation reports include a recall-of-gold-edges vs. pairs-kept
+report for each of them (`pruning-report.txt`), whether or not they
+are used in an evaluation.
+"""
+
+
 def attach_learner_maxent():
     "return a keyed instance of maxent learner"
     return Keyed('maxent', SklearnAttachClassifier(LogisticRegression()))
@@ -233,6 +254,8 @@ def _core_parsers(klearner):
         # mk_post(klearner, decoder_mst()),
         # mk_post(klearner, tc_decoder(DECODER_LOCAL)),
         mk_post(klearner, tc_decoder(decoder_mst())),
+        mk_post(klearner, pruned_decoder(PRUNING_SETTINGS[0],
+                                         tc_decoder(decoder_mst()))),
     ]
 
     # ILP decoders
@@ -240,6 +263,8 @@ def _core_parsers(klearner):
         bypass = [
             mk_bypass(klearner, decoder_ilp()),
             mk_bypass(klearner, tc_decoder(decoder_ilp())),
+            # mk_bypass(klearner, pruned_decoder(PRUNING_SETTINGS[0],
+            #                                    decoder_ilp())),
         ]
     else:
         # you need to install SCIP and provide the path to its
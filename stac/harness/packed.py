@@ -0,0 +1,319 @@
+# Author: Eric Kow
+# License: CeCILL-B (French BSD3-like)
+
+"""
+Binary ("packed") version of the gathered datapacks
+
+Reading the svmlight text files back in is a big part of the start up
+cost of anything that needs a multipack (model, evaluate, decoding).
+So gather also saves the same information as plain numpy arrays
+(`.npy`, which we memory map when loading) alongside the text files ::
+
+    <features>.packed.json           labels, EDU table, document offsets
+    <features>.packed.data.npy       CSR feature matrix (values)
+    <features>.packed.indices.npy    CSR feature matrix (column indices)
+    <features>.packed.indptr.npy     CSR feature matrix (row pointers)
+    <features>.packed.target.npy     target labels
+    <features>.packed.pairings.npy   pairings, as indices into the EDU
+                                     table (-1 for the fake root)
+
+The rows are stored grouped by document so that each document is a
+contiguous slice of the arrays; the datapacks we return just point
+into the memory mapped files (so loading is near instant, and the
+pages are shared by all processes using them).
+
+These are flat files so that they get hardlinked into the evaluation
+and snapshot directories along with the text files. The text files
+remain the reference: if they change after the packed files were
+written (eg. somebody edits them by hand), we ignore the packed files
+and fall back to reading the text.
+"""
+
+from __future__ import print_function
+from contextlib import contextmanager
+from os import path as fp
+import json
+import os
+import sys
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.datasets import load_svmlight_file
+
+from attelo.io import (Torpor,
+                       load_edus,
+                       load_labels,
+                       load_vocab)
+from attelo.io import load_multipack as load_text_multipack
+from attelo.table import (DataPack, EDU, FAKE_ROOT, FAKE_ROOT_ID, UNKNOWN)
+
+_ARRAYS = ['data', 'indices', 'indptr', 'target', 'pairings']
+'arrays saved in their own .npy file'
+
+_FORMAT_VERSION = 1
+
+
+def packed_prefix(feature_file):
+    "common prefix for the packed files corresponding to a features file"
+    return feature_file + '.packed'
+
+
+def _meta_path(prefix):
+    "metadata for a packed datapack"
+    return prefix + '.json'
+
+
+def _array_path(prefix, name):
+    "path to one of the packed arrays"
+    return '{}.{}.npy'.format(prefix, name)
+
+
+def _stamp(path):
+    "(size, mtime) for a file, to check if it changed after packing"
+    stat = os.stat(path)
+    return [stat.st_size, int(stat.st_mtime)]
+
+
+def _sources(edu_file, pairings_file, feature_file):
+    "stamps for the text files a packed datapack was made from"
+    return {'edu_input': _stamp(edu_file),
+            'pairings': _stamp(pairings_file),
+            'features': _stamp(feature_file)}
+
+
+def _read_meta(prefix):
+    "metadata for the packed datapack (None if missing)"
+    path = _meta_path(prefix)
+    if not fp.exists(path):
+        return None
+    with open(path) as stream:
+        return json.load(stream)
+
+
+def is_packed(edu_file, pairings_file, feature_file):
+    """True if there is an up to date packed version of the given
+    datapack files
+    """
+    meta = _read_meta(packed_prefix(feature_file))
+    if meta is None or meta.get('version') != _FORMAT_VERSION:
+        return False
+    try:
+        return meta['sources'] == _sources(edu_file, pairings_file,
+                                           feature_file)
+    except OSError:
+        return False
+
+
+# ---------------------------------------------------------------------
+# saving
+# ---------------------------------------------------------------------
+
+
+def _grouping(edu1, edu2):
+    "document that a pairing belongs to (one end may be the root)"
+    return edu2.grouping if edu1.id == FAKE_ROOT_ID else edu1.grouping
+
+
+def _index_dtype(maxval):
+    "smallest index type scipy would use for this sparse matrix"
+    return np.int32 if maxval <= np.iinfo(np.int32).max else np.int64
+
+
+def save_packed_multipack(edu_file, pairings_file, feature_file,
+                          vocab_file):
+    """Read a gathered datapack from its text files and save a packed
+    version of it (see module docstring).
+    """
+    prefix = packed_prefix(feature_file)
+    meta_path = _meta_path(prefix)
+    if fp.exists(meta_path):
+        # the metadata is written last: no metadata = not packed
+        os.remove(meta_path)
+    sources = _sources(edu_file, pairings_file, feature_file)
+
+    vocab = load_vocab(vocab_file)
+    edus = load_edus(edu_file)
+    edu_idx = {e.id: i for i, e in enumerate(edus)}
+    edu_map = {e.id: e for e in edus}
+    edu_map[FAKE_ROOT_ID] = FAKE_ROOT
+    with open(pairings_file) as stream:
+        pairings = [tuple(line.rstrip('\n').split('\t')[:2])
+                    for line in stream if line.strip()]
+    labels = [UNKNOWN] + load_labels(feature_file)
+    # same call as in load_multipack so that the columns line up
+    # pylint: disable=unbalanced-tuple-unpacking
+    data, target = load_svmlight_file(feature_file,
+                                      n_features=len(vocab))
+    # pylint: enable=unbalanced-tuple-unpacking
+    if data.shape[0] != len(pairings):
+        oops = ('Mismatch between the number of pairings ({}) and '
+                'feature vectors ({}) in {}').format(len(pairings),
+                                                     data.shape[0],
+                                                     feature_file)
+        raise ValueError(oops)
+
+    # group rows and EDUs by document (stable, in order of appearance)
+    docs = []
+    doc_num = {}
+    row_docs = np.empty(len(pairings), dtype=np.int64)
+    for i, (id1, id2) in enumerate(pairings):
+        doc = _grouping(edu_map[id1], edu_map[id2])
+        if doc not in doc_num:
+            doc_num[doc] = len(docs)
+            docs.append(doc)
+        row_docs[i] = doc_num[doc]
+    row_order = np.argsort(row_docs, kind='mergesort')
+    edu_docs = np.array([doc_num.get(e.grouping, len(docs))
+                         for e in edus], dtype=np.int64)
+    edu_order = np.argsort(edu_docs, kind='mergesort')
+    edu_rank = np.empty(len(edus), dtype=np.int64)
+    edu_rank[edu_order] = np.arange(len(edus))
+
+    data = data[row_order]
+    data.sort_indices()
+    idx_dtype = _index_dtype(max(data.nnz, data.shape[1]))
+    arrays = {'data': data.data,
+              'indices': data.indices.astype(idx_dtype),
+              'indptr': data.indptr.astype(idx_dtype),
+              'target': np.asarray(target)[row_order],
+              'pairings': np.array([[-1 if x == FAKE_ROOT_ID else
+                                     edu_rank[edu_idx[x]]
+                                     for x in pairings[i]]
+                                    for i in row_order],
+                                   dtype=np.int64).reshape(-1, 2)}
+    row_bounds = np.searchsorted(row_docs[row_order],
+                                 np.arange(len(docs) + 1))
+    edu_bounds = np.searchsorted(edu_docs[edu_order],
+                                 np.arange(len(docs) + 1))
+    for name in _ARRAYS:
+        np.save(_array_path(prefix, name), arrays[name])
+
+    sorted_edus = [edus[i] for i in edu_order]
+    meta = {'version': _FORMAT_VERSION,
+            'sources': sources,
+            'shape': list(data.shape),
+            'labels': labels,
+            'edus': [[e.id, e.text, e.start, e.end, e.grouping,
+                      e.subgrouping] for e in sorted_edus],
+            'docs': [[doc,
+                      int(row_bounds[i]), int(row_bounds[i + 1]),
+                      int(edu_bounds[i]), int(edu_bounds[i + 1])]
+                     for i, doc in enumerate(docs)]}
+    tmp_path = meta_path + '.tmp'
+    with open(tmp_path, 'w') as stream:
+        json.dump(meta, stream)
+    os.rename(tmp_path, meta_path)
+
+
+def ensure_packed(edu_file, pairings_file, feature_file, vocab_file):
+    """Save a packed version of the datapack unless there already is
+    an up to date one.
+
+    Returns
+    -------
+    packed : bool
+        True if we had to (re)pack the datapack
+    """
+    if is_packed(edu_file, pairings_file, feature_file):
+        return False
+    save_packed_multipack(edu_file, pairings_file, feature_file,
+                          vocab_file)
+    return True
+
+
+# ---------------------------------------------------------------------
+# loading
+# ---------------------------------------------------------------------
+
+
+def load_packed_multipack(feature_file, vocab_file, verbose=False):
+    """Load a multipack from its packed version, memory mapping the
+    arrays (read-only).
+
+    Each datapack's feature matrix and target are views into the
+    memory mapped arrays.
+
+    :rtype: Multipack
+    """
+    prefix = packed_prefix(feature_file)
+    meta = _read_meta(prefix)
+    with Torpor("Mapping packed datapack", quiet=not verbose):
+        vocab = load_vocab(vocab_file)
+        arrays = {name: np.load(_array_path(prefix, name), mmap_mode='r')
+                  for name in _ARRAYS}
+        labels = meta['labels']
+        n_features = meta['shape'][1]
+        edus = [EDU(*row) for row in meta['edus']]
+        mpack = {}
+        for doc, row_start, row_end, edu_start, edu_end in meta['docs']:
+            indptr = arrays['indptr'][row_start:row_end + 1]
+            nz_start, nz_end = int(indptr[0]), int(indptr[-1])
+            data = csr_matrix((arrays['data'][nz_start:nz_end],
+                               arrays['indices'][nz_start:nz_end],
+                               np.asarray(indptr) - indptr[0]),
+                              shape=(row_end - row_start, n_features),
+                              copy=False)
+            pairings = [tuple(FAKE_ROOT if x < 0 else edus[x]
+                              for x in pair)
+                        for pair in
+                        arrays['pairings'][row_start:row_end].tolist()]
+            mpack[doc] = DataPack.load(edus[edu_start:edu_end],
+                                       pairings,
+                                       data,
+                                       arrays['target'][row_start:row_end],
+                                       labels,
+                                       vocab)
+    return mpack
+
+
+def load_multipack(edu_file, pairings_file, feature_file, vocab_file,
+                   verbose=False):
+    """Drop-in replacement for `attelo.io.load_multipack` which uses
+    the packed version of the datapack if there is an up to date one,
+    and reads the text files otherwise.
+
+    :rtype: Multipack
+    """
+    if is_packed(edu_file, pairings_file, feature_file):
+        return load_packed_multipack(feature_file, vocab_file,
+                                     verbose=verbose)
+    return load_text_multipack(edu_file, pairings_file, feature_file,
+                               vocab_file, verbose=verbose)
+
+
+@contextmanager
+def use_packed(module, name='load_multipack'):
+    """Within this context, have the `load_multipack` used by the given
+    module (eg. `attelo.harness.evaluate`, which loads the datapacks
+    itself and offers no way to pass it a loader) prefer packed
+    datapacks, as ours does.
+
+    This relies on the module looking up that name when it loads its
+    data, so we warn if it has no such function or never called it
+    within the context (eg. because attelo moved things around), rather
+    than quietly leaving it to read the text files.
+    """
+    original = getattr(module, name, None)
+    if original is None:
+        print(('[packed] WARNING: {} has no {} to replace; it will not '
+               'use the packed datapacks').format(module.__name__, name),
+              file=sys.stderr)
+        yield
+        return
+    calls = []
+
+    def loader(*args, **kwargs):
+        "our `load_multipack`, noting that it was called"
+        calls.append(args)
+        return load_multipack(*args, **kwargs)
+
+    setattr(module, name, loader)
+    try:
+        yield
+    finally:
+        setattr(module, name, original)
+    if not calls:
+        print(('[packed] WARNING: {} did not call {}; it may have loaded '
+               'the datapacks some other way (without the packed '
+               'versions)').format(module.__name__, name),
+              file=sys.stderr)
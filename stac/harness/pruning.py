@@ -0,0 +1,289 @@
+"""Candidate pair pruning: filter out edges that are unlikely to be
+attachments before they reach the decoder.
+
+The number of candidate pairs grows quadratically with the number of
+EDUs in a document, so we offer a few cheap ways to cap it:
+
+* maximum distance (in EDUs) between the two ends of an edge,
+* maximum distance (in turns) between the two ends of an edge,
+* a first-pass threshold on attachment scores.
+
+Edges from the fake root are never pruned.
+"""
+# pylint: disable=too-few-public-methods
+
+from __future__ import print_function
+from collections import namedtuple
+import csv
+
+import numpy as np
+
+from attelo.harness.config import (Keyed)
+from attelo.parser import (Parser)
+from attelo.parser.pipeline import (Pipeline)
+from attelo.table import (FAKE_ROOT_ID, UNRELATED)
+
+from .turn_constraint import (turn_constraint_safe)
+
+
+class PruningSettings(namedtuple('PruningSettings',
+                                 ['max_edu_dist',
+                                  'max_turn_dist',
+                                  'min_score'])):
+    """
+    Which pairs to keep (any criterion set to None is not applied)
+
+    Parameters
+    ----------
+    max_edu_dist: int or None
+        Maximum distance (in EDUs, either direction) between the EDUs
+
+    max_turn_dist: int or None
+        Maximum distance (in turns, either direction) between the EDUs
+
+    min_score: float or None
+        Drop edges with an attachment score below this threshold
+        (only meaningful once attachment scores are available, ie.
+        after the attach step of a pipeline)
+    """
+    @classmethod
+    def make(cls, max_edu_dist=None, max_turn_dist=None, min_score=None):
+        "settings with the unspecified criteria switched off"
+        return cls(max_edu_dist=max_edu_dist,
+                   max_turn_dist=max_turn_dist,
+                   min_score=min_score)
+
+
+def _edu_positions(dpack, pairings):
+    """Document positions for each end of the pairings
+
+    Returns
+    -------
+    is_root: array of bool
+        True if the pair starts from the fake root
+
+    edu_pos: array of int, shape (n_pairs, 2)
+        Rank of each EDU in textual order
+
+    turn_pos: array of int, shape (n_pairs, 2)
+        Rank of the turn containing each EDU
+    """
+    edus = sorted((e for e in dpack.edus if e.id != FAKE_ROOT_ID),
+                  key=lambda e: e.span())
+    positions = {}
+    turn = -1
+    last_turn = None
+    for i, edu in enumerate(edus):
+        this_turn = (edu.grouping, edu.subgrouping)
+        if this_turn != last_turn:
+            turn += 1
+            last_turn = this_turn
+        positions[edu.id] = (i, turn)
+    # the root is placed nowhere in particular; we never prune it
+    root_pos = (0, 0)
+    ends = [(positions.get(edu1.id, root_pos), positions[edu2.id])
+            for edu1, edu2 in pairings]
+    is_root = np.array([edu1.id == FAKE_ROOT_ID for edu1, _ in pairings],
+                       dtype=bool)
+    edu_pos = np.array([(p1[0], p2[0]) for p1, p2 in ends], dtype=int)
+    turn_pos = np.array([(p1[1], p2[1]) for p1, p2 in ends], dtype=int)
+    return is_root, edu_pos, turn_pos
+
+
+def pruning_mask(dpack, settings, use_scores=True):
+    """Boolean mask over the datapack pairings: True for edges that
+    survive pruning.
+
+    Parameters
+    ----------
+    dpack : DataPack
+
+    settings : PruningSettings
+
+    use_scores : boolean
+        If False, ignore the score threshold (eg. if we only want to
+        know about the static criteria)
+    """
+    pairings = dpack.pairings
+    keep = np.ones(len(pairings), dtype=bool)
+    if not pairings:
+        return keep
+    if (settings.max_edu_dist is not None or
+            settings.max_turn_dist is not None):
+        is_root, edu_pos, turn_pos = _edu_positions(dpack, pairings)
+        static = np.ones(len(pairings), dtype=bool)
+        if settings.max_edu_dist is not None:
+            edu_dist = np.abs(edu_pos[:, 1] - edu_pos[:, 0])
+            static &= edu_dist <= settings.max_edu_dist
+        if settings.max_turn_dist is not None:
+            turn_dist = np.abs(turn_pos[:, 1] - turn_pos[:, 0])
+            static &= turn_dist <= settings.max_turn_dist
+        keep &= static | is_root
+    if use_scores and settings.min_score is not None:
+        if dpack.graph is None:
+            raise ValueError('Pruning on scores requires attachment '
+                             'scores (put the pruner after the attach '
+                             'step)')
+        is_root = np.array([edu1.id == FAKE_ROOT_ID
+                            for edu1, _ in pairings], dtype=bool)
+        keep &= (np.asarray(dpack.graph.attach) >= settings.min_score) |\
+            is_root
+    return keep
+
+
+def pruning_safe(dpack, settings):
+    """Get the indices of edges that survive pruning.
+
+    Parameters
+    ----------
+    dpack : DataPack
+
+    settings : PruningSettings
+
+    Returns
+    -------
+    res : array of int
+        Indices of selected edges
+    """
+    return np.flatnonzero(pruning_mask(dpack, settings))
+
+
+# pylint: disable=invalid-name
+class Pruner(Parser):
+    """Trivial parser that prunes candidate pairs; should be run right
+    before a decoder in a parsing pipeline (see `TC_Pruner`)
+    """
+    def __init__(self, settings):
+        self._settings = settings
+
+    def fit(self, dpacks, targets, nonfixed_pairs=None, cache=None):
+        return self
+
+    def transform(self, dpack, nonfixed_pairs=None):
+        return self.select(dpack, pruning_safe(dpack, self._settings))
+# pylint: enable=invalid-name
+
+
+def pruned_decoder(ksettings, kdecoder):
+    """pruned version of any decoder constructor
+
+    Parameters
+    ----------
+    ksettings : Keyed(PruningSettings)
+
+    kdecoder : Keyed(Decoder)
+    """
+    steps = [('prune', Pruner(ksettings.payload)),
+             ('decode', kdecoder.payload)]
+    return Keyed(key=ksettings.key + '-' + kdecoder.key,
+                 payload=Pipeline(steps=steps))
+
+
+# ---------------------------------------------------------------------
+# report
+# ---------------------------------------------------------------------
+
+PruningReportRow = namedtuple('PruningReportRow',
+                              ['key',
+                               'pairs_total',
+                               'pairs_kept',
+                               'gold_total',
+                               'gold_kept',
+                               'scores_ignored'])
+"""
+How a pruning setting fares on a multipack: how many pairs it keeps
+and how many gold (attached) edges survive.
+If `scores_ignored` is True, the score threshold was not applied
+(the report is computed on the gold data, without any model)
+"""
+
+
+def pruning_report(mpack, ksettings):
+    """Recall of gold edges vs. pairs kept for each pruning setting
+    (along with the no pruning and turn constraint baselines)
+
+    Parameters
+    ----------
+    mpack : Multipack
+
+    ksettings : [Keyed(PruningSettings)]
+
+    Returns
+    -------
+    rows : [PruningReportRow]
+    """
+    masks = [('none', lambda d: np.ones(len(d.pairings), dtype=bool),
+              False),
+             ('tc', lambda d: _idx_to_mask(d, turn_constraint_safe(d)),
+              False)]
+    masks.extend((k.key,
+                  _static_mask(k.payload),
+                  k.payload.min_score is not None)
+                 for k in ksettings)
+    rows = []
+    for key, get_mask, scores_ignored in masks:
+        pairs_total = pairs_kept = gold_total = gold_kept = 0
+        for dpack in mpack.values():
+            mask = get_mask(dpack)
+            gold = np.asarray(dpack.target) !=\
+                dpack.label_number(UNRELATED)
+            pairs_total += len(mask)
+            pairs_kept += int(mask.sum())
+            gold_total += int(gold.sum())
+            gold_kept += int((gold & mask).sum())
+        rows.append(PruningReportRow(key=key,
+                                     pairs_total=pairs_total,
+                                     pairs_kept=pairs_kept,
+                                     gold_total=gold_total,
+                                     gold_kept=gold_kept,
+                                     scores_ignored=scores_ignored))
+    return rows
+
+
+def _idx_to_mask(dpack, idxes):
+    "boolean mask from a list of selected indices"
+    mask = np.zeros(len(dpack.pairings), dtype=bool)
+    mask[idxes] = True
+    return mask
+
+
+def _static_mask(settings):
+    "mask function for the score-independent part of a pruning setting"
+    return lambda d: pruning_mask(d, settings, use_scores=False)
+
+
+def _ratio(num, den):
+    "num / den, or 0 if there is nothing to divide"
+    return float(num) / den if den else 0.
+
+
+def save_pruning_report(rows, path, digits=3):
+    """Write a pruning report as a tab-separated table
+
+    Parameters
+    ----------
+    rows : [PruningReportRow]
+
+    path : filepath
+
+    digits : int
+        Number of digits to display floats with
+    """
+    fmt = '{0:.%df}' % digits
+    with open(path, 'w') as stream:
+        writer = csv.writer(stream, dialect=csv.excel_tab)
+        writer.writerow(['pruning', 'pairs', 'kept', 'kept%',
+                         'gold', 'gold kept', 'gold recall', 'note'])
+        for row in rows:
+            note = 'score threshold not applied' if row.scores_ignored\
+                else ''
+            writer.writerow([row.key,
+                             row.pairs_total,
+                             row.pairs_kept,
+                             fmt.format(_ratio(row.pairs_kept,
+                                               row.pairs_total)),
+                             row.gold_total,
+                             row.gold_kept,
+                             fmt.format(_ratio(row.gold_kept,
+                                               row.gold_total)),
+                             note])
@@ -8,19 +8,101 @@ We rely on there being a feature 'same_speaker', one-hot-encoded as
 """
 # pylint: disable=too-few-public-methods
 
+from __future__ import print_function
+from collections import OrderedDict
+from os import path as fp
+import os
+import weakref
+
 import numpy as np
+from sklearn.datasets import load_svmlight_file
 
 from attelo.harness.config import (Keyed)
+from attelo.io import (load_edus, load_vocab)
 from attelo.parser import (Parser)
 from attelo.parser.pipeline import (Pipeline)
+from attelo.table import (FAKE_ROOT, FAKE_ROOT_ID)
 
 SAME_SPEAKER = 'same_speaker=True'
 'boolean feature for if two EDUs share a speaker'
 
+_CACHE_SIZE = 4096
+'maximum number of datapacks for which we remember the safe edges'
+
+_SAFE_CACHE = OrderedDict()
+"""Indices of turn constraint safe edges, keyed on the identity of
+the feature matrix of a datapack.
+
+We key on the feature matrix rather than on the datapack itself
+because it is shared by the copies that `selected` and `set_graph`
+would not touch (eg. the datapacks passed from one pipeline step to
+the next). Entries only hold a weak reference to the matrix, and go
+away with it, so the cache never keeps the features (and the
+multipack) alive. The pairings (a list, which cannot be weakly
+referenced) are checked by identity and length.
+"""
+
+_VOCAB_CACHE = {}
+'position of SAME_SPEAKER in vocabularies we have seen (keyed on id)'
+
+
+def _same_speaker_index(vocab):
+    """Position of the same speaker feature in the vocabulary,
+    remembered across calls so that we only do the linear search
+    once per vocabulary.
+    """
+    key = id(vocab)
+    entry = _VOCAB_CACHE.get(key)
+    if entry is None or entry[0] is not vocab:
+        entry = (vocab, vocab.index(SAME_SPEAKER))
+        _VOCAB_CACHE[key] = entry
+    return entry[1]
+
+
+def _turn_constraint_mask(pairings, data, spkr_idx):
+    """Boolean mask over the pairings: True for the edges that respect
+    the turn constraint
+
+    Parameters
+    ----------
+    pairings : list of (EDU, EDU)
+
+    data : sparse matrix
+        Features for each pairing (same order)
+
+    spkr_idx : int
+        Column of the same speaker feature
+    """
+    if not pairings:
+        return np.zeros(0, dtype=bool)
+    # lexicographic comparison of spans, as in `edu2.span() > edu1.span()`
+    spans = np.array([(edu1.start, edu1.end, edu2.start, edu2.end)
+                      for edu1, edu2 in pairings])
+    starts1, ends1, starts2, ends2 = spans.T
+    forwards = (starts2 > starts1) | ((starts2 == starts1) & (ends2 > ends1))
+    # single column extraction from the (CSR) feature matrix
+    same_spkr = data.getcol(spkr_idx).toarray().ravel() != 0
+    return forwards | same_spkr
+
+
+def _compute_turn_constraint_safe(dpack):
+    """Vectorised computation of `turn_constraint_safe`
+    (no caching)
+    """
+    spkr_idx = _same_speaker_index(dpack.vocab)
+    return np.flatnonzero(_turn_constraint_mask(dpack.pairings,
+                                                dpack.data,
+                                                spkr_idx))
+
 
 def turn_constraint_safe(dpack):
     """Get the indices of edges that respect the turn constraint.
 
+    Results are cached on the identity of the datapack pairings
+    and features, so asking again for the same datapack (or a
+    copy sharing the same data) is essentially free. The cache does
+    not keep the features alive.
+
     Parameters
     ----------
     dpack : DataPack
@@ -28,13 +110,47 @@ def turn_constraint_safe(dpack):
 
     Returns
     -------
-    res : list of int
-        Indices of selected edges.
+    res : array of int
+        Indices of selected edges, in increasing order.
+    """
+    key = id(dpack.data)
+    pairings_key = (id(dpack.pairings), len(dpack.pairings))
+    entry = _SAFE_CACHE.get(key)
+    if (entry is not None and
+            entry[0]() is dpack.data and
+            entry[1] == pairings_key):
+        # refresh position (least recently used goes first)
+        del _SAFE_CACHE[key]
+    else:
+        idxes = _compute_turn_constraint_safe(dpack)
+        idxes.setflags(write=False)
+        entry = (weakref.ref(dpack.data, _forget(key)), pairings_key,
+                 idxes)
+        _SAFE_CACHE.pop(key, None)
+        while len(_SAFE_CACHE) >= _CACHE_SIZE:
+            _SAFE_CACHE.popitem(last=False)
+    _SAFE_CACHE[key] = entry
+    return entry[2]
+
+
+def _forget(key):
+    """Callback for the weak reference of a cache entry: drop the
+    entry when its feature matrix goes away
     """
-    spkr_idx = dpack.vocab.index(SAME_SPEAKER)
-    return [i for i, (edu1, edu2) in enumerate(dpack.pairings)
-            if edu2.span() > edu1.span() or
-            dpack.data[i, spkr_idx]]
+    def forget(ref):
+        "drop the entry (unless it has been replaced since)"
+        entry = _SAFE_CACHE.get(key)
+        if entry is not None and entry[0] is ref:
+            del _SAFE_CACHE[key]
+    return forget
+
+
+def clear_turn_constraint_cache():
+    """Forget any cached turn constraint results (eg. to release
+    memory once a multipack is no longer needed)
+    """
+    _SAFE_CACHE.clear()
+    _VOCAB_CACHE.clear()
 
 
 def apply_turn_constraint(dpack, target):
@@ -60,6 +176,118 @@ def apply_turn_constraint(dpack, target):
     return dpack.selected(idxes), target[idxes]
 
 
+# ---------------------------------------------------------------------
+# pruning gathered pairs (before learning)
+# ---------------------------------------------------------------------
+
+PAIRINGS_MODES = ['all', 'tc']
+"""How candidate pairs are generated during feature extraction:
+
+* all: every pair of EDUs within a dialogue
+* tc: only pairs that respect the turn constraint
+"""
+
+_PAIRINGS_MODE_FILE = 'pairings-mode.txt'
+
+
+def pairings_mode_path(dirname):
+    "Path to the file recording the pairings mode of gathered features"
+    return fp.join(dirname, _PAIRINGS_MODE_FILE)
+
+
+def load_pairings_mode(dirname):
+    """Pairings mode recorded for the features in the given directory
+    (features gathered before we started recording it use all pairs)
+    """
+    fpath = pairings_mode_path(dirname)
+    if not fp.exists(fpath):
+        return 'all'
+    with open(fpath) as stream:
+        mode = stream.read().strip()
+    if mode not in PAIRINGS_MODES:
+        raise ValueError('Unknown pairings mode in {}: {}'.format(fpath,
+                                                                   mode))
+    return mode
+
+
+def save_pairings_mode(dirname, mode):
+    "Record the pairings mode for the features in the given directory"
+    if mode not in PAIRINGS_MODES:
+        raise ValueError('Unknown pairings mode: ' + mode)
+    with open(pairings_mode_path(dirname), 'w') as stream:
+        print(mode, file=stream)
+
+
+def _rewrite_lines(fpath, keep):
+    """Replace a file with only those of its lines for which `keep`
+    returns True (written to a temporary file first)
+    """
+    tmp_path = fpath + '.tmp'
+    with open(fpath) as istream:
+        with open(tmp_path, 'w') as ostream:
+            for line in istream:
+                if keep(line):
+                    ostream.write(line)
+    os.rename(tmp_path, fpath)
+
+
+def prune_gathered_pairs(paths):
+    """Restrict gathered pair features to the candidate pairs that
+    respect the turn constraint.
+
+    The `.pairings` and `.relations.sparse` files are rewritten in
+    place; the EDU inputs and vocabulary are left alone.
+
+    Parameters
+    ----------
+    paths : dict
+        Paths to the datapack files, as returned by `mpack_paths`
+        ('edu_input', 'pairings', 'features', 'vocab')
+
+    Returns
+    -------
+    kept : int
+        Number of pairs kept
+
+    total : int
+        Number of pairs before pruning
+    """
+    vocab = load_vocab(paths['vocab'])
+    edus = {edu.id: edu for edu in load_edus(paths['edu_input'])}
+    edus[FAKE_ROOT_ID] = FAKE_ROOT
+    with open(paths['pairings']) as stream:
+        pairings = [tuple(edus[x] for x in line.rstrip('\n').split('\t')[:2])
+                    for line in stream if line.strip()]
+    # same call as in load_multipack so that the columns line up
+    # pylint: disable=unbalanced-tuple-unpacking
+    data, _ = load_svmlight_file(paths['features'],
+                                 n_features=len(vocab))
+    # pylint: enable=unbalanced-tuple-unpacking
+    if data.shape[0] != len(pairings):
+        oops = ('Mismatch between the number of pairings ({}) and '
+                'feature vectors ({}) in {}').format(len(pairings),
+                                                     data.shape[0],
+                                                     paths['features'])
+        raise ValueError(oops)
+    mask = _turn_constraint_mask(pairings, data, vocab.index(SAME_SPEAKER))
+
+    def _keeper(is_row):
+        "line filter: rows are consumed in order, other lines kept"
+        rows = iter(mask)
+
+        def keep(line):
+            "True if we should keep this line"
+            return next(rows) if is_row(line) else True
+        return keep
+
+    _rewrite_lines(paths['pairings'],
+                   _keeper(lambda l: bool(l.strip())))
+    _rewrite_lines(paths['features'],
+                   _keeper(lambda l: bool(l.strip()) and
+                           not l.startswith('#')))
+    return int(mask.sum()), len(mask)
+
+
 # pylint: disable=invalid-name
 class TC_LearnerWrapper(object):
     """Placeholder to indicate we want to apply the turn constraint as a
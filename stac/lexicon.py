@@ -0,0 +1,144 @@
+# Author: Eric Kow
+# License: CeCILL-B (French BSD3-like)
+
+"""
+Compiled, cached version of the STAC lexicons (the `lexicon/` directory)
+
+Feature extraction reads the lexicons through educe: the class
+lexicons (`opinion.txt`, `stac_domain*.txt`, ...) that
+`educe.stac.learning.features.LEXICONS` knows about, and the PDTB
+marker list (`pdtb_markers.txt`). Parsing them again for every corpus
+(or every chunk of documents) we extract features from adds up, so we
+keep what educe makes of them in an index which we pickle to a cache
+file. The cache is ignored whenever the lexicon files change (we
+record a hash of their contents), and the index is also kept in memory
+for the rest of the process.
+"""
+
+from __future__ import print_function
+from argparse import Namespace
+from os import path as fp
+import hashlib
+import os
+import pickle
+
+import educe.stac.learning.features as stac_features
+
+_NOT_LEXICONS = ['00_Index.txt']
+
+_CACHE_VERSION = 1
+
+# pylint: disable=too-few-public-methods
+
+
+def lexicon_files(lex_dir):
+    "the lexicon files in a directory (sorted)"
+    return sorted(fp.join(lex_dir, f) for f in os.listdir(lex_dir)
+                  if (f.endswith('.txt') or f.endswith('.xml')) and
+                  f not in _NOT_LEXICONS)
+
+
+def lexicon_digest(lex_dir):
+    """Hash of the names and contents of the lexicon files (ignoring
+    anything else that may be lying around in the directory)
+    """
+    hasher = hashlib.sha1()
+    for path in lexicon_files(lex_dir):
+        hasher.update(fp.basename(path).encode('utf-8'))
+        with open(path, 'rb') as stream:
+            hasher.update(stream.read())
+    return hasher.hexdigest()
+
+
+class LexiconIndex(object):
+    """
+    The lexicons of a directory, as read by educe
+
+    Parameters
+    ----------
+    digest: string
+        `lexicon_digest` of the directory they were read from
+
+    states: [dict]
+        Attributes of each of `stac_features.LEXICONS` once they have
+        read the directory (in the same order)
+
+    pdtb_lex: dict
+        PDTB markers, as returned by `stac_features.read_pdtb_lexicon`
+    """
+    def __init__(self, digest, states, pdtb_lex):
+        self.digest = digest
+        self.states = states
+        self.pdtb_lex = pdtb_lex
+
+    @classmethod
+    def compile(cls, lex_dir, digest=None):
+        "read the lexicons of a directory"
+        states = []
+        for lex in stac_features.LEXICONS:
+            lex.read(lex_dir)
+            states.append(dict(vars(lex)))
+        pdtb_args = Namespace(resources=lex_dir)
+        pdtb_lex = stac_features.read_pdtb_lexicon(pdtb_args)
+        return cls(digest or lexicon_digest(lex_dir), states, pdtb_lex)
+
+    def lexicons(self):
+        """`stac_features.LEXICONS`, filled in from the index (as if
+        they had each read the lexicon directory)
+        """
+        for lex, state in zip(stac_features.LEXICONS, self.states):
+            vars(lex).update(state)
+        return stac_features.LEXICONS
+
+
+_LOADED = {}
+'indices we have already loaded in this process, by lexicon dir'
+
+
+def load_lexicon_index(lex_dir, cache_path=None):
+    """Compiled index for the lexicons in a directory.
+
+    If `cache_path` is given, we use the index saved there if it was
+    compiled from the same lexicons, or compile and save it there
+    otherwise (failing to save is not an error: the cache is just an
+    optimisation)
+
+    :rtype: LexiconIndex
+    """
+    digest = lexicon_digest(lex_dir)
+    index = _LOADED.get(fp.abspath(lex_dir))
+    if index is not None and index.digest == digest:
+        return index
+    index = None
+    if cache_path is not None and fp.exists(cache_path):
+        try:
+            with open(cache_path, 'rb') as stream:
+                version, cached = pickle.load(stream)
+            if (version == _CACHE_VERSION and cached.digest == digest and
+                    len(cached.states) == len(stac_features.LEXICONS)):
+                index = cached
+        except (IOError, EOFError, ValueError, AttributeError,
+                ImportError, pickle.UnpicklingError):
+            index = None
+    if index is None:
+        index = LexiconIndex.compile(lex_dir, digest=digest)
+        if cache_path is not None:
+            _save_index(index, cache_path)
+    _LOADED[fp.abspath(lex_dir)] = index
+    return index
+
+
+def _save_index(index, cache_path):
+    "pickle a lexicon index (atomically, quietly giving up on failure)"
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    try:
+        cache_dir = fp.dirname(cache_path)
+        if cache_dir and not fp.exists(cache_dir):
+            os.makedirs(cache_dir)
+        with open(tmp_path, 'wb') as stream:
+            pickle.dump((_CACHE_VERSION, index), stream,
+                        pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_path, cache_path)
+    except (IOError, OSError, TypeError, pickle.PicklingError):
+        if fp.exists(tmp_path):
+            os.remove(tmp_path)
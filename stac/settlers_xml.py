@@ -16,10 +16,14 @@ Places where this differs from the DTD (2014-11-26):
     * we have an unknown_status category of resources
     * we have a parent game fragment node for multiple events
 
+The same objects can also be converted to plain dictionaries/lists
+(`to_dict`), for clients that would rather get the information as
+JSON or msgpack than parse XML (see `dumps`).
 """
 
 from collections import namedtuple
 from enum import Enum
+import json
 
 from educe.stac.annotation import RENAMES
 import xml.etree.cElementTree as ET
@@ -34,6 +38,25 @@ def text_elem(name, text):
     return tmp
 
 
+def indent_xml(node, level=0, indent=" "):
+    """
+    Add whitespace to an element (in place) so that it comes out
+    pretty printed, as if it were nested `level` deep
+    """
+    prefix = "\n" + level * indent
+    if len(node):
+        if not node.text or not node.text.strip():
+            node.text = prefix + indent
+        for child in node:
+            indent_xml(child, level + 1, indent)
+        # pylint: disable=undefined-loop-variable
+        if not child.tail or not child.tail.strip():
+            child.tail = prefix
+        # pylint: enable=undefined-loop-variable
+    if level and (not node.tail or not node.tail.strip()):
+        node.tail = prefix
+
+
 class GameFragment(namedtuple('GameFragment',
                               ['events'])):
     """
@@ -46,6 +69,30 @@ class GameFragment(namedtuple('GameFragment',
             node.append(event.to_xml())
         return node
 
+    def write(self, stream, pretty=True, indent=" "):
+        """
+        Write the fragment as an XML document, one event at a time
+        (so the events can be a generator, and we never hold the whole
+        tree in memory)
+
+        If `pretty` is False, we skip the indentation (smaller and
+        faster, same document)
+        """
+        stream.write('<?xml version="1.0" ?>\n<game_fragment>')
+        for event in self.events:
+            node = event.to_xml()
+            if pretty:
+                indent_xml(node, level=1, indent=indent)
+                stream.write("\n" + indent)
+            node.tail = None
+            stream.write(ET.tostring(node))
+        stream.write("\n</game_fragment>\n" if pretty
+                     else "</game_fragment>\n")
+
+    def to_dict(self):
+        "to plain dictionary"
+        return {'events': [x.to_dict() for x in self.events]}
+
 
 class ChatMessage(namedtuple('ChatMessage',
                              ['identifier',
@@ -62,6 +109,11 @@ class ChatMessage(namedtuple('ChatMessage',
             payload.append(edu.to_xml())
         return node
 
+    def to_dict(self):
+        "to plain dictionary"
+        return {'event_id': self.identifier,
+                'chat_message': [x.to_dict() for x in self.edus]}
+
 
 class Edu(namedtuple('Edu',
                      ['identifier',
@@ -98,6 +150,28 @@ class Edu(namedtuple('Edu',
             ds_node.append(pair.to_xml())
         return node
 
+    def to_dict(self):
+        """
+        to plain dictionary; addressees are None if unknown,
+        "All" if addressed to everybody, or else a list of names
+        """
+        if self.addressees is None:
+            addressees = None
+        elif "All" in self.addressees:
+            addressees = "All"
+        else:
+            addressees = list(self.addressees)
+        return {'edu_id': self.identifier,
+                'start': self.span.char_start,
+                'end': self.span.char_end,
+                'speaker': self.speaker,
+                'addressees': addressees,
+                'text': self.text,
+                'surface_act': self.surface_act.name,
+                'dialogue_act': self.dialogue_act.to_dict(),
+                'discourse_structure': [x.to_dict()
+                                        for x in self.ds_pairs]}
+
 
 class DsPair(namedtuple('DsPair',
                         ['attachment_point',
@@ -114,6 +188,11 @@ class DsPair(namedtuple('DsPair',
         node.append(rel_node)
         return node
 
+    def to_dict(self):
+        "to plain dictionary"
+        return {'attachment_point': self.attachment_point,
+                'discourse_relation': self.discourse_relation.name}
+
 
 # pylint: disable=no-init
 # no-init ok because enumeration
@@ -177,6 +256,23 @@ class Resource(namedtuple('Resource',
                 status_node.append(cls.and_resources(sresources))
         return rnode
 
+    @classmethod
+    def multi_to_dict(cls, resources):
+        """
+        Plain dictionary for a resource pack (or None if no resources):
+        for each status, the list of resource types in the conjunction
+        (statuses without resources are left out)
+        """
+        if resources is None:
+            return None
+        res = {}
+        for rstatus in ResourceStatus:
+            sresources = [r.rtype.name for r in resources if
+                          r.status == rstatus]
+            if sresources:
+                res[rstatus.name] = sresources
+        return res
+
 
     @classmethod
     def and_resources(cls, resources):
@@ -189,13 +285,14 @@ class Resource(namedtuple('Resource',
         """
         if not resources:
             raise ValueError('must have non-empty list of resources')
-        elif len(resources) == 1:
-            return resources[0].to_xml()
-        else:
-            node = ET.Element('and_res')
-            node.append(resources[0].to_xml())
-            node.append(cls.and_resources(resources[1:]))
-            return node
+        # build right to left: and(r1, and(r2, ... and(rn-1, rn)))
+        node = resources[-1].to_xml()
+        for resource in reversed(resources[:-1]):
+            conj = ET.Element('and_res')
+            conj.append(resource.to_xml())
+            conj.append(node)
+            node = conj
+        return node
 
 
 class SurfaceAct(Enum):
@@ -288,6 +385,11 @@ class DialogueAct(object):
         # pylint: enable=no-member
         return node
 
+    def to_dict(self):
+        "to plain dictionary"
+        return {'type': self.da_type.name,
+                'resources': Resource.multi_to_dict(self.resources)}
+
     @classmethod
     def from_anno(cls, anno):
         """
@@ -350,3 +452,31 @@ RELATION_LABELS =\
      'Clarification_question': RelationLabel.clarification_q,
      'Background': RelationLabel.background}
 # pylint: enable=no-init
+
+
+# ---------------------------------------------------------------------
+# other formats
+# ---------------------------------------------------------------------
+
+FORMATS = ['xml', 'json', 'msgpack']
+"""Formats we can write a game fragment in (msgpack requires the
+msgpack package)"""
+
+
+def dumps(fragment, fmt, pretty=False):
+    """
+    Game fragment in one of the non-XML `FORMATS` ::
+
+        (GameFragment, String, Bool) -> String
+
+    If `pretty`, indent the JSON (no effect on msgpack)
+    """
+    if fmt == 'json':
+        return json.dumps(fragment.to_dict(),
+                          indent=1 if pretty else None,
+                          sort_keys=pretty)
+    elif fmt == 'msgpack':
+        import msgpack
+        return msgpack.packb(fragment.to_dict(), use_bin_type=True)
+    else:
+        raise ValueError('Unknown format: %s' % fmt)
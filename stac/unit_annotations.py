@@ -7,13 +7,14 @@
 Learn and predict dialogue acts from EDU feature vectors
 """
 
+from array import array
 from os import path as fp
 import argparse
 import copy
 import os
 
 import joblib
-from scipy.sparse import lil_matrix
+from scipy.sparse import csr_matrix
 from sklearn.datasets import load_svmlight_file
 from attelo.io import (load_labels,
                        load_vocab)
@@ -79,37 +80,78 @@ def get_edus_plus(inputs):
                 yield env, contexts, unit
 
 
+CHUNK_SIZE = 2000
+"""
+Approximate number of EDUs to featurise/predict at a time (we only
+cut between documents, so chunks can be a bit bigger than this)
+"""
+
+
+def _document_chunks(edus_plus, chunk_size):
+    """
+    Group the output of `get_edus_plus` into lists of roughly
+    `chunk_size` items, never splitting a document across chunks
+    """
+    chunk = []
+    last_env = None
+    for item in edus_plus:
+        env = item[0]
+        if env is not last_env and len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+        last_env = env
+        chunk.append(item)
+    if chunk:
+        yield chunk
+
+
 def extract_features(vocab, edus_plus):
     """
     Return a sparse matrix of features for all edus in the corpus
     """
-    matrix = lil_matrix((len(edus_plus), len(vocab)))
+    # accumulate coordinates and build the matrix in one go
+    rows = array('i')
+    cols = array('i')
+    vals = array('d')
+    num_rows = 0
     # this unfortunately duplicates stac_features.extract_single_features
     # but it's the price we pay to ensure we get the edus and vectors in
     # the same order
     for row, (env, _, edu) in enumerate(edus_plus):
         vec = stac_features.SingleEduKeys(env.inputs)
         vec.fill(env.current, edu)
+        # if a feature comes up twice, the last value wins
+        row_vals = {}
         for feat, val in vec.one_hot_values_gen():
             if feat in vocab:
-                matrix[row, vocab[feat]] = val
-    return matrix.tocsr()
-
-
-def annotate_edus(model, vocab, labels, inputs):
+                row_vals[vocab[feat]] = val
+        rows.extend([row] * len(row_vals))
+        cols.extend(row_vals.keys())
+        vals.extend(row_vals.values())
+        num_rows = row + 1
+    matrix = csr_matrix((vals, (rows, cols)),
+                        shape=(num_rows, len(vocab)))
+    matrix.eliminate_zeros()
+    return matrix
+
+
+def annotate_edus(model, vocab, labels, inputs, chunk_size=CHUNK_SIZE):
     """
     Annotate each EDU with its dialogue act and addressee
+
+    EDUs are processed a few documents at a time so that memory
+    stays bounded on large corpora
     """
-    edus_plus = list(get_edus_plus(inputs))
-    feats = extract_features(vocab, edus_plus)
-    predictions = model.predict(feats)
-    for (env, contexts, edu), da_num in zip(edus_plus, predictions):
-        da_label = labels[int(da_num) - 1]
-        addressees = guess_addressees_for_edu(contexts,
-                                              env.current.players,
-                                              edu)
-        set_addressees(edu, addressees)
-        edu.type = da_label
+    for edus_plus in _document_chunks(get_edus_plus(inputs), chunk_size):
+        feats = extract_features(vocab, edus_plus)
+        predictions = model.predict(feats)
+        for (env, contexts, edu), da_num in zip(edus_plus, predictions):
+            da_label = labels[int(da_num) - 1]
+            addressees = guess_addressees_for_edu(contexts,
+                                                  env.current.players,
+                                                  edu)
+            set_addressees(edu, addressees)
+            edu.type = da_label
 
 
 def command_annotate(args):